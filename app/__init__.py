@@ -36,6 +36,15 @@ def create_app(config_name):
     login_manager.init_app(app)
     pagedown.init_app(app)
 
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    from .sampler import sampler
+    sampler.init_app(app)
+
+    from . import tracing
+    tracing.init_app(app)
+
     if not app.debug and not app.testing and not app.config['SSL_DISABLE']:
         from flask_sslify import SSLify
         sslify = SSLify(app)
@@ -46,6 +55,9 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    from .api_1_0 import api as api_1_0_blueprint
+    app.register_blueprint(api_1_0_blueprint, url_prefix='/api/v1.0')
+
     # Tell browser not to cache any HTML responses, as most pages have
     # sensitive information in them. (But CSS should be cached as normal.)
     @app.after_request
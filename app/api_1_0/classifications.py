@@ -0,0 +1,44 @@
+from flask import jsonify, request, g
+from ..exceptions import ValidationError
+from ..models import Classified, Permission
+from ..codecache import code_cache
+from ..surveyqueue import classify_surveys
+from . import api
+from .decorators import permission_required
+
+
+@api.route('/classifications/', methods=['POST'])
+@permission_required(Permission.CLASSIFY)
+def new_classifications():
+    '''
+    Save one or more classifications, e.g.
+    {"classifications": [{"respondent_id": 1, "code_id": 2,
+    "project_code_id": 1, "pii": false}]}
+
+    Only surveys currently leased to the coder are saved. The response lists
+    the respondent_ids which were saved and those which were rejected.
+    '''
+    json_classifications = (request.json or {}).get('classifications')
+    if not isinstance(json_classifications, list) or \
+            len(json_classifications) == 0:
+        raise ValidationError('classifications must be a non-empty list')
+
+    classifications = [Classified.from_json(i) for i in json_classifications]
+
+    active = code_cache.get()
+    for i in classifications:
+        if i['code_id'] not in active.code_ids:
+            raise ValidationError('unknown code_id %s' % i['code_id'])
+        if i['project_code_id'] is not None and \
+                i['project_code_id'] not in active.project_code_ids:
+            raise ValidationError(
+                'unknown project_code_id %s' % i['project_code_id'])
+
+    saved = classify_surveys(g.current_user.id, classifications)
+    rejected = [i['respondent_id'] for i in classifications]
+    for respondent_id in saved:
+        rejected.remove(respondent_id)
+
+    response = jsonify({'saved': saved, 'rejected': rejected})
+    response.status_code = 201
+    return response
@@ -0,0 +1,11 @@
+from flask import jsonify
+from ..codecache import code_cache
+from . import api
+
+
+@api.route('/codes/')
+def get_codes():
+    active = code_cache.get()
+    return jsonify({
+        'codes': list(active.codes),
+        'project_codes': list(active.project_codes)})
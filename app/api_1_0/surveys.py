@@ -0,0 +1,29 @@
+from flask import jsonify, request, g, current_app
+from ..models import Raw, Permission
+from ..surveyqueue import claim_surveys
+from . import api
+from .decorators import permission_required
+
+
+@api.route('/surveys/next')
+@permission_required(Permission.CLASSIFY)
+def next_surveys():
+    '''
+    Lease the next surveys for the current coder. Clients can ask for
+    several at once (?count=K) so that the next survey is ready before the
+    coder has finished with the current one.
+    '''
+    count = request.args.get('count', 1, type=int)
+    count = max(1, min(count, current_app.config['FLASKY_API_MAX_SURVEYS']))
+
+    respondent_ids = claim_surveys(g.current_user.id, count=count)
+
+    # Fetch all of the surveys at once, then put them back into the order
+    # they were leased in
+
+    surveys = Raw.query.filter(Raw.respondent_id.in_(respondent_ids)).all() \
+        if respondent_ids else []
+    surveys = dict((survey.respondent_id, survey) for survey in surveys)
+
+    return jsonify({'surveys': [
+        surveys[i].to_json() for i in respondent_ids if i in surveys]})
@@ -0,0 +1,145 @@
+"""
+A JSON HTTP client for the external APIs the app reads from (the GOV.UK
+search API and the survey provider), shared by a pool of worker threads.
+
+Requests go through one pooled keep-alive session, are limited to an overall
+rate, time out, and are retried with exponential backoff (or as told by
+Retry-After) after a 429, a 5xx or a connection error.
+"""
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ApiError(Exception):
+    '''A request which failed, even after any retries'''
+    pass
+
+
+class RateLimiter(object):
+    '''
+    A thread safe token bucket allowing rate acquisitions per second on
+    average, with bursts of up to burst. A rate of 0 or None is unlimited.
+    '''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Block until a request may be made'''
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ApiClient(object):
+    '''
+    workers: number of requests in flight at once (and connections pooled)
+    rate: most requests per second across all workers (0 for no limit)
+    timeout: seconds to wait for each request
+    retries: times to retry a request after a 429, a 5xx or a connection
+    error
+    backoff: seconds to wait before the first retry, doubling each time
+    headers: sent with every request, e.g. for authentication
+    '''
+
+    def __init__(self, workers=8, rate=10, timeout=5, retries=4, backoff=0.5,
+                 max_backoff=30, headers=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(rate)
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _delay(self, attempt, response=None):
+        '''Seconds to wait before retrying after attempt number attempt'''
+        if response is not None:
+            try:
+                return min(float(response.headers['Retry-After']),
+                           self.max_backoff)
+            except (KeyError, ValueError):
+                pass
+
+        # Full jitter, so that workers which failed together do not all
+        # retry together
+
+        return random.uniform(
+            0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+    def get_json(self, url, params=None):
+        '''
+        GET url and return the decoded JSON body. Raises ApiError if the
+        request still fails after retrying, or gets a response (other than a
+        429) which is not worth retrying, such as a 404 or invalid JSON.
+        '''
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count('retried')
+            self.limiter.acquire()
+            self._count('requests')
+            response = None
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 429 or \
+                        response.status_code >= 500:
+                    error = 'HTTP %d' % response.status_code
+                elif response.status_code != 200:
+                    error = 'HTTP %d' % response.status_code
+                    break
+                else:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        error = e
+                        break
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+
+        self._count('failed')
+        raise ApiError('%s: %s' % (url, error))
+
+    def stats(self):
+        return {'requests': self.requests, 'retried': self.retried,
+                'failed': self.failed}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,71 @@
+"""
+Classify surveys which give coders nothing to read.
+
+A survey with none of the free text fields shown to coders filled in is
+coded 'none' (with project code 'none') by the 'automated' user as soon as
+it is loaded. The priority trigger then gives it priority 6, below the
+queue, so it is never offered to a coder.
+"""
+
+from . import db
+from .models import Raw, User, Codes, ProjectCodes
+
+EMPTY_FIELDS = [i for i in Raw.DISPLAY_FIELDS if i.startswith('comment_')]
+
+# Surveys which the automated user has already coded are left alone, so the
+# stage can be run any number of times over the same surveys.
+
+CODE_NONES = '''
+insert into classified (respondent_id, coder_id, code_id, project_code_id,
+    pii, date_coded)
+select raw.respondent_id, :coder_id, :code_id, :project_code_id, false, now()
+from raw
+where {empty}
+{only}
+and not exists (
+    select 1 from classified c
+    where c.coder_id = :coder_id
+    and c.respondent_id = raw.respondent_id)
+'''
+
+
+def automated_ids():
+    '''
+    Return the ids of the automated user and of the 'none' code and project
+    code, or None if any of them is missing.
+    '''
+    coder = User.query.filter_by(username='automated').first()
+    code = Codes.query.filter_by(code='none').first()
+    project_code = ProjectCodes.query.filter_by(project_code='none').first()
+    if coder is None or code is None or project_code is None:
+        return None
+    return dict(coder_id=coder.id, code_id=code.code_id,
+                project_code_id=project_code.project_code_id)
+
+
+def code_nones(respondent_ids=None, ids=None):
+    '''
+    Code the empty surveys among respondent_ids (or in the whole of raw, if
+    respondent_ids is None) as 'none', with a single insert. ids are the
+    ids returned by automated_ids(), which are looked up if not given. The
+    caller is responsible for committing.
+
+    Returns the number of surveys coded, which is 0 when there is no
+    automated user or 'none' code.
+    '''
+
+    if ids is None:
+        ids = automated_ids()
+    if ids is None:
+        return 0
+
+    params = dict(ids)
+    only = ''
+    if respondent_ids is not None:
+        params['respondent_ids'] = list(respondent_ids)
+        only = 'and raw.respondent_id = any(:respondent_ids)'
+
+    result = db.session.execute(CODE_NONES.format(
+        empty=' and '.join('raw.%s is null' % i for i in EMPTY_FIELDS),
+        only=only), params)
+    return result.rowcount
@@ -0,0 +1,118 @@
+"""
+Process wide cache of the active codes and project codes.
+
+The code lists change a few times a year, but are needed to build the form on
+every GET and POST of the classification page. They are loaded once, and
+reloaded when:
+
+* a Codes or ProjectCodes row is inserted, updated or deleted through the
+  ORM in this process (the cache version is bumped), or
+* the cached copy is older than FLASKY_CODE_CACHE_TTL seconds, which catches
+  changes made by other workers or directly in the database.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .models import Codes, ProjectCodes
+
+ActiveCodes = namedtuple('ActiveCodes', [
+    'version', 'loaded_at', 'codes', 'project_codes', 'code_choices',
+    'project_code_choices', 'code_ids', 'project_code_ids'])
+
+
+class CodeCache(object):
+    '''A versioned, thread safe cache of the active codes'''
+
+    def __init__(self):
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._active = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, active, ttl):
+        return active is not None and active.version == self.version and \
+            time.time() - active.loaded_at < ttl
+
+    def get(self):
+        '''Return the ActiveCodes, loading them if they are stale'''
+        ttl = current_app.config['FLASKY_CODE_CACHE_TTL']
+        active = self._active
+        if self._fresh(active, ttl):
+            self.hits += 1
+            return active
+        with self._lock:
+
+            # Another thread may have reloaded while we waited for the lock
+
+            active = self._active
+            if self._fresh(active, ttl):
+                self.hits += 1
+                return active
+            self.misses += 1
+            self._active = self._load(self.version)
+            return self._active
+
+    def _load(self, version):
+        codes = Codes.query.filter(Codes.end_date.is_(None)).all()
+        project_codes = ProjectCodes.query.filter(
+            ProjectCodes.end_date.is_(None)).all()
+
+        # Keep plain values only, so nothing in the cache is tied to the
+        # session that loaded it
+
+        return ActiveCodes(
+            version=version,
+            loaded_at=time.time(),
+            codes=tuple(i.to_json() for i in codes),
+            project_codes=tuple(i.to_json() for i in project_codes),
+            code_choices=[(i.code_id, i.code) for i in codes],
+            project_code_choices=[
+                (i.project_code_id, i.project_code) for i in project_codes],
+            code_ids=frozenset(i.code_id for i in codes),
+            project_code_ids=frozenset(
+                i.project_code_id for i in project_codes))
+
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': float(self.hits) / lookups if lookups else None}
+
+
+code_cache = CodeCache()
+
+
+def _code_changed(mapper, connection, target):
+    code_cache.invalidate()
+
+    # Invalidate again once the change is committed, in case another
+    # request reloads the old codes in the meantime
+
+    session = object_session(target)
+    if session is not None:
+        session.info['codes_changed'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('codes_changed', False):
+        code_cache.invalidate()
+
+
+for model in (Codes, ProjectCodes):
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _code_changed)
+
+event.listen(Session, 'after_commit', _after_commit)
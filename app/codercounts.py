@@ -0,0 +1,44 @@
+"""
+Maintain the coder_daily_counts table: the number of surveys each coder has
+classified on each day.
+
+The table is kept up to date by the trigger in sql/triggers/coder_counts.sql,
+so the running total shown to coders and the leaderboards do not need to
+count rows in the classified table.
+"""
+
+from datetime import date
+from . import db
+from .models import CoderDailyCounts
+from .priority import sql_file
+from .queryloader import query_loader
+
+
+def create_coder_count_triggers():
+    '''Create (or replace) the trigger which maintains coder_daily_counts'''
+    db.session.execute(query_loader(sql_file('triggers', 'coder_counts.sql')))
+    db.session.commit()
+
+
+def rebuild_coder_counts():
+    '''
+    Recalculate coder_daily_counts from classified.
+
+    Returns the number of rows in coder_daily_counts.
+    '''
+    db.session.execute(
+        query_loader(sql_file('rollups', 'rebuild_coder_counts.sql')))
+    db.session.commit()
+    return db.session.execute(
+        'select count(*) from coder_daily_counts').scalar()
+
+
+def coded_on(coder_id, day=None):
+    '''
+    Return the number of surveys a coder classified on a day (today by
+    default), with a single primary key lookup.
+    '''
+    n = db.session.query(CoderDailyCounts.n).filter(
+        CoderDailyCounts.coder_id == coder_id,
+        CoderDailyCounts.day == (day or date.today())).scalar()
+    return n or 0
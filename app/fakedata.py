@@ -0,0 +1,419 @@
+"""
+Generate fake data for development and load testing.
+
+Rows are built a column at a time with NumPy, by picking from small pools
+of values which are formatted for COPY once, and written with COPY (see
+app/bulk.py), so a million surveys take seconds rather than hours. Ids are
+chosen so that they cannot collide with rows already in the database, and
+every fake user shares one password hash.
+
+The priority and coder count triggers are switched off while rows are
+loaded, and the tables they maintain are rebuilt afterwards with a single
+set based query each (see app/priority.py and app/codercounts.py).
+
+Pass the same seed to get the same data again.
+"""
+
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from werkzeug.security import generate_password_hash
+from . import db
+from .bulk import copy_columns, copy_escape
+from .codercounts import rebuild_coder_counts
+from .priority import rebuild_priority
+
+LOREM = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+    'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum '
+    'eu fugiat nulla pariatur excepteur sint occaecat cupidatat non proident '
+    'sunt culpa qui officia deserunt mollit anim id est laborum').split()
+
+FALLBACK_URLS = ['/', '/vehicle-tax', '/renew-adult-passport',
+                 '/government/organisations/hm-revenue-customs']
+
+CATEGORIES = {
+    'cat_work_or_personal': ['Work', 'Personal'],
+    'cat_found_looking_for': ['Yes', 'No', 'Not sure / Partially'],
+    'cat_satisfaction': [
+        'Very satisfied', 'Satisfied', 'Neither satisfied or dissatisfied',
+        'Dissatisfied', 'Very dissatisfied'],
+    'cat_anywhere_else_help': ['Yes', 'No'],
+    }
+
+# The comments shown to coders, which are all left empty for a share of the
+# surveys, like the surveys which are coded automatically
+
+DISPLAY_COMMENTS = [
+    'comment_why_you_came', 'comment_where_for_help',
+    'comment_further_comments']
+OTHER_COMMENTS = [
+    'comment_what_work', 'comment_other_found_what',
+    'comment_other_where_for_help', 'comment_other_else_help']
+
+COPY_BATCH_SIZE = 100000
+
+NULL = copy_escape(None)
+
+
+def random_state(seed=None):
+    '''A NumPy RandomState, seeded if seed is given'''
+    return np.random.RandomState(seed)
+
+
+def sentences(rng, count, words=(3, 15), max_sentences=3):
+    '''A pool of count lorem ipsum comments'''
+    vocabulary = np.array(LOREM)
+    pool = []
+    for i in range(count):
+        parts = []
+        for j in range(rng.randint(1, max_sentences + 1)):
+            chosen = vocabulary[rng.randint(0, len(vocabulary),
+                                            rng.randint(*words))]
+            parts.append(' '.join(chosen).capitalize() + '.')
+        pool.append(' '.join(parts))
+    return pool
+
+
+def pick(rng, choices, count):
+    '''
+    count values chosen at random from choices, formatted for COPY (see
+    app.bulk.copy_escape)
+    '''
+    pool = np.array([copy_escape(i) for i in choices], dtype=object)
+    return pool[rng.randint(0, len(pool), count)]
+
+
+def random_dates(rng, count, days=365, now=None):
+    '''count datetime64 values spread over the last days days'''
+    now = np.datetime64(now or datetime.utcnow(), 's')
+    offsets = rng.randint(0, days * 86400, count).astype('timedelta64[s]')
+    return now - offsets
+
+
+def as_text(dates):
+    '''datetime64 values as text which Postgres understands'''
+    return np.datetime_as_string(dates, unit='s')
+
+
+def user_triggers(table):
+    '''The names of the triggers (other than constraints) on a table'''
+    result = db.session.execute(
+        'select tgname from pg_trigger '
+        'where tgrelid = cast(:table as regclass) and not tgisinternal',
+        {'table': table})
+    return [row.tgname for row in result]
+
+
+@contextmanager
+def triggers_disabled(table):
+    '''
+    Switch off the triggers on a table until the block ends, yielding the
+    names of those that were switched off.
+    '''
+    triggers = user_triggers(table)
+    if triggers:
+        db.session.execute('alter table %s disable trigger user' % table)
+    try:
+        yield triggers
+    finally:
+        if triggers:
+            db.session.execute('alter table %s enable trigger user' % table)
+
+
+def copy_arrays(table, arrays):
+    '''
+    COPY a dict of equal length arrays of values, already formatted for
+    COPY, into table in batches. Returns the number of rows copied.
+    '''
+    names = sorted(arrays)
+    count = 0
+    for start in range(0, len(arrays[names[0]]), COPY_BATCH_SIZE):
+        count += copy_columns(table, OrderedDict(
+            (name, arrays[name][start:start + COPY_BATCH_SIZE].tolist())
+            for name in names))
+    return count
+
+
+def rebuild(triggers):
+    '''Rebuild the tables maintained by the triggers that were switched off'''
+    if any(i.startswith('survey_priority') for i in triggers):
+        rebuild_priority()
+    if 'coder_daily_counts_change' in triggers:
+        rebuild_coder_counts()
+
+
+def fake_surveys(count, seed=None, urls_file='govukurls.txt', empty=0.05,
+                 days=365):
+    '''
+    Add count fake surveys to raw, with respondent_ids above any already
+    there. A share (empty) of them have none of the comments shown to coders
+    filled in. Returns the number of surveys added.
+    '''
+
+    rng = random_state(seed)
+    try:
+        with open(urls_file) as f:
+            urls = [i for i in f.read().splitlines() if i]
+    except IOError:
+        urls = FALLBACK_URLS
+
+    # Increasing ids with random gaps, starting after the highest one in raw,
+    # can never collide
+
+    start = db.session.execute(
+        'select coalesce(max(respondent_id), 10000000) from raw').scalar()
+    columns = {'respondent_id': (
+        start + np.cumsum(rng.randint(1, 5, count))).astype(str)}
+
+    start_dates = random_dates(rng, count, days)
+    columns['start_date'] = as_text(start_dates)
+    columns['end_date'] = as_text(
+        start_dates + rng.randint(60, 1800, count).astype('timedelta64[s]'))
+    columns['collector_id'] = np.repeat('999999', count)
+    columns['full_url'] = pick(rng, urls, count)
+    for column, choices in CATEGORIES.items():
+        columns[column] = pick(rng, choices, count)
+
+    pool = sentences(rng, min(count, 1000))
+    blank = rng.random_sample(count) < empty
+    for column in DISPLAY_COMMENTS + OTHER_COMMENTS:
+        values = pick(rng, pool, count)
+        if column in DISPLAY_COMMENTS:
+            values[blank] = NULL
+        else:
+            values[rng.random_sample(count) < 0.5] = NULL
+        columns[column] = values
+
+    with triggers_disabled('raw') as triggers:
+        added = copy_arrays('raw', columns)
+    db.session.commit()
+    rebuild(triggers)
+    return added
+
+
+@lru_cache()
+def password_hash(password):
+    '''Hash a password once, however many fake users have it'''
+    return generate_password_hash(password)
+
+
+def fake_users(count, seed=None, password='password'):
+    '''
+    Add count confirmed fake users, who all have the same password.
+    Returns the number of users added.
+    '''
+
+    rng = random_state(seed)
+    role_id = db.session.execute(
+        'select id from roles where "default"').scalar()
+    emails, usernames = set(), set()
+    for row in db.session.execute('select email, username from users'):
+        emails.add(row.email)
+        usernames.add(row.username)
+    joined = as_text(random_dates(rng, count, days=730))
+
+    rows = []
+    n = db.session.execute('select coalesce(max(id), 0) from users').scalar()
+    while len(rows) < count:
+        n += 1
+        email, username = 'coder%d@example.com' % n, 'coder%d' % n
+        if email in emails or username in usernames:
+            continue
+        rows.append(dict(
+            email=email, username=username, role_id=role_id,
+            password_hash=password_hash(password), confirmed=True,
+            member_since=joined[len(rows)], last_seen=datetime.utcnow(),
+            avatar_hash=hashlib.md5(email.encode('utf-8')).hexdigest()))
+
+    if rows:
+        from .models import User
+        db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def fake_codes(model, name, count, seed=None):
+    '''
+    Add a 'none' code (unless there is one already) and count fake codes to
+    Codes or ProjectCodes, about half of them retired. name is the column
+    holding the code. Returns the number of codes added.
+    '''
+
+    rng = random_state(seed)
+    table = model.__table__
+    now = datetime.utcnow()
+    rows = []
+    if not db.session.query(model).filter(
+            table.c[name] == 'none').count():
+        rows.append({name: 'none', 'description': 'none',
+                     'start_date': now, 'end_date': None})
+
+    words = np.array(LOREM)
+    descriptions = sentences(rng, count, max_sentences=1)
+    starts = as_text(random_dates(rng, count))
+    retired = rng.random_sample(count) < 0.5
+    for i in range(count):
+        rows.append({
+            name: ' '.join(words[rng.randint(0, len(words), 2)]),
+            'description': descriptions[i],
+            'start_date': starts[i],
+            'end_date': now if retired[i] else None})
+
+    db.session.execute(table.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def ids(query):
+    return np.array([row[0] for row in db.session.execute(query)])
+
+
+def active_codes():
+    codes = ids('select code_id from codes where end_date is null')
+    project_codes = ids(
+        'select project_code_id from project_codes where end_date is null')
+    return codes, project_codes
+
+
+def copy_classified(rng, respondent_ids, coder_ids, code_ids, project_codes,
+                    pii, days):
+    '''
+    COPY classifications into classified, with random project codes, pii
+    flags and dates, and rebuild the tables maintained by its triggers.
+    '''
+    count = len(respondent_ids)
+    columns = {
+        'respondent_id': respondent_ids.astype(str),
+        'coder_id': coder_ids.astype(str),
+        'code_id': code_ids.astype(str),
+        'project_code_id': pick(rng, project_codes, count)
+        if len(project_codes) else np.repeat(NULL, count),
+        'pii': np.where(rng.random_sample(count) < pii, 't', 'f'),
+        'date_coded': as_text(random_dates(rng, count, days))}
+
+    with triggers_disabled('classified') as triggers:
+        added = copy_arrays('classified', columns)
+    db.session.commit()
+    rebuild(triggers)
+    return added
+
+
+def fake_classified(count, user_count=1, seed=None, pii=0.001, days=30):
+    '''
+    Add up to count fake classifications by user_count randomly chosen
+    users. Surveys are drawn from the queue (priority below 6), or from the
+    whole of raw if survey_priority is empty, and no user codes the same
+    survey twice in one call. Returns the number of classifications added.
+    '''
+
+    rng = random_state(seed)
+    coders = ids('select id from users order by id')
+    codes, project_codes = active_codes()
+    surveys = ids(
+        'select respondent_id from survey_priority where priority < 6')
+    if not len(surveys):
+        surveys = ids('select respondent_id from raw')
+
+    if not (len(coders) and len(codes) and len(surveys)):
+        print('Classified needs users, codes and surveys. Try running '
+              'User.generate_fake(), Codes.generate_fake() and '
+              'Raw.generate_fake() first.')
+        return 0
+
+    coders = rng.choice(coders, min(user_count, len(coders)), replace=False)
+    respondent_ids = surveys[rng.randint(0, len(surveys), count)]
+    coder_ids = coders[rng.randint(0, len(coders), count)]
+
+    # Drop repeated (survey, coder) pairs
+
+    key = respondent_ids.astype(np.int64) * (int(coders.max()) + 1) + \
+        coder_ids
+    unique = np.sort(np.unique(key, return_index=True)[1])
+
+    return copy_classified(
+        rng, respondent_ids[unique], coder_ids[unique],
+        codes[rng.randint(0, len(codes), len(unique))], project_codes, pii,
+        days)
+
+
+# The share of surveys with no votes, one vote, two votes and so on
+
+VOTES = [0.35, 0.3, 0.15, 0.1, 0.05, 0.05]
+
+
+def fake_votes(votes=VOTES, agreement=0.7, seed=None, pii=0.001, days=30):
+    '''
+    Classify every survey in raw as if by a team of coders: the number of
+    votes for each survey is drawn from votes (the share of surveys with
+    0, 1, 2... votes), each vote is by a different user, and each user
+    applies the survey's hidden 'true' code with the chance agreement (or a
+    code at random otherwise). The automated user never votes.
+    Returns the number of classifications added.
+    '''
+
+    rng = random_state(seed)
+    coders = ids(
+        "select id from users where username is distinct from 'automated' "
+        "order by id")
+    codes, project_codes = active_codes()
+    surveys = ids('select respondent_id from raw order by respondent_id')
+    if not (len(coders) and len(codes) and len(surveys)):
+        print('Votes need users, codes and surveys. Try running '
+              'python manage.py populate first.')
+        return 0
+
+    n_votes = np.minimum(
+        rng.choice(len(votes), len(surveys), p=votes), len(coders))
+    respondent_ids = np.repeat(surveys, n_votes)
+    total = len(respondent_ids)
+
+    # Each survey's voters are consecutive users from a random starting
+    # point, so no user votes twice on a survey
+
+    first = np.repeat(rng.randint(0, len(coders), len(surveys)), n_votes)
+    position = np.arange(total) - np.repeat(
+        np.cumsum(n_votes) - n_votes, n_votes)
+    coder_ids = coders[(first + position) % len(coders)]
+
+    true_codes = np.repeat(rng.randint(0, len(codes), len(surveys)), n_votes)
+    chosen = np.where(rng.random_sample(total) < agreement, true_codes,
+                      rng.randint(0, len(codes), total))
+
+    return copy_classified(rng, respondent_ids, coder_ids, codes[chosen],
+                           project_codes, pii, days)
+
+
+RESET = '''
+truncate raw, classified, survey_codes, survey_priority, survey_leases,
+    coder_daily_counts, screened_surveys, codes, project_codes cascade
+'''
+
+
+def fake_dataset(count, seed=None, coders=50):
+    '''
+    Replace all surveys, classifications and codes with a dataset of count
+    surveys, voted on as in fake_votes() by at least coders users, and
+    analyze the tables. Users already in the database are kept.
+    Returns the number of classifications added.
+    '''
+
+    from .models import Codes, ProjectCodes, Role
+    db.session.execute(RESET)
+    db.session.commit()
+    Role.insert_roles()
+    fake_codes(Codes, 'code', 20, seed)
+    fake_codes(ProjectCodes, 'project_code', 5, seed)
+    existing = db.session.execute('select count(*) from users').scalar()
+    if existing < coders:
+        fake_users(coders - existing, seed)
+    fake_surveys(count, seed)
+    votes = fake_votes(seed=seed)
+    db.session.execute('analyze')
+    db.session.commit()
+    return votes
@@ -0,0 +1,274 @@
+"""
+Load survey exports from the survey software into raw.
+
+Exports are CSV files, optionally gzipped, with one survey per row. They are
+read a batch at a time, checked and converted in Python, loaded into a
+temporary staging table with COPY, and merged into raw with
+INSERT ... ON CONFLICT (respondent_id), so loading the same export twice
+does no harm and corrected surveys replace the originals.
+"""
+
+import csv
+import gzip
+import re
+from datetime import datetime
+from flask import current_app
+from . import db
+from .bulk import copy_rows, batches
+from .autocode import automated_ids, code_nones
+from .models import Raw
+from .piiscreen import PiiScreen
+
+RAW_COLUMNS = [column.name for column in Raw.__table__.columns]
+
+# Column headings used by the survey software, mapped onto the raw table.
+# Headings are matched ignoring case, punctuation and spacing, and the raw
+# column names themselves are always accepted.
+
+PROVIDER_COLUMNS = {
+    'respondentid': 'respondent_id',
+    'collectorid': 'collector_id',
+    'startdate': 'start_date',
+    'enddate': 'end_date',
+    'fullurl': 'full_url',
+    'areyouusinggovukforprofessionalorpersonalreasons':
+        'cat_work_or_personal',
+    'whatkindofworkdoyoudo': 'comment_what_work',
+    'describewhyyoucametogovuktoday': 'comment_why_you_came',
+    'haveyoufoundwhatyouwerelookingfor': 'cat_found_looking_for',
+    'pleasetellusmoreaboutwhatyouwerelookingfor':
+        'comment_other_found_what',
+    'overallhowdidyoufeelaboutyourvisittogovuktoday': 'cat_satisfaction',
+    'haveyoubeenanywhereelseforhelpwiththisalready':
+        'cat_anywhere_else_help',
+    'wheredidyougoforhelp': 'comment_where_for_help',
+    'otherwheredidyougoforhelp': 'comment_other_where_for_help',
+    'otheranywhereelseforhelp': 'comment_other_else_help',
+    'ifyouwishtocommentfurtherpleasedosohere': 'comment_further_comments',
+}
+
+DATE_FORMATS = [
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%m/%d/%Y %I:%M:%S %p']
+
+# Survey questions carry a warning about personal information, which some
+# exports include in the heading
+
+HEADING_NOISE = re.compile(
+    r'please do not include personal or financial information.*$',
+    re.IGNORECASE)
+
+
+def normalise_heading(heading):
+    return re.sub(r'[^a-z0-9]', '', HEADING_NOISE.sub('', heading).lower())
+
+
+def map_columns(header):
+    '''
+    Work out which raw column each column of an export goes in.
+
+    Returns a list of (index, raw column) pairs. Raises ValueError if there
+    is no respondent_id column.
+    '''
+
+    known = dict(PROVIDER_COLUMNS)
+    known.update((normalise_heading(i), i) for i in RAW_COLUMNS)
+
+    mapping = []
+    for index, heading in enumerate(header):
+        column = known.get(normalise_heading(heading))
+        if column is not None and column not in [c for i, c in mapping]:
+            mapping.append((index, column))
+
+    if 'respondent_id' not in [column for index, column in mapping]:
+        raise ValueError('The export has no respondent_id column')
+    return mapping
+
+
+class RowConverter(object):
+    '''
+    Convert rows of an export into tuples of raw column values, raising
+    ValueError for rows which cannot be loaded.
+    '''
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.columns = [column for index, column in mapping]
+        self.date_format = DATE_FORMATS[0]
+        self.converters = []
+        for index, column in mapping:
+            type_ = Raw.__table__.columns[column].type
+            if column == 'respondent_id':
+                self.converters.append(self.to_int)
+            elif isinstance(type_, db.DateTime):
+                self.converters.append(self.to_datetime)
+            else:
+                self.converters.append(
+                    self.to_string(column, getattr(type_, 'length', None)))
+
+    @staticmethod
+    def to_int(value):
+        value = int(value)
+        if value <= 0:
+            raise ValueError('%d is not a valid respondent_id' % value)
+        return value
+
+    def to_datetime(self, value):
+        if not value:
+            return None
+
+        # Exports use one format throughout, so try the last one that worked
+        # first
+
+        for date_format in [self.date_format] + DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            self.date_format = date_format
+            return parsed
+        raise ValueError('%r is not a date' % value)
+
+    @staticmethod
+    def to_string(column, length):
+        def convert(value):
+            if length is not None and len(value) > length:
+                raise ValueError('%s is longer than %d characters' % (
+                    column, length))
+            return value or None
+        return convert
+
+    def __call__(self, row):
+        return tuple(
+            convert(row[index].strip() if index < len(row) else '')
+            for (index, column), convert in zip(self.mapping, self.converters))
+
+    def respondent_ids(self, rows):
+        '''The distinct respondent_ids of converted rows'''
+        index = self.columns.index('respondent_id')
+        return set(row[index] for row in rows)
+
+    def rows(self, numbered_rows, totals):
+        '''
+        Convert (line, row) pairs into rows for merge_rows(), counting any
+        which are rejected in totals['rejected'] and keeping the first few
+        reasons in totals['errors'].
+        '''
+        rows = []
+        for line, row in numbered_rows:
+            try:
+                rows.append(self(row) + (line,))
+            except (ValueError, IndexError) as e:
+                totals['rejected'] += 1
+                if len(totals['errors']) < 10:
+                    totals['errors'].append('line %d: %s' % (line, e))
+        return rows
+
+
+def open_export(path):
+    '''Open a CSV export for reading, whether it is gzipped or not'''
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    if gzipped:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+MERGE = '''
+with merged as (
+    insert into raw ({columns})
+    select distinct on (respondent_id) {columns}
+    from raw_staging
+    order by respondent_id, line desc
+    on conflict (respondent_id) do update
+    set {updates}
+    where ({raw_columns}) is distinct from ({excluded_columns})
+    returning (xmax = 0) as inserted
+)
+select count(*) filter (where inserted) as inserted,
+    count(*) filter (where not inserted) as updated
+from merged
+'''
+
+
+def merge_rows(columns, rows):
+    '''
+    Merge rows into raw through a staging table. rows are tuples of values
+    in the order of columns, followed by a line number: a survey which
+    appears more than once is loaded from the row with the highest line
+    number. The caller is responsible for committing.
+
+    Returns a dict counting the surveys inserted, updated (changed surveys
+    which were already in raw) and unchanged.
+    '''
+
+    # The staging table is created afresh in each transaction, and dropped
+    # when it commits
+
+    db.session.execute(
+        'create temporary table raw_staging '
+        '(like raw, line bigint) on commit drop')
+    copy_rows('raw_staging', columns + ['line'], rows)
+
+    result = db.session.execute(MERGE.format(
+        columns=', '.join(columns),
+        updates=', '.join('%s = excluded.%s' % (i, i) for i in columns),
+        raw_columns=', '.join('raw.%s' % i for i in columns),
+        excluded_columns=', '.join('excluded.%s' % i for i in columns))
+        ).first()
+    staged = db.session.execute(
+        'select count(distinct respondent_id) from raw_staging').scalar()
+
+    return dict(inserted=result.inserted, updated=result.updated,
+                unchanged=staged - result.inserted - result.updated)
+
+
+def ingest(path, batch_size=None, progress=None):
+    '''
+    Load a survey export into raw.
+
+    Rows are merged into raw batch_size (FLASKY_INGEST_BATCH_SIZE by default)
+    at a time, each batch in its own transaction. A survey which appears more
+    than once in a batch is loaded from its last row. Rows which cannot be
+    loaded (no valid respondent_id, unreadable dates, or values too long for
+    raw) are counted as rejected and the rest of the export is loaded.
+
+    progress, if given, is called with the running totals after each batch.
+
+    The comments of every survey loaded are screened for personal
+    information (see app/piiscreen.py), and surveys with no free text are
+    coded 'none' (see app/autocode.py), in the same transaction.
+
+    Returns a dict counting the rows read, inserted, updated (changed
+    surveys which were already in raw), unchanged, rejected, found to
+    contain pii and coded automatically, along with the first few reasons
+    for rejecting rows.
+    '''
+
+    if batch_size is None:
+        batch_size = current_app.config['FLASKY_INGEST_BATCH_SIZE']
+
+    totals = dict(rows=0, inserted=0, updated=0, unchanged=0, rejected=0,
+                  pii=0, automated=0, errors=[])
+    ids = automated_ids()
+
+    with open_export(path) as f, \
+            PiiScreen.from_config(current_app.config) as screen:
+        reader = csv.reader(f)
+        convert = RowConverter(map_columns(next(reader)))
+
+        for batch in batches(enumerate(reader, start=2), batch_size):
+            rows = convert.rows(batch, totals)
+            if rows:
+                for key, value in merge_rows(convert.columns, rows).items():
+                    totals[key] += value
+                totals['pii'] += screen.save(convert.columns, rows)
+                totals['automated'] += code_nones(
+                    convert.respondent_ids(rows), ids)
+                db.session.commit()
+
+            totals['rows'] += len(batch)
+            if progress is not None:
+                progress(totals)
+
+    return totals
@@ -0,0 +1,70 @@
+"""
+Look up many GOV.UK pages on the search API at once.
+
+get_org() in app/urllookup.py makes one blocking request per page, opening a
+new connection each time, and gives up on the first error. LookupEngine runs
+the lookups on a bounded pool of threads sharing an ApiClient (see
+app/apiclient.py), which pools keep-alive connections, limits the overall
+request rate, backs off on 429 and 5xx responses and connection errors, and
+times out each request. Each page gets the same nine field record as
+get_org(): five organisations then four mainstream browse pages, with
+'null' for anything missing or for pages which could not be looked up.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .apiclient import ApiClient, ApiError
+from .urllookup import GOVUK_URL, SEARCH_FIELDS, org_sect
+
+NULL_RECORD = ['null'] * 9
+
+
+class LookupEngine(ApiClient):
+    '''
+    Look up pages on the GOV.UK search API concurrently. Takes the same
+    arguments as ApiClient, and the base_url of the API.
+    '''
+
+    def __init__(self, base_url=GOVUK_URL, **kwargs):
+        super(LookupEngine, self).__init__(**kwargs)
+        self.url = base_url.rstrip('/') + '/api/search.json'
+        self.failed_pages = set()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        '''Create an engine from the FLASKY_LOOKUP_* settings of an app'''
+        settings = dict(
+            base_url=config['GOVUK_URL'],
+            workers=config['FLASKY_LOOKUP_WORKERS'],
+            rate=config['FLASKY_LOOKUP_RATE'],
+            timeout=config['FLASKY_LOOKUP_TIMEOUT'],
+            retries=config['FLASKY_LOOKUP_RETRIES'])
+        settings.update(kwargs)
+        return cls(**settings)
+
+    def lookup(self, page):
+        '''
+        Look up a single page, returning a nine field record. Pages which
+        could not be looked up (as opposed to pages the API knows nothing
+        about) are added to failed_pages.
+        '''
+        params = [('filter_link[]', page)] + \
+            [('fields', field) for field in SEARCH_FIELDS]
+        try:
+            return org_sect(self.get_json(self.url, params))
+        except ApiError:
+            with self._lock:
+                self.failed_pages.add(page)
+            return list(NULL_RECORD)
+
+    def lookup_many(self, pages):
+        '''
+        Look up a list or iterator of pages.
+
+        Returns a dict of page: nine field record. Each distinct page is
+        looked up once.
+        '''
+        unique_pages = list(OrderedDict.fromkeys(pages))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            records = executor.map(self.lookup, unique_pages)
+            return dict(zip(unique_pages, records))
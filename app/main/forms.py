@@ -1,9 +1,16 @@
+from flask import current_app
+from flask_login import current_user
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, BooleanField, SelectField, SubmitField, RadioField
-from wtforms.validators import DataRequired, Length, Email, Regexp, InputRequired
+from itsdangerous import BadSignature, \
+    TimedJSONWebSignatureSerializer as Serializer
+from wtforms import StringField, TextAreaField, BooleanField, SelectField, SubmitField, RadioField, \
+    HiddenField, FieldList, FormField, Form, IntegerField
+from wtforms.validators import DataRequired, Length, Email, Regexp, InputRequired, \
+    NumberRange
 from wtforms import ValidationError
 from flask_pagedown.fields import PageDownField
-from ..models import Role, User, Codes, ProjectCodes, Classified
+from ..models import Role, User, Classified
+from ..codecache import code_cache
 
 
 class NameForm(FlaskForm):
@@ -46,7 +53,41 @@ class EditProfileAdminForm(FlaskForm):
             raise ValidationError('Username already in use.')
 
 
+class ProfilerForm(FlaskForm):
+    enabled = BooleanField('Profiling on')
+    endpoint = StringField('Endpoint (e.g. main.index, blank for all)',
+                           validators=[Length(0, 64)])
+    user = StringField('Username or email (blank for everyone)',
+                       validators=[Length(0, 64)])
+    percent = IntegerField('Percentage of requests',
+                           validators=[NumberRange(0, 100)])
+    interval_ms = IntegerField('Milliseconds between samples',
+                               validators=[NumberRange(1, 1000)])
+    submit = SubmitField('Save')
+    clear = SubmitField('Clear samples')
+
+
+def active_codes():
+    '''
+    Return the choices for the code and project_code radio buttons, as two
+    lists of (id, name) tuples.
+    '''
+
+    # Codes without an end date yet, from the process wide cache rather
+    # than Postgres
+
+    active = code_cache.get()
+    return active.code_choices, active.project_code_choices
+
+
 class ClassifyForm(FlaskForm):
+
+    # The survey being classified, signed along with the coder's id so that
+    # the code is saved against the survey the coder was shown, without
+    # selecting a survey again when the form is submitted.
+
+    survey = HiddenField('survey', validators=[InputRequired()])
+
     code = RadioField('code_radio', coerce=int, validators=[InputRequired()])
 
     # Default the project code to 1, which should correspond to 'none'
@@ -61,21 +102,76 @@ class ClassifyForm(FlaskForm):
 
     submit = SubmitField('Submit')
 
+    # Set from the survey field once it has been validated
+
+    respondent_id = None
+
     @classmethod
     def codes(cls):
         codes_form = cls()
+        codes_form.code.choices, codes_form.project_code.choices = active_codes()
+        return(codes_form)
 
-        # Extract codes from Postgres
-        # Where there is not and end date yet
-
-        codes = Codes.query.filter(Codes.end_date.is_(None)).all()
-        codes_form.code.choices = [(g.code_id, g.code) for g in codes]
+    @staticmethod
+    def serializer(expiration=None):
+        return Serializer(current_app.config['SECRET_KEY'], expiration,
+                          salt='classify')
+
+    def set_survey(self, respondent_id):
+        '''Sign the respondent_id of the survey shown to the coder'''
+        s = self.serializer(current_app.config['FLASKY_SURVEY_LEASE_TIME'])
+        self.survey.data = s.dumps(
+            {'survey': respondent_id, 'coder': current_user.id}).decode('ascii')
+        self.respondent_id = respondent_id
+
+    def validate_survey(self, field):
+        try:
+            data = self.serializer().loads(field.data)
+        except BadSignature:
+            raise ValidationError(
+                'The survey you were classifying has expired, so your codes '
+                'were not saved.')
+        if data.get('coder') != current_user.id:
+            raise ValidationError('This survey was shown to someone else.')
+        self.respondent_id = data.get('survey')
+
+
+class SurveyCodesForm(Form):
+    '''The codes for one survey on the batch classification page'''
+    respondent_id = HiddenField(
+        'respondent_id', validators=[InputRequired(), Regexp(r'^\d+$')])
+    code = RadioField('code_radio', coerce=int, validators=[InputRequired()])
+    project_code = RadioField(
+        'project_code_radio',
+        coerce=int, default='0', validators=[InputRequired()])
+    PII_boolean = BooleanField('PII_boolean')
 
-        # Extract project_codes from Postgres
-        # Where there is not and end date yet
 
-        project_codes = ProjectCodes.query.filter(
-            ProjectCodes.end_date.is_(None)).all()
-        codes_form.project_code.choices = [(i.project_code_id, i.project_code) for i in project_codes]
+class BatchClassifyForm(FlaskForm):
+    surveys = FieldList(FormField(SurveyCodesForm))
+    submit = SubmitField('Submit')
 
-        return(codes_form)
+    @classmethod
+    def codes(cls):
+        batch_form = cls()
+        batch_form.choices = active_codes()
+        batch_form.set_choices()
+        return(batch_form)
+
+    def add_survey(self, respondent_id):
+        self.surveys.append_entry({'respondent_id': respondent_id})
+        self.set_choices()
+
+    def set_choices(self):
+        code_choices, project_code_choices = self.choices
+        for entry in self.surveys:
+            entry.code.choices = code_choices
+            entry.project_code.choices = project_code_choices
+
+    def drop_invalid(self):
+        '''Leave out the surveys whose respondent_id failed validation'''
+        self.surveys.entries = [
+            entry for entry in self.surveys if not entry.respondent_id.errors]
+
+    def respondent_ids(self):
+        return [int(entry.respondent_id.data) for entry in self.surveys]
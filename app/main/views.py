@@ -1,29 +1,41 @@
 from flask import (
     render_template, redirect, url_for, abort, flash, request, current_app,
-    make_response)
+    make_response, Response)
 from flask_login import login_required, current_user
-from flask_sqlalchemy import get_debug_queries
 from . import main
-from .forms import EditProfileAdminForm, ClassifyForm
+from .forms import (
+    EditProfileAdminForm, ClassifyForm, BatchClassifyForm, ProfilerForm)
 from .. import db
 from ..models import (
-    Permission, Role, User, Classified, Raw, Codes, ProjectCodes, Priority,
-    Leaders, DailyLeaders, WeeklyLeaders)
+    Permission, Role, User, Raw,
+    Leaders, DailyLeaders, WeeklyLeaders, SlowQuery, SlowQueryPlan)
 from ..decorators import admin_required, permission_required
-from datetime import datetime, date
+from ..codecache import code_cache
+from ..codercounts import coded_on
+from ..metrics import metrics
+from ..sampler import sampler, profile_name
+from ..tracing import span
+from ..slowqueries import worst_queries
+from ..surveyqueue import (
+    new_survey, claim_surveys, classify_surveys)
 from functools import wraps
 from random import choice
 
 
-@main.after_app_request
-def after_request(response):
-    for query in get_debug_queries():
-        if query.duration >= current_app.config['FLASKY_SLOW_DB_QUERY_TIME']:
-            current_app.logger.warning(
-                'Slow query: %s\nParameters: %s\nDuration: %fs\nContext: %s\n'
-                % (query.statement, query.parameters, query.duration,
-                   query.context))
-    return response
+@main.route('/metrics')
+def prometheus_metrics():
+
+    # Only served with the token set in FLASKY_METRICS_TOKEN, except when
+    # testing
+
+    token = current_app.config['FLASKY_METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != 'Bearer ' + token:
+            abort(404)
+    elif not current_app.testing:
+        abort(404)
+    return Response(metrics.render(),
+                    mimetype='text/plain; version=0.0.4')
 
 
 @main.route('/shutdown')
@@ -37,108 +49,167 @@ def server_shutdown():
     return 'Shutting down...'
 
 
-def new_survey(user, model):
-    '''
-    Select the next survey: ensures that a coder doesn't see the same
-    survey more than once.
+# Main classification page
 
-    '''
+@main.route('/', methods=['GET', 'POST'])
+@login_required
+@permission_required(Permission.CLASSIFY)
+def index():
 
-    # This query can be slow.
-    # Filter by 6 will remove all automated and recalcitrant surveys, pii,
-    # And those already happily classified.
+    # Create forms for entering code and project_code
 
-    priority = model.query.filter(Priority.priority < 6).all()
+    with span('codes'):
+        codes_form = ClassifyForm.codes()
 
-    priority_list = [
-        i for i in priority if i.coders is None or user not in i.coders]
+    # The survey being classified comes from the signed field in the form,
+    # so no survey is selected when the form is submitted.
 
-    # Set a limit on how many failures to accept
+    with span('validate'):
+        valid = codes_form.validate_on_submit()
 
-    count = 0
+    if valid:
+        survey_id = codes_form.respondent_id
 
-    while len(priority_list) == 0 and count < 3:
+        # Save data into the Classified table, if the survey is still
+        # leased to this user
 
-        count += 1
+        saved = classify_surveys(current_user.id, [dict(
+            respondent_id=survey_id,
+            code_id=codes_form.code.data,
+            project_code_id=codes_form.project_code.data,
+            pii=codes_form.PII_boolean.data)])
 
-        priority = model.query.filter(Priority.priority < 6).all()
+        if not saved:
+            flash('Survey %s was not saved because it was held for too long '
+                  'and has been passed to someone else.' % survey_id)
+            return redirect(url_for('main.index'))
 
-        priority_list = [
-            i for i in priority if i.coders is None or user not in i.coders]
+        flash('Survey %s classified' % survey_id)
 
-    return(priority_list)
+        # Get number of surveys coded today (including this one, which
+        # the trigger on classified has already counted), and print
+        # number on every ten
 
-# Main classification page
+        coded_today = coded_on(current_user.id)
 
-@main.route('/', methods=['GET', 'POST'])
+        if coded_today and coded_today % 10 == 0:
+
+            exclaim = [
+                'Well Done!', 'Great!', 'Congratulations!', 'Great Work!',
+                'Boom!', 'Amazeballs!', 'Amazing!']
+
+            flash('%s You have coded %d surveys today!' % (
+                choice(exclaim), coded_today))
+
+        # Here the code is reset (probably not required
+        # when working fully)
+
+        return redirect(url_for('main.index'))
+
+    # If the form failed validation but still says which survey was shown,
+    # show the same survey again with the errors
+
+    respondent_id = codes_form.respondent_id
+
+    if respondent_id is None:
+
+        if codes_form.survey.data:
+            for error in codes_form.survey.errors:
+                flash(error)
+
+        # Lease a survey from the priority table that the user has not yet
+        # seen, and that no one else is looking at.
+
+        respondent_id = new_survey(current_user.id)
+
+        # Check that there are some entries returned if not
+        # Redirect to 'All done page'
+
+        if respondent_id is None:
+
+            flash('You\'re all caught up. Check back later for new surveys.')
+
+            return render_template('404.html')
+
+        codes_form.set_survey(respondent_id)
+
+    with span('raw'):
+        survey = Raw.query.get(respondent_id)
+
+    return render_template('index.html', form=codes_form, survey=survey)
+
+
+# Batch classification page: several surveys coded with one submit
+
+@main.route('/batch', methods=['GET', 'POST'])
 @login_required
 @permission_required(Permission.CLASSIFY)
-def index():
+def batch():
 
-    # Select a survey from the priority view.
-    # While loop keeps running until a survey
-    # is found that the user has not yet seen.
+    batch_form = BatchClassifyForm.codes()
 
-    priority = new_survey(current_user.id, Priority)
+    if batch_form.validate_on_submit():
 
-    # Check that there are some entries returned if not
-    # Redirect to 'All done page'
+        # Only codes for surveys which are still leased to this user are
+        # saved. Any that have expired may already be in front of someone
+        # else.
 
-    if len(priority) == 0:
+        respondent_ids = batch_form.respondent_ids()
+        survey_classifications = [
+            dict(
+                respondent_id=int(entry.respondent_id.data),
+                code_id=entry.code.data,
+                project_code_id=entry.project_code.data,
+                pii=entry.PII_boolean.data)
+            for entry in batch_form.surveys]
 
-        flash('You\'re all caught up. Check back later for new surveys.')
+        # Save all of the classifications in one transaction
 
-        return render_template('404.html')
+        saved = classify_surveys(current_user.id, survey_classifications)
 
-    else:
-        priority = priority[0]
+        flash('%d surveys classified' % len(saved))
 
-        survey = Raw.query.filter(
-            Raw.respondent_id==priority.respondent_id).first()
-        survey_id = survey.respondent_id
+        if len(saved) < len(respondent_ids):
+            flash('%d surveys were not saved because they were held for too '
+                  'long and have been passed to someone else.' % (
+                      len(respondent_ids) - len(saved)))
 
-        # Create forms for entering code and project_code
+        return redirect(url_for('main.batch'))
 
-        codes_form = ClassifyForm.codes()
+    respondent_ids = []
+    if request.method == 'POST':
 
-        if codes_form.validate_on_submit():
-            flash('Survey %s classified' % survey_id)
+        # The form failed validation: show the same surveys again, apart
+        # from any whose respondent_id was missing or not a number
 
-            # Get number of surveys coded today, and print number on every ten
+        batch_form.drop_invalid()
+        respondent_ids = batch_form.respondent_ids()
 
-            coded_today = Classified.query.filter(
-                Classified.coder_id == current_user.id).filter(
-                    Classified.date_coded > date.today()).count() + 1
+    if not respondent_ids:
 
-            if coded_today % 10 == 0:
+        # Lease a whole page of surveys with a single selection query
 
-                exclaim = [
-                    'Well Done!', 'Great!', 'Congratulations!', 'Great Work!',
-                    'Boom!', 'Amazeballs!', 'Amazing!']
+        respondent_ids = claim_surveys(
+            current_user.id, count=current_app.config['FLASKY_BATCH_SIZE'])
 
-                flash('%s You have coded %d surveys today!' % (
-                    choice(exclaim), coded_today))
+        for respondent_id in respondent_ids:
+            batch_form.add_survey(respondent_id)
 
-            # Save data into the Classified table
+    if len(respondent_ids) == 0:
 
-            survey_classification = Classified(
-                respondent_id=survey_id,
-                code_id=codes_form.code.data,
-                project_code_id=codes_form.project_code.data,
-                pii=codes_form.PII_boolean.data,
-                date_coded='{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.now()),
-                coder_id=current_user.id
-                )
+        flash('You\'re all caught up. Check back later for new surveys.')
 
-            db.session.add(survey_classification)
-            db.session.commit()
+        return render_template('404.html')
 
-            # Here the code is reset (probably not required
-            # when working fully)
+    # Fetch all of the surveys at once, then put them back into the order
+    # they were leased in
 
-            return redirect(url_for('main.index'))
+    surveys = Raw.query.filter(Raw.respondent_id.in_(respondent_ids)).all()
+    surveys = dict((survey.respondent_id, survey) for survey in surveys)
+    rows = [(entry, surveys.get(respondent_id))
+            for entry, respondent_id in zip(batch_form.surveys, respondent_ids)]
 
-        return render_template('index.html', form=codes_form, survey=survey)
+    return render_template('batch.html', form=batch_form, rows=rows)
 
 
 @main.route('/user/<username>')
@@ -178,35 +249,90 @@ def edit_profile_admin(id):
 @main.route('/codes', methods=['GET'])
 @login_required
 def code_table():
-    codes = Codes.query.filter(Codes.end_date == None).all()
-    table = [i.__dict__ for i in codes]
-    return render_template('codes.html', table=table)
+    return render_template('codes.html', table=code_cache.get().codes)
 
 
 @main.route('/users', methods=['GET'])
 @login_required
 @admin_required
 def auth_table():
-    users = (User.query.
-             outerjoin(Role, User.role_id == Role.id).
-             filter(User.last_seen.isnot(None)).
-             order_by(User.last_seen.desc()).all())
+    with span('users'):
+        users = (User.query.
+                 outerjoin(Role, User.role_id == Role.id).
+                 filter(User.last_seen.isnot(None)).
+                 order_by(User.last_seen.desc()).all())
     table = [i.__dict__ for i in users]
     return render_template('users.html', table=table)
 
 
+@main.route('/slow-queries', methods=['GET'])
+@login_required
+@admin_required
+def slow_query_table():
+    return render_template('slow_queries.html', table=worst_queries())
+
+
+@main.route('/slow-queries/<fingerprint>', methods=['GET'])
+@login_required
+@admin_required
+def slow_query(fingerprint):
+    query = SlowQuery.query.get_or_404(fingerprint)
+    plans = (SlowQueryPlan.query.
+             filter_by(fingerprint=fingerprint).
+             order_by(SlowQueryPlan.captured.desc()).all())
+    return render_template('slow_query.html', query=query, plans=plans)
+
+
+@main.route('/profiler', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def profiler():
+    form = ProfilerForm()
+    if form.validate_on_submit():
+        if form.clear.data:
+            sampler.clear()
+            flash('The samples have been cleared.')
+        else:
+            sampler.save_settings(
+                enabled=form.enabled.data, endpoint=form.endpoint.data,
+                user=form.user.data, percent=form.percent.data,
+                interval_ms=form.interval_ms.data)
+            flash('The profiler settings have been saved.')
+        return redirect(url_for('main.profiler'))
+    settings = sampler.load_settings()
+    for field in ('enabled', 'endpoint', 'user', 'percent', 'interval_ms'):
+        getattr(form, field).data = settings[field]
+    return render_template('profiler.html', form=form,
+                           profiles=sampler.profiles())
+
+
+@main.route('/profiler/<name>.collapsed', methods=['GET'])
+@login_required
+@admin_required
+def profile_download(name):
+    profile = sampler.collapsed(profile_name(name))
+    if not profile:
+        abort(404)
+    response = make_response(profile)
+    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=%s.collapsed' % profile_name(name)
+    return response
+
+
 @main.route('/leaders', methods=['GET'])
 @login_required
 @permission_required(Permission.GAMIFY)
 def leader_table():
-    all_time_leaders = Leaders.query.all()
-    all_table = [i.__dict__ for i in all_time_leaders]
+    with span('leaders'):
+        all_time_leaders = Leaders.query.all()
+        all_table = [i.__dict__ for i in all_time_leaders]
 
-    daily_leaders = DailyLeaders.query.all()
-    daily_table = [i.__dict__ for i in daily_leaders]
+        daily_leaders = DailyLeaders.query.all()
+        daily_table = [i.__dict__ for i in daily_leaders]
 
-    weekly_leaders = WeeklyLeaders.query.all()
-    weekly_table = [i.__dict__ for i in weekly_leaders]
+        weekly_leaders = WeeklyLeaders.query.all()
+        weekly_table = [i.__dict__ for i in weekly_leaders]
 
     return render_template(
         'leaders.html', all_table=all_table, weekly_table=weekly_table,
@@ -0,0 +1,322 @@
+"""
+In-process metrics, served at /metrics in the Prometheus text format.
+
+Each worker keeps its counters and histograms in memory, so recording a
+value costs a lock and a few additions. Under gunicorn, set
+FLASKY_METRICS_DIR to a directory shared by the workers (and emptied when
+the app is deployed): each worker writes its values to a file there at most
+once every FLASKY_METRICS_FLUSH_INTERVAL seconds, and /metrics adds up the
+files of every worker, so it describes the whole instance whichever worker
+answers. Counters and histograms of workers which have exited are kept;
+gauges are only counted for workers which are still running.
+
+Database statements are counted and timed with SQLAlchemy engine events,
+rather than by recording every statement (SQLALCHEMY_RECORD_QUERIES) and
+scanning them after each request. Statements slower than
+FLASKY_SLOW_DB_QUERY_TIME are all counted in slow_queries, and logged and
+explained for a sample of them (FLASKY_SLOW_QUERY_SAMPLE_RATE; see
+app/slowqueries.py).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from flask import current_app, g, has_app_context, has_request_context, \
+    request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from .slowqueries import slow_queries
+
+# Upper bounds of the histogram buckets, in seconds or queries
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value))
+                             for name, value in pairs)
+
+
+def number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    '''A metric, with one value for each combination of label values'''
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def lines(self, values):
+        for key, value in sorted(values.items()):
+            yield '%s%s %s' % (
+                self.name, label_text(self.labels, key), number(value))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+
+class Gauge(Metric):
+    '''A value which goes up and down, added up over the running workers'''
+
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    '''
+    Counts of observations in buckets, stored per bucket (not cumulatively)
+    with the sum of the observations last
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def lines(self, values):
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '%s_bucket%s %d' % (
+                    self.name,
+                    label_text(self.labels, key, [('le', number(bound))]),
+                    cumulative)
+            labels = label_text(self.labels, key)
+            yield '%s_sum%s %s' % (self.name, labels, number(counts[-1]))
+            yield '%s_count%s %d' % (self.name, labels, cumulative)
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class Metrics(object):
+    '''The metrics of this process, and of the other workers if shared'''
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.directory = None
+        self.interval = 1
+        self.last_flush = 0
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def init_app(self, app):
+        self.directory = app.config['FLASKY_METRICS_DIR']
+        self.interval = app.config['FLASKY_METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        listen_to_database()
+        app.before_request(before_request)
+        app.after_request(after_request)
+
+    def values(self):
+        '''This process's values, as {name: [[label values, value]...]}'''
+        values = {}
+        for name, metric in self.metrics.items():
+            with metric.lock:
+                values[name] = [[list(key), value] for key, value in
+                                metric.values.items()]
+        return values
+
+    def flush(self, force=False):
+        '''
+        Write this process's values to the shared directory, if there is one
+        and they have not been written for the flush interval
+        '''
+        now = time.time()
+        if not self.directory or \
+                (not force and now - self.last_flush < self.interval):
+            return
+        self.last_flush = now
+        path = os.path.join(self.directory, '%d.json' % os.getpid())
+        partial = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(partial, 'w') as f:
+            json.dump(self.values(), f)
+        os.replace(partial, path)
+
+    def workers(self):
+        '''The values of each worker, as {pid: values}'''
+        if not self.directory:
+            return {os.getpid(): self.values()}
+        self.flush(force=True)
+        workers = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        workers[int(filename[:-5])] = json.load(f)
+                except (OSError, ValueError):
+                    continue
+        return workers
+
+    def collect(self):
+        '''The values of every worker, added up, as {name: {labels: value}}'''
+        totals = dict((name, {}) for name in self.metrics)
+        for pid, values in self.workers().items():
+            alive = None
+            for name, metric in self.metrics.items():
+                if metric.kind == 'gauge':
+                    if alive is None:
+                        alive = running(pid)
+                    if not alive:
+                        continue
+                for key, value in values.get(name, []):
+                    key = tuple(key)
+                    totals[name][key] = metric.merge(
+                        totals[name].get(key), value)
+        return totals
+
+    def render(self):
+        '''Every metric in the Prometheus text format'''
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.kind))
+            lines.extend(metric.lines(totals[name]))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+REQUEST_SECONDS = metrics.add(Histogram(
+    'http_request_duration_seconds', 'Time taken to answer requests',
+    ['endpoint', 'method', 'status']))
+REQUEST_QUERIES = metrics.add(Histogram(
+    'http_request_db_queries', 'Database statements run for each request',
+    ['endpoint'], QUERY_BUCKETS))
+REQUEST_DB_SECONDS = metrics.add(Histogram(
+    'http_request_db_seconds', 'Time spent in the database for each request',
+    ['endpoint']))
+SELECTION_SECONDS = metrics.add(Histogram(
+    'survey_selection_seconds', 'Time taken to lease surveys to a coder'))
+CLASSIFICATIONS = metrics.add(Counter(
+    'classifications_total', 'Classifications saved'))
+POOL_CONNECTIONS = metrics.add(Gauge(
+    'db_pool_connections', 'Database connections open'))
+POOL_CHECKED_OUT = metrics.add(Gauge(
+    'db_pool_checked_out', 'Database connections in use'))
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_time = g.get('query_time', 0) + elapsed
+    if has_app_context() and \
+            elapsed >= current_app.config['FLASKY_SLOW_DB_QUERY_TIME']:
+        endpoint = request.endpoint if has_request_context() else None
+        sampled = random.random() < current_app.config[
+            'FLASKY_SLOW_QUERY_SAMPLE_RATE']
+        if sampled:
+            current_app.logger.warning(
+                'Slow query: %s\nParameters: %s\nDuration: %fs\n'
+                'Endpoint: %s\n' % (statement, parameters, elapsed, endpoint))
+        slow_queries.record(
+            statement, parameters, elapsed, endpoint, executemany, sampled)
+
+
+def listen_to_database():
+    '''Time statements on every engine, and follow every connection pool'''
+    if event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Pool, 'connect', lambda *args: POOL_CONNECTIONS.inc())
+    event.listen(Pool, 'close', lambda *args: POOL_CONNECTIONS.dec())
+    event.listen(Pool, 'checkout', lambda *args: POOL_CHECKED_OUT.inc())
+    event.listen(Pool, 'checkin', lambda *args: POOL_CHECKED_OUT.dec())
+
+
+def before_request():
+    g.request_start = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0
+
+
+def after_request(response):
+
+    # Another before_request function may have answered the request first
+
+    start = g.get('request_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'none'
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start, endpoint=endpoint,
+        method=request.method, status=response.status_code)
+    REQUEST_QUERIES.observe(g.query_count, endpoint=endpoint)
+    REQUEST_DB_SECONDS.observe(g.query_time, endpoint=endpoint)
+    if current_app.config['FLASKY_QUERY_COUNT_HEADER']:
+        response.headers['X-Query-Count'] = str(g.query_count)
+    metrics.flush()
+    return response
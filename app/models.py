@@ -67,23 +67,10 @@ class User(UserMixin, db.Model):
     classified = db.relationship('Classified', backref='user_classified', lazy='dynamic')
 
     @staticmethod
-    def generate_fake(count=100):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed
-        import forgery_py
-
-        seed()
-        for i in range(count):
-            u = User(email=forgery_py.internet.email_address(),
-                     username=forgery_py.internet.user_name(True),
-                     password=forgery_py.lorem_ipsum.word(),
-                     confirmed=True,
-                     member_since=forgery_py.date.date(True))
-            db.session.add(u)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
+    def generate_fake(count=100, seed=None):
+        '''Add count confirmed fake users (see app/fakedata.py)'''
+        from app.fakedata import fake_users
+        return fake_users(count, seed)
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -219,6 +206,11 @@ def load_user(user_id):
 class Classified(db.Model):
     '''A user's classification/coding of a survey'''
     __tablename__ = 'classified'
+    # Supports the 'not already coded by me' anti-join in new_survey()
+    __table_args__ = (
+        db.Index('ix_classified_coder_id_respondent_id',
+                 'coder_id', 'respondent_id'),
+    )
     classified_id = db.Column(db.Integer(), primary_key=True, index=True)
     respondent_id = db.Column(
         db.BigInteger(), db.ForeignKey('raw.respondent_id'), index=True)
@@ -235,68 +227,37 @@ class Classified(db.Model):
     date_coded = db.Column(db.DateTime(), nullable=False)
 
     @staticmethod
-    def generate_fake(count=1000, user_count=1):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed, randint, sample
-        from numpy.random import choice
-        import forgery_py
-        from datetime import datetime
-        from sqlalchemy.sql.expression import func
-
-        seed()
-
-        # Load all users into a list and sample n=user_count users
-
-        user_query = User.query.all()
-        u_ids = [i.id for i in user_query]
-        u_ids = sample(u_ids, user_count)
-
-        # Load codes and project codes for application to surveys
-
-        codes_query = Codes.query.filter(Codes.end_date.is_(None)).all()
-        project_codes_query = ProjectCodes.query.filter(
-            Codes.end_date.is_(None)).all()
+    def generate_fake(count=1000, user_count=1, seed=None):
+        '''
+        Add up to count fake classifications of surveys in the queue, by
+        user_count users (see app/fakedata.py)
+        '''
+        from app.fakedata import fake_classified
+        return fake_classified(count, user_count, seed)
 
-        # Convert to lists
-
-        c_ids = [i.code_id for i in codes_query]
-        pc_ids = [i.project_code_id for i in project_codes_query]
-
-        # Cycle through each user and classify as a human would
-
-        for j in range(user_count):
-            for i in range(int(count/user_count)):
-
-                # Choose from surveys that have not already been classified as
-                # either PII, difficult, or already classified well.
-
-                raw_query = Priority.query.filter(
-                    Priority.priority < 6).first()
-                if raw_query:
-                    r_id = raw_query.respondent_id
-
-                    r = Classified(
-                        respondent_id=r_id,
-                        coder_id=int(choice(u_ids)),
-                        code_id=int(choice(c_ids)),
-                        project_code_id=int(choice(pc_ids)),
-                        pii=choice(a=['Yes', 'No'], p=[0.001, 0.999]),
-                        date_coded='{:%Y-%m-%d %H:%M:%S.%f}'.format(
-                            datetime.now())
-                        )
-                else:
-                    pass
-                    print(
-                        'No surveys with the right priority remaining to be'
-                        'classified. Try running Raw.generate_fake() to create'
-                        ' more fake surveys before re-running '
-                        'Classified.generate_fake().')
-
-                db.session.add(r)
-                try:
-                    db.session.commit()
-                except IntegrityError:
-                    db.session.rollback()
+    @staticmethod
+    def from_json(json_classified):
+        '''
+        Check a classification received through the API and return it as a
+        dict, ready for app.surveyqueue.classify_surveys()
+        '''
+        if not isinstance(json_classified, dict):
+            raise ValidationError('classification must be an object')
+        classification = {}
+        for field in ['respondent_id', 'code_id', 'project_code_id']:
+            value = json_classified.get(field)
+            if value is None and field != 'project_code_id':
+                raise ValidationError('classification does not have a %s'
+                                      % field)
+            if value is not None and (
+                    not isinstance(value, int) or isinstance(value, bool)):
+                raise ValidationError('%s must be an integer' % field)
+            classification[field] = value
+        pii = json_classified.get('pii', False)
+        if not isinstance(pii, bool):
+            raise ValidationError('pii must be true or false')
+        classification['pii'] = pii
+        return classification
 
     def __repr__(self):
         return '<respondent_id %s>' % self.respondent_id
@@ -332,6 +293,22 @@ class Raw(db.Model):
         return '<respondent_id %s start_date %s>' % (
             self.respondent_id, self.start_date)
 
+    # The fields shown to coders, in the order they appear on the page
+
+    DISPLAY_FIELDS = [
+        'full_url', 'cat_satisfaction', 'cat_found_looking_for',
+        'comment_why_you_came', 'comment_where_for_help',
+        'comment_further_comments']
+
+    def to_json(self):
+        '''The fields a coder needs to see, leaving out any that are empty'''
+        json_survey = {'respondent_id': self.respondent_id}
+        for field in self.DISPLAY_FIELDS:
+            value = getattr(self, field)
+            if value:
+                json_survey[field] = value
+        return json_survey
+
     @staticmethod
     def get_urls(count=10, file='govukurls.txt'):
 
@@ -363,42 +340,13 @@ class Raw(db.Model):
         print('Appending to %s' % file)
 
     @staticmethod
-    def generate_fake(count=100):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed, randint, choice
-        import forgery_py
-
-        # Load a random list of gov.uk urls
-
-        with open('govukurls.txt') as f:
-            govukurls = f.read().splitlines()
-
-        seed()
-        for i in range(count):
-            r = Raw(
-                respondent_id=randint(10000000, 50000000),
-                collector_id=999999,
-                start_date=forgery_py.date.date(True),
-                end_date=forgery_py.date.date(True),
-                full_url=choice(govukurls),
-                cat_work_or_personal=forgery_py.lorem_ipsum.word(),
-                comment_what_work=forgery_py.lorem_ipsum.words(3),
-                comment_why_you_came=forgery_py.lorem_ipsum.sentences(2),
-                cat_found_looking_for=choice(['Yes','No']),
-                comment_other_found_what=forgery_py.lorem_ipsum.sentences(2),
-                cat_satisfaction=choice(['Very','Not Very']),
-                comment_other_where_for_help=forgery_py.lorem_ipsum.sentences(2),
-                cat_anywhere_else_help=choice(['Yes','No']),
-                comment_other_else_help=forgery_py.lorem_ipsum.sentence(),
-                comment_where_for_help=forgery_py.lorem_ipsum.sentence(),
-                comment_further_comments=forgery_py.lorem_ipsum.sentences(3)
-            )
-
-            db.session.add(r)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
+    def generate_fake(count=100, seed=None):
+        '''
+        Add count fake surveys, with pages from govukurls.txt (see
+        app/fakedata.py)
+        '''
+        from app.fakedata import fake_surveys
+        return fake_surveys(count, seed)
 
     def __repr__(self):
         return '<respondent_id %s>' % self.respondent_id
@@ -420,43 +368,15 @@ class Codes(db.Model):
     def __repr__(self):
         return '<code %s code_id %s>' % (self.code, self.code_id)
 
-    @staticmethod
-    def generate_fake(count=10):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed, randint, choice
-        import forgery_py
-
-        seed()
+    def to_json(self):
+        return {'code_id': self.code_id, 'code': self.code,
+                'description': self.description}
 
-# Add a 'none' class to ensure the default value in the form
-# works as expected
-
-        r = Codes(
-            code='none',
-            description='none',
-            start_date=forgery_py.date.date(True),
-            end_date=None
-            )
-
-        db.session.add(r)
-        try:
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-
-        for i in range(count):
-            r = Codes(
-                code=forgery_py.lorem_ipsum.word(),
-                description=forgery_py.lorem_ipsum.sentence(),
-                start_date=forgery_py.date.date(True),
-                end_date=choice([None, forgery_py.date.date(True)])
-                )
-
-            db.session.add(r)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
+    @staticmethod
+    def generate_fake(count=10, seed=None):
+        '''Add a 'none' code and count fake codes (see app/fakedata.py)'''
+        from app.fakedata import fake_codes
+        return fake_codes(Codes, 'code', count, seed)
 
 
 class ProjectCodes(db.Model):
@@ -477,43 +397,19 @@ class ProjectCodes(db.Model):
         return '<project_code %s project_code_id %s>' % (
             self.project_code, self.project_code_id)
 
-    @staticmethod
-    def generate_fake(count=3):
-        from sqlalchemy.exc import IntegrityError
-        from random import seed, randint, choice
-        import forgery_py
+    def to_json(self):
+        return {'project_code_id': self.project_code_id,
+                'project_code': self.project_code,
+                'description': self.description}
 
-        seed()
-
-# Add a 'none' class to ensure the default value in the form
-# works as expected
-
-        r = ProjectCodes(
-            project_code='none',
-            description='none',
-            start_date=forgery_py.date.date(True),
-            end_date=None
-            )
-
-        db.session.add(r)
-        try:
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-
-        for i in range(count):
-            r = ProjectCodes(
-                project_code=forgery_py.lorem_ipsum.word(),
-                description=forgery_py.lorem_ipsum.sentence(),
-                start_date=forgery_py.date.date(True),
-                end_date=choice([None, forgery_py.date.date(True)])
-                )
-
-            db.session.add(r)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
+    @staticmethod
+    def generate_fake(count=3, seed=None):
+        '''
+        Add a 'none' project code and count fake project codes (see
+        app/fakedata.py)
+        '''
+        from app.fakedata import fake_codes
+        return fake_codes(ProjectCodes, 'project_code', count, seed)
 
 
 class Priority(db.Model):
@@ -538,6 +434,184 @@ class Priority(db.Model):
             self.respondent_id, self.month, self.priority, self.vote)
 
 
+class SurveyCodes(db.Model):
+    '''The number of times each code has been applied to a survey.
+
+    Maintained by a trigger on classified (see sql/triggers/priority.sql) so
+    that the vote for a survey can be worked out without scanning classified.
+    '''
+
+    __tablename__ = 'survey_codes'
+    respondent_id = db.Column(
+        db.BigInteger(), db.ForeignKey('raw.respondent_id'), primary_key=True)
+    code_id = db.Column(
+        db.Integer(), db.ForeignKey('codes.code_id'), primary_key=True)
+    n = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return '<respondent_id %s code_id %s n %s>' % (
+            self.respondent_id, self.code_id, self.n)
+
+
+class SurveyPriority(db.Model):
+    '''The stored equivalent of the priority view: one row per survey with
+    its current vote state and priority.
+
+    Rows are created by a trigger on raw and updated in place by a trigger on
+    classified, so reading the priority of a survey does not depend on the
+    size of the classified table. Rebuild with python manage.py
+    rebuild_priority.
+    '''
+
+    __tablename__ = 'survey_priority'
+    respondent_id = db.Column(
+        db.BigInteger(), db.ForeignKey('raw.respondent_id'), primary_key=True)
+    month = db.Column(db.DateTime())
+    total = db.Column(db.Integer())
+    max = db.Column(db.Integer())
+    ratio = db.Column(db.Float())
+    vote = db.Column(db.Integer())
+    coders = db.Column(db.ARRAY(db.Integer()))
+    pii = db.Column(db.Integer())
+    automated = db.Column(db.Integer(), default=0)
+    priority = db.Column(db.Integer(), index=True)
+
+    def __repr__(self):
+        return '<respondent_id %s date %s priority %s vote %s>' % (
+            self.respondent_id, self.month, self.priority, self.vote)
+
+
+# Only surveys with a priority below 6 are ever offered to coders
+
+db.Index('ix_survey_priority_queue',
+         SurveyPriority.month.desc(), SurveyPriority.priority,
+         postgresql_where=SurveyPriority.priority < 6)
+
+
+class SurveyLease(db.Model):
+    '''A survey that has been handed to a coder, which no other coder will
+    be offered until leased_until has passed (see app/surveyqueue.py).
+    '''
+
+    __tablename__ = 'survey_leases'
+    respondent_id = db.Column(
+        db.BigInteger(), db.ForeignKey('raw.respondent_id'), primary_key=True)
+    coder_id = db.Column(
+        db.Integer(), db.ForeignKey('users.id'), nullable=False, index=True)
+    leased_until = db.Column(db.DateTime(), nullable=False, index=True)
+
+    def __repr__(self):
+        return '<respondent_id %s coder_id %s leased_until %s>' % (
+            self.respondent_id, self.coder_id, self.leased_until)
+
+
+class ScreenedSurvey(db.Model):
+    '''The free text of a survey with any personal information replaced by
+    placeholders such as {{EMAIL}}, written when the survey is loaded (see
+    app/piiscreen.py).
+
+    pii_types lists the kinds of personal information found. Surveys with
+    pii are given priority 8, so they are never offered to coders.
+    '''
+
+    __tablename__ = 'screened_surveys'
+    respondent_id = db.Column(
+        db.BigInteger(), db.ForeignKey('raw.respondent_id'), primary_key=True)
+    comment_what_work = db.Column(db.String())
+    comment_why_you_came = db.Column(db.String())
+    comment_other_found_what = db.Column(db.String())
+    comment_other_where_for_help = db.Column(db.String())
+    comment_other_else_help = db.Column(db.String())
+    comment_where_for_help = db.Column(db.String())
+    comment_further_comments = db.Column(db.String())
+    pii = db.Column(db.Boolean(), nullable=False, default=False)
+    pii_types = db.Column(db.ARRAY(db.String()))
+    screened = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<respondent_id %s pii %s>' % (self.respondent_id, self.pii)
+
+
+class SlowQuery(db.Model):
+    '''A statement which has run for longer than FLASKY_SLOW_DB_QUERY_TIME,
+    with its literals and parameters taken out so that every run of it is
+    counted together (see app/slowqueries.py).
+
+    durations holds the most recent slow durations, for percentiles.
+    '''
+
+    __tablename__ = 'slow_queries'
+    fingerprint = db.Column(db.String(40), primary_key=True)
+    statement = db.Column(db.Text(), nullable=False)
+    example = db.Column(db.Text())
+    endpoint = db.Column(db.String(64))
+    count = db.Column(db.Integer(), nullable=False, default=0)
+    total_seconds = db.Column(db.Float(), nullable=False, default=0)
+    max_seconds = db.Column(db.Float())
+    durations = db.Column(db.ARRAY(db.Float()))
+    first_seen = db.Column(db.DateTime(), default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<slow query %s count %s>' % (self.fingerprint, self.count)
+
+
+class SlowQueryPlan(db.Model):
+    '''The EXPLAIN (ANALYZE, BUFFERS) plan of a slow statement, as JSON,
+    captured in the background soon after it ran.
+    '''
+
+    __tablename__ = 'slow_query_plans'
+    id = db.Column(db.Integer(), primary_key=True)
+    fingerprint = db.Column(
+        db.String(40), db.ForeignKey('slow_queries.fingerprint'),
+        nullable=False, index=True)
+    captured = db.Column(db.DateTime(), default=datetime.utcnow)
+    duration = db.Column(db.Float())
+    execution_ms = db.Column(db.Float())
+    total_cost = db.Column(db.Float())
+    plan = db.Column(db.Text())
+
+    def __repr__(self):
+        return '<plan of %s captured %s>' % (self.fingerprint, self.captured)
+
+
+class CoderDailyCounts(db.Model):
+    '''The number of surveys each coder has classified on each day, kept up
+    to date by the triggers in sql/triggers/coder_counts.sql.
+    '''
+
+    __tablename__ = 'coder_daily_counts'
+    coder_id = db.Column(
+        db.Integer(), db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date(), primary_key=True)
+    n = db.Column(db.Integer(), nullable=False, default=0)
+
+    def __repr__(self):
+        return '<coder_id %s day %s n %s>' % (self.coder_id, self.day, self.n)
+
+
+class Checkpoint(db.Model):
+    '''How far a resumable job, such as the url lookup, has got through the
+    surveys in raw.
+    '''
+
+    __tablename__ = 'checkpoints'
+    name = db.Column(db.String(64), primary_key=True)
+    respondent_id = db.Column(db.BigInteger())
+    end_date = db.Column(db.DateTime())
+    updated = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    @staticmethod
+    def load(name):
+        '''Return the named checkpoint, or a new empty one'''
+        return Checkpoint.query.get(name) or Checkpoint(name=name)
+
+    def __repr__(self):
+        return '<checkpoint %s respondent_id %s end_date %s>' % (
+            self.name, self.respondent_id, self.end_date)
+
+
 class Urls(db.Model):
     '''A page on GOV.UK, which is the context for each survey that is filled
     in.
@@ -565,44 +639,13 @@ class Urls(db.Model):
             self.full_url, self.org0, self.section0, self.lookup_date)
 
     @staticmethod
-    def bulk_lookup():
-        from sqlalchemy.exc import IntegrityError
-
-        # Check to ensure that we haven't already looked up this entry
-        # For now, disable this, as it may be necessary to have duplicate
-        # full_urls in the Urls table owing to Machinery of Govt changes.
-
-        # urls_full_urls = Urls.query.all()
-        # ulrs_full_urls = [i for i in urls_full_urls]
-
-        all_full_urls = Raw.query.filter_by().all()
-
-        r = ProjectCodes(
-            project_code='none',
-            description='none',
-            start_date=forgery_py.date.date(True),
-            end_date=None
-            )
-
-        db.session.add(r)
-        try:
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-
-        for i in range(count):
-            r = ProjectCodes(
-                project_code=forgery_py.lorem_ipsum.word(),
-                description=forgery_py.lorem_ipsum.sentence(),
-                start_date=forgery_py.date.date(True),
-                end_date=choice([None, forgery_py.date.date(True)])
-                )
-
-            db.session.add(r)
-            try:
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
+    def bulk_lookup(ttl=None):
+        '''
+        Look up the pages surveys were filled in on, see
+        app.urllookup.api_lookup()
+        '''
+        from .urllookup import api_lookup
+        return api_lookup(ttl)
 
 
 class Leaders(db.Model):
@@ -0,0 +1,267 @@
+"""
+Screen the free text of surveys for personal information as they are loaded.
+
+Every comment_* column of a survey is run through scrubadub, and the
+scrubbed text is stored in screened_surveys along with the kinds of
+personal information found. Surveys with pii have their pii count in
+survey_priority raised, so they go straight to priority 8 and are never
+offered to coders.
+
+Scrubbing is CPU bound, so it is spread over a pool of worker processes,
+each of which builds a single Scrubber and reuses it. Many comments are
+repeated word for word ('no', 'n/a', 'none'), so results are memoised by
+a hash of the text, and only text that has not been seen before is sent to
+the pool.
+"""
+
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from . import db
+from .bulk import copy_rows
+from .models import Raw
+
+COMMENT_COLUMNS = [
+    column.name for column in Raw.__table__.columns
+    if column.name.startswith('comment_')]
+
+# The Scrubber used by a worker process, built once by init_worker()
+
+_scrubber = None
+
+
+def make_scrubber(skip_detectors=()):
+    '''Create a Scrubber without the named detectors'''
+    from scrubadub import Scrubber
+    scrubber = Scrubber()
+    for name in skip_detectors:
+        scrubber.remove_detector(name)
+    return scrubber
+
+
+def init_worker(skip_detectors):
+    global _scrubber
+    _scrubber = make_scrubber(skip_detectors)
+
+
+def scrub(text, scrubber=None):
+    '''
+    Replace the personal information in text with placeholders.
+
+    Returns a tuple of the scrubbed text and a sorted tuple of the kinds of
+    personal information found, e.g. ('email', 'phone').
+    '''
+
+    scrubber = scrubber or _scrubber
+
+    # The same as Scrubber.clean(), but keeping the filth that was found,
+    # so the text only has to be searched once
+
+    chunks = []
+    types = set()
+    end = 0
+    for filth in scrubber.iter_filth(text):
+        chunks.append(text[end:filth.beg])
+        chunks.append(filth.replace_with())
+        end = filth.end
+        types.update(i.type for i in getattr(filth, 'filths', [filth]))
+    chunks.append(text[end:])
+    return ''.join(chunks), tuple(sorted(types))
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+class PiiScreen(object):
+    '''
+    Scrub survey comments in a pool of worker processes, remembering the
+    results for the most recent cache_size distinct pieces of text.
+
+    With workers=0 the text is scrubbed in this process instead. Use as a
+    context manager, or call close(), to shut the pool down.
+    '''
+
+    def __init__(self, workers=None, cache_size=100000,
+                 skip_detectors=(), min_pool_size=50):
+        self.workers = multiprocessing.cpu_count() if workers is None \
+            else workers
+        self.cache_size = cache_size
+        self.skip_detectors = tuple(skip_detectors)
+        self.min_pool_size = min_pool_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._pool = None
+        self._scrubber = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(workers=config['FLASKY_PII_WORKERS'],
+                   cache_size=config['FLASKY_PII_CACHE_SIZE'],
+                   skip_detectors=config['FLASKY_PII_SKIP_DETECTORS'])
+
+    def _scrub_all(self, texts):
+        if self.workers and len(texts) >= self.min_pool_size:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(
+                    self.workers, init_worker, (self.skip_detectors,))
+            chunksize = max(1, len(texts) // (self.workers * 4))
+            return self._pool.map(scrub, texts, chunksize)
+
+        # Small batches are not worth the round trip to the pool
+
+        if self._scrubber is None:
+            self._scrubber = make_scrubber(self.skip_detectors)
+        return [scrub(text, self._scrubber) for text in texts]
+
+    def screen(self, texts):
+        '''
+        Scrub a list of texts. Returns a list of (scrubbed text, pii types)
+        tuples in the same order. Empty text is returned as it is.
+        '''
+
+        results = {}
+        todo = OrderedDict()
+        for text in texts:
+            if not text:
+                continue
+            key = text_key(text)
+            if key in results or key in todo:
+                continue
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                results[key] = self._cache[key]
+                self.hits += 1
+            else:
+                todo[key] = text
+                self.misses += 1
+
+        for key, result in zip(todo, self._scrub_all(list(todo.values()))):
+            results[key] = result
+            self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return [(text, ()) if not text else results[text_key(text)]
+                for text in texts]
+
+    def screen_rows(self, columns, rows):
+        '''
+        Scrub the comment columns of rows, which are tuples in the order of
+        columns followed by a line number, as passed to
+        app.ingest.merge_rows(). A survey which appears more than once is
+        screened from the row with the highest line number.
+
+        Returns a list of rows for screened_surveys, in the order of
+        screened_columns(columns).
+        '''
+
+        respondent_id = columns.index('respondent_id')
+        comments = [columns.index(i) for i in COMMENT_COLUMNS if i in columns]
+        if not comments:
+            return []
+
+        latest = {}
+        for row in rows:
+            current = latest.get(row[respondent_id])
+            if current is None or row[-1] > current[-1]:
+                latest[row[respondent_id]] = row
+        surveys = list(latest.values())
+
+        texts = [survey[i] for survey in surveys for i in comments]
+        results = iter(self.screen(texts))
+
+        screened = []
+        for survey in surveys:
+            scrubbed = []
+            types = set()
+            for i in comments:
+                text, found = next(results)
+                scrubbed.append(text)
+                types.update(found)
+            screened.append(
+                (survey[respondent_id],) + tuple(scrubbed) +
+                (bool(types), '{%s}' % ','.join(sorted(types))))
+        return screened
+
+    def save(self, columns, rows):
+        '''
+        Screen rows (see screen_rows()) which have just been merged into raw,
+        store the results in screened_surveys and raise the pii count in
+        survey_priority of surveys where pii is found for the first time.
+        The caller is responsible for committing.
+
+        Returns the number of surveys found to contain pii.
+        '''
+
+        screened = self.screen_rows(columns, rows)
+        if not screened:
+            return 0
+        names = screened_columns(columns)
+
+        db.session.execute(
+            'create temporary table screened_staging '
+            '(like screened_surveys) on commit drop')
+        copy_rows('screened_staging', names, screened)
+
+        # Once a survey is found to contain pii it stays flagged, even if a
+        # corrected version is loaded later
+
+        db.session.execute(RAISE_PRIORITY)
+        db.session.execute(SAVE.format(
+            columns=', '.join(names),
+            updates=', '.join('%s = excluded.%s' % (i, i) for i in names
+                              if i not in ('respondent_id', 'pii'))))
+        return db.session.execute(
+            'select count(*) from screened_staging where pii').scalar()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'cached': len(self._cache),
+            'hit_rate': float(self.hits) / lookups if lookups else None}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def screened_columns(columns):
+    '''The screened_surveys columns written for rows with these columns'''
+    return ['respondent_id'] + [i for i in COMMENT_COLUMNS if i in columns] \
+        + ['pii', 'pii_types']
+
+
+RAISE_PRIORITY = '''
+update survey_priority sp
+set pii = coalesce(sp.pii, 0) + 1,
+    priority = 8
+from screened_staging s
+where sp.respondent_id = s.respondent_id
+and s.pii
+and not exists (
+    select 1 from screened_surveys ss
+    where ss.respondent_id = s.respondent_id
+    and ss.pii)
+'''
+
+SAVE = '''
+insert into screened_surveys ({columns}, screened)
+select {columns}, now()
+from screened_staging
+on conflict (respondent_id) do update
+set {updates},
+    pii = screened_surveys.pii or excluded.pii,
+    screened = excluded.screened
+'''
@@ -0,0 +1,52 @@
+"""
+Maintain the survey_priority table, the stored equivalent of the priority
+view (sql/views/priority.sql).
+
+The table is kept up to date by the triggers in sql/triggers/priority.sql,
+so that selecting the next survey does not need to recompute the vote state
+of every survey from the classified table.
+"""
+
+import os
+from . import db
+from .queryloader import query_loader
+
+SQL_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'sql')
+
+
+def sql_file(*path):
+    '''Return the absolute path of a file in the sql directory'''
+    return os.path.join(SQL_DIR, *path)
+
+
+def create_priority_triggers():
+    '''
+    Create (or replace) the functions and triggers which maintain the
+    survey_codes and survey_priority tables.
+    '''
+    db.session.execute(query_loader(sql_file('triggers', 'priority.sql')))
+    db.session.commit()
+
+
+def rebuild_priority():
+    '''
+    Recalculate survey_codes and survey_priority from raw and classified.
+
+    Returns the number of surveys in survey_priority.
+    '''
+    db.session.execute(query_loader(sql_file('rollups', 'rebuild_priority.sql')))
+    db.session.commit()
+    return db.session.execute('select count(*) from survey_priority').scalar()
+
+
+def check_priority():
+    '''
+    Compare survey_priority with the priority view.
+
+    Returns a list of rows which differ between the two. Each row has a
+    'source' of 'view' or 'table' saying where that version came from. An
+    empty list means the two agree.
+    '''
+    query = query_loader(sql_file('rollups', 'check_priority.sql'))
+    return db.session.execute(query).fetchall()
@@ -0,0 +1,220 @@
+"""
+A sampling profiler which can be pointed at live traffic without restarting
+the workers.
+
+While a request chosen for profiling is being answered, a background thread
+in the worker looks at its stack every few milliseconds and counts each
+distinct stack, per endpoint. That costs the request nothing, unlike
+running cProfile over it (python manage.py profile), so it can be left on
+for a share of real requests.
+
+Which requests are profiled is set from the Profiler page (admins only) and
+kept in settings.json in FLASKY_PROFILE_DIR, which every worker reads again
+every second: an endpoint, a user, the percentage of requests, and the
+sampling interval. Each worker writes its counts to the same directory in
+the collapsed stack format ('frame;frame;frame count' on each line), and
+the page merges the workers' files for download. The files can be opened
+in speedscope (https://www.speedscope.app) or turned into a flamegraph with
+flamegraph.pl.
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+from flask_login import current_user
+
+DEFAULTS = {'enabled': False, 'endpoint': '', 'user': '', 'percent': 100,
+            'interval_ms': 5, 'generation': 0}
+
+SETTINGS = 'settings.json'
+
+
+def frame_name(frame):
+    code = frame.f_code
+    path = code.co_filename.split(os.sep)
+    return '%s (%s:%d)' % (
+        code.co_name, '/'.join(path[-2:]), code.co_firstlineno)
+
+
+def collapse(frame):
+    '''A stack as one line, from the outermost frame in'''
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def profile_name(endpoint):
+    return re.sub(r'[^\w.-]', '_', endpoint or 'none')
+
+
+class Sampler(object):
+    '''Samples the stacks of the requests being profiled in this worker'''
+
+    def __init__(self):
+        self.directory = None
+        self.settings = dict(DEFAULTS)
+        self.settings_checked = 0
+        self.active = {}
+        self.stacks = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.last_flush = 0
+
+    def init_app(self, app):
+        self.directory = app.config['FLASKY_PROFILE_DIR']
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    # Settings, shared by every worker
+
+    def settings_path(self):
+        return os.path.join(self.directory, SETTINGS)
+
+    def use_settings(self, settings):
+        if settings['generation'] != self.settings['generation']:
+            with self.lock:
+                self.stacks = {}
+        self.settings = settings
+
+    def load_settings(self):
+        '''
+        Read the settings again, at most once a second. The file is small, and
+        is read whether or not its mtime has changed, as two saves within the
+        filesystem's mtime resolution would look the same.
+        '''
+        now = time.time()
+        if now - self.settings_checked < 1:
+            return self.settings
+        self.settings_checked = now
+        try:
+            with open(self.settings_path()) as f:
+                settings = dict(DEFAULTS, **json.load(f))
+        except (OSError, ValueError):
+            return self.settings
+        self.use_settings(settings)
+        return self.settings
+
+    def save_settings(self, **settings):
+        '''Change the settings for every worker'''
+        settings = dict(self.load_settings(), **settings)
+        partial = self.settings_path() + '.%d.tmp' % os.getpid()
+        with open(partial, 'w') as f:
+            json.dump(settings, f)
+        os.replace(partial, self.settings_path())
+        self.use_settings(settings)
+        self.settings_checked = time.time()
+        return self.settings
+
+    def clear(self):
+        '''Throw away the samples taken so far, in every worker'''
+        self.save_settings(generation=self.settings['generation'] + 1)
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.collapsed'):
+                os.remove(os.path.join(self.directory, filename))
+
+    # Choosing and sampling requests
+
+    def wanted(self):
+        settings = self.load_settings()
+        if not settings['enabled']:
+            return False
+        if settings['endpoint'] and settings['endpoint'] != request.endpoint:
+            return False
+        if settings['user'] and not (
+                current_user.is_authenticated and settings['user'] in (
+                    current_user.username, current_user.email)):
+            return False
+        return random.random() * 100 < settings['percent']
+
+    def before_request(self):
+        if self.directory and self.wanted():
+            self.active[threading.get_ident()] = request.endpoint
+            self.start()
+            self.wake.set()
+
+    def teardown_request(self, exception=None):
+        if self.active.pop(threading.get_ident(), None) is not None:
+            self.flush()
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='sampler', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            if not self.active:
+                self.wake.wait(1)
+                self.wake.clear()
+                continue
+            time.sleep(self.settings['interval_ms'] / 1000.0)
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, endpoint in list(self.active.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = collapse(frame)
+                with self.lock:
+                    self.stacks.setdefault(endpoint, Counter())[stack] += 1
+
+    # Profiles
+
+    def flush(self, force=False):
+        '''Write this worker's counts, at most every few seconds'''
+        now = time.time()
+        if not force and now - self.last_flush < 5:
+            return
+        self.last_flush = now
+        with self.lock:
+            stacks = dict((endpoint, Counter(counts))
+                          for endpoint, counts in self.stacks.items())
+        for endpoint, counts in stacks.items():
+            path = os.path.join(self.directory, '%s.%d.collapsed' % (
+                profile_name(endpoint), os.getpid()))
+            with open(path + '.tmp', 'w') as f:
+                for stack, count in counts.items():
+                    f.write('%s %d\n' % (stack, count))
+            os.replace(path + '.tmp', path)
+
+    def profiles(self):
+        '''The number of samples of each endpoint, over every worker'''
+        self.flush(force=True)
+        samples = Counter()
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.collapsed'):
+                with open(os.path.join(self.directory, filename)) as f:
+                    samples[filename.rsplit('.', 2)[0]] += sum(
+                        int(line.rsplit(' ', 1)[1]) for line in f)
+        return sorted(samples.items())
+
+    def collapsed(self, name):
+        '''The merged collapsed stacks of an endpoint, over every worker'''
+        self.flush(force=True)
+        counts = Counter()
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.collapsed') and \
+                    filename.rsplit('.', 2)[0] == name:
+                with open(os.path.join(self.directory, filename)) as f:
+                    for line in f:
+                        stack, count = line.rsplit(' ', 1)
+                        counts[stack] += int(count)
+        return ''.join('%s %d\n' % item for item in sorted(counts.items()))
+
+
+sampler = Sampler()
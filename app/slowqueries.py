@@ -0,0 +1,224 @@
+"""
+Keep the statements which were slower than FLASKY_SLOW_DB_QUERY_TIME, with
+their plans, so admins can see why a page was slow after the event.
+
+Each statement is fingerprinted by taking out its comments, literals and
+parameters, so that every run of the same statement is counted together in
+slow_queries. Every slow run is counted, but only a sample of them
+(FLASKY_SLOW_QUERY_SAMPLE_RATE) is logged and considered for a plan: the
+first FLASKY_SLOW_QUERY_PLANS sampled runs of each, and one a day after that
+(FLASKY_SLOW_QUERY_REPLAN_HOURS), are explained and the plans kept in
+slow_query_plans, so that plans can be compared as the data grows.
+Read-only SELECTs are run again under EXPLAIN (ANALYZE, BUFFERS) in a
+transaction which is rolled back. Statements which change data are only
+planned, with EXPLAIN: running them again would take their locks and
+advance sequences, and CLAIM would hide the surveys it locks from coders
+claiming at the same time.
+
+Slow statements are only put on a queue in the request thread: a
+background thread in each worker does the counting and explaining, with
+its own database session.
+"""
+
+import hashlib
+import json
+import queue
+import re
+import threading
+from flask import current_app
+from . import db
+
+RULES = [
+    (re.compile(r'--[^\n]*'), ''),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+# Only these can be explained
+
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+# Statements which change data or lock rows, once normalised
+
+WRITES = re.compile(r'\b(?:insert|update|delete|for share|for key share)\b')
+
+RECORD = '''
+insert into slow_queries (fingerprint, statement, example, endpoint, count,
+                          total_seconds, max_seconds, durations, first_seen,
+                          last_seen)
+values (:fingerprint, :statement, :example, :endpoint, 1, :duration,
+        :duration, array[cast(:duration as float)], now(), now())
+on conflict (fingerprint) do update set
+    count = slow_queries.count + 1,
+    total_seconds = slow_queries.total_seconds + excluded.total_seconds,
+    max_seconds = greatest(slow_queries.max_seconds, excluded.max_seconds),
+    durations = (slow_queries.durations || excluded.durations)[
+        greatest(array_length(slow_queries.durations, 1) - :keep + 2, 1):
+        array_length(slow_queries.durations, 1) + 1],
+    endpoint = excluded.endpoint,
+    last_seen = now()
+'''
+
+NEEDS_PLAN = '''
+select count(*) < :plans
+       or coalesce(max(captured), now()) < now() - :hours * interval '1 hour'
+from slow_query_plans
+where fingerprint = :fingerprint
+'''
+
+SAVE_PLAN = '''
+insert into slow_query_plans (fingerprint, captured, duration, execution_ms,
+                              total_cost, plan)
+values (:fingerprint, now(), :duration, :execution_ms, :total_cost, :plan)
+'''
+
+WORST = '''
+select q.fingerprint, q.statement, q.endpoint, q.count, q.total_seconds,
+       q.max_seconds, q.last_seen, d.p50, d.p95,
+       (select count(*) from slow_query_plans p
+        where p.fingerprint = q.fingerprint) as plans
+from slow_queries q
+cross join lateral (
+    select percentile_cont(0.5) within group (order by duration) as p50,
+           percentile_cont(0.95) within group (order by duration) as p95
+    from unnest(q.durations) duration) d
+order by q.total_seconds desc
+limit :limit
+'''
+
+
+def normalise(statement):
+    '''A statement with its comments, literals and parameters taken out'''
+    statement = statement.lower()
+    for pattern, replacement in RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def fingerprint(statement):
+    '''The fingerprint of the normalised statement'''
+    return hashlib.sha1(normalise(statement).encode('utf-8')).hexdigest()
+
+
+def read_only(statement):
+    '''Whether a statement is a SELECT which neither changes nor locks rows'''
+    statement = normalise(statement)
+    return statement.startswith('select') and not WRITES.search(statement)
+
+
+def explain(statement, parameters, timeout):
+    '''
+    Explain a statement on a connection of its own, and roll back. Read-only
+    statements are run under EXPLAIN (ANALYZE, BUFFERS); others are only
+    planned. Returns the plan, parsed from JSON.
+    '''
+    options = 'analyze, buffers, ' if read_only(statement) else ''
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('set local statement_timeout = %d'
+                       % int(timeout * 1000))
+        cursor.execute(
+            'explain (%sformat json) %s' % (options, statement), parameters)
+        plan = cursor.fetchone()[0]
+    finally:
+        connection.rollback()
+        connection.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan
+
+
+class SlowQueryStore(object):
+    '''A queue of slow statements, and the thread which saves them'''
+
+    def __init__(self, size=1000):
+        self.queue = queue.Queue(size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def record(self, statement, parameters, duration, endpoint,
+               executemany=False, sampled=True):
+        '''
+        Queue a slow statement to be saved, without waiting for it. Only
+        sampled statements are explained.
+        '''
+
+        # The thread's own statements are not recorded, or a slow one would
+        # be explained again and again
+
+        if threading.current_thread() is self.thread:
+            return
+        self.start(current_app._get_current_object())
+        try:
+            self.queue.put_nowait((
+                statement, None if executemany else parameters, duration,
+                endpoint, executemany, sampled))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self, app):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, args=(app,), name='slow-queries',
+                    daemon=True)
+                self.thread.start()
+
+    def run(self, app):
+        with app.app_context():
+            while True:
+                item = self.queue.get()
+                try:
+                    self.save(*item)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Could not save a slow query')
+
+    def save(self, statement, parameters, duration, endpoint=None,
+             executemany=False, sampled=True):
+        '''
+        Count a slow run of a statement, and capture its plan if the run was
+        sampled and the statement needs one. Returns the fingerprint.
+        '''
+        config = current_app.config
+        key = fingerprint(statement)
+        db.session.execute(RECORD, {
+            'fingerprint': key, 'statement': normalise(statement),
+            'example': statement, 'endpoint': endpoint,
+            'duration': duration, 'keep': config['FLASKY_SLOW_QUERY_KEEP']})
+        db.session.commit()
+
+        if not sampled or executemany or not \
+                statement.lstrip().lower().startswith(EXPLAINABLE):
+            return key
+        if not db.session.execute(NEEDS_PLAN, {
+                'fingerprint': key,
+                'plans': config['FLASKY_SLOW_QUERY_PLANS'],
+                'hours': config['FLASKY_SLOW_QUERY_REPLAN_HOURS']}).scalar():
+            db.session.rollback()
+            return key
+
+        plan = explain(statement, parameters,
+                       config['FLASKY_SLOW_QUERY_EXPLAIN_TIMEOUT'])
+        db.session.execute(SAVE_PLAN, {
+            'fingerprint': key, 'duration': duration,
+            'execution_ms': plan[0].get('Execution Time'),
+            'total_cost': plan[0]['Plan'].get('Total Cost'),
+            'plan': json.dumps(plan, indent=2)})
+        db.session.commit()
+        return key
+
+
+slow_queries = SlowQueryStore()
+
+
+def worst_queries(limit=50):
+    '''The slow statements which have taken the most time altogether'''
+    return db.session.execute(WORST, {'limit': limit}).fetchall()
@@ -0,0 +1,168 @@
+"""
+Save generated datasets to disk and load them again, so that tests and
+benchmarks which need a lot of data do not have to generate it every time.
+
+A snapshot is a directory holding one gzipped file per table, in COPY's
+text format, and a manifest listing the columns and row counts. Snapshots
+are kept in FLASKY_SNAPSHOT_DIR, named after the schema revision (the head
+of migrations/), the number of surveys and the seed, so a snapshot is never
+loaded into a schema it was not taken from: after a migration the dataset
+is generated again.
+
+The tables the triggers maintain (survey_priority, survey_codes and
+coder_daily_counts) are saved along with everything else, and the triggers
+are switched off while loading, so nothing has to be rebuilt afterwards.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import time
+from contextlib import ExitStack
+from alembic.script import ScriptDirectory
+from flask import current_app
+from . import db
+from .bulk import copy_buffer
+from .fakedata import fake_dataset, triggers_disabled
+from .priority import sql_file
+from .queryloader import query_loader
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'migrations')
+
+# In the order they are loaded, so that foreign keys are satisfied
+
+TABLES = ['roles', 'users', 'codes', 'project_codes', 'raw', 'classified',
+          'screened_surveys', 'survey_codes', 'survey_priority',
+          'coder_daily_counts']
+
+VIEWS = ['priority.sql', 'leaders.sql']
+
+MANIFEST = 'manifest.json'
+
+
+def schema_revision():
+    '''The revision the migrations in migrations/ bring the schema up to'''
+    return ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+
+
+def snapshot_path(count, seed):
+    return os.path.join(
+        current_app.config['FLASKY_SNAPSHOT_DIR'],
+        '%s-%d-%d' % (schema_revision(), count, seed))
+
+
+def quoted(names):
+    '''Names joined for a column list, quoted where need be (as "default")'''
+    quote = db.engine.dialect.identifier_preparer.quote
+    return ', '.join(quote(name) for name in names)
+
+
+def table_columns(table):
+    result = db.session.execute(
+        'select column_name from information_schema.columns '
+        'where table_name = :table order by ordinal_position',
+        {'table': table})
+    return [row.column_name for row in result]
+
+
+def save_snapshot(count, seed):
+    '''
+    Generate a dataset of count surveys from seed (replacing all surveys,
+    classifications and codes in the database) and save it as a snapshot.
+    Returns the manifest.
+    '''
+
+    fake_dataset(count, seed)
+    path = snapshot_path(count, seed)
+
+    # Write to a temporary directory and rename it, so that a snapshot which
+    # failed half way through is never loaded
+
+    partial = path + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    manifest = {'revision': schema_revision(), 'count': count, 'seed': seed,
+                'tables': {}}
+    cursor = db.session.connection().connection.cursor()
+    try:
+        for table in TABLES:
+            columns = table_columns(table)
+
+            # Light compression is much quicker to write, and reads back
+            # as quickly as any other level
+
+            with gzip.open(os.path.join(partial, table + '.gz'), 'wt',
+                           compresslevel=1) as f:
+                cursor.copy_expert('copy %s (%s) to stdout' % (
+                    table, quoted(columns)), f)
+            manifest['tables'][table] = {
+                'columns': columns,
+                'rows': db.session.execute(
+                    'select count(*) from %s' % table).scalar()}
+    finally:
+        cursor.close()
+
+    with open(os.path.join(partial, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(partial, path)
+    db.session.commit()
+    return manifest
+
+
+def reset_sequences(table, columns):
+    '''Move the sequences of serial columns on past the loaded rows'''
+    for column in columns:
+        sequence = db.session.execute(
+            'select pg_get_serial_sequence(:table, :column)',
+            {'table': table, 'column': column}).scalar()
+        if sequence:
+            db.session.execute(
+                'select setval(:sequence, coalesce(max(%s), 0) + 1, false) '
+                'from %s' % (quoted([column]), table), {'sequence': sequence})
+
+
+def create_views():
+    for view in VIEWS:
+        db.session.execute(query_loader(sql_file('views', view)))
+
+
+def load_snapshot(count, seed, views=True):
+    '''
+    Replace the data in the database with the snapshot of count surveys
+    from seed, saving one first if there is none, and create the views from
+    sql/views unless views is False (as in the tests, where db.create_all()
+    makes tables of the same names). Returns the manifest, with the seconds
+    taken to load it.
+
+    The users and roles are replaced as well, as the classifications refer
+    to the snapshot's users: every user account in the database is deleted.
+    '''
+
+    path = snapshot_path(count, seed)
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        save_snapshot(count, seed)
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    start = time.perf_counter()
+    db.session.execute('truncate %s cascade' % ', '.join(TABLES))
+    with ExitStack() as stack:
+        for table in TABLES:
+            stack.enter_context(triggers_disabled(table))
+        for table in TABLES:
+            columns = manifest['tables'][table]['columns']
+            with gzip.open(os.path.join(path, table + '.gz'), 'rt') as f:
+                copy_buffer(db.session, 'copy %s (%s) from stdin' % (
+                    table, quoted(columns)), f)
+            reset_sequences(table, columns)
+    if views:
+        create_views()
+    db.session.commit()
+    db.session.execute('analyze')
+    db.session.commit()
+
+    manifest['seconds'] = time.perf_counter() - start
+    return manifest
@@ -0,0 +1,199 @@
+"""
+Hand out surveys to coders from the survey_priority table.
+
+Every survey handed to a coder is leased to them for
+FLASKY_SURVEY_LEASE_TIME seconds. Until the lease is released (when the
+survey is classified) or expires, no other coder will be offered that
+survey, so two coders loading the page at the same moment get different
+surveys. Leases are held in the database, so this works across any number of
+gunicorn workers and app instances.
+"""
+
+import time
+from datetime import datetime
+from flask import current_app
+from . import db
+from .metrics import SELECTION_SECONDS, CLASSIFICATIONS
+from .models import Classified
+from .tracing import span
+
+# Candidate surveys are locked with FOR UPDATE SKIP LOCKED, so that concurrent
+# claims pass over each other's candidates instead of waiting for them. A
+# coder's own unexpired leases are returned first, so reloading the page
+# shows the same survey again. Ties are broken by respondent_id, newest
+# first, so the order is always the same.
+# If a concurrent claim wins the race for a survey, the ON CONFLICT clause
+# leaves its lease alone and that survey is simply not returned here.
+
+CLAIM = '''
+with candidates as (
+    select sp.respondent_id,
+        sp.month,
+        sp.priority,
+        (l.coder_id = :coder_id and l.leased_until > now()) as mine
+    from survey_priority sp
+    left join survey_leases l
+    on (sp.respondent_id = l.respondent_id)
+    where sp.priority < 6
+    and (l.respondent_id is null
+         or l.leased_until <= now()
+         or l.coder_id = :coder_id)
+    and not exists (
+        select 1 from classified c
+        where c.respondent_id = sp.respondent_id
+        and c.coder_id = :coder_id)
+    order by mine desc nulls last, sp.month desc, sp.priority,
+        sp.respondent_id desc
+    limit :count
+    for update of sp skip locked
+),
+leased as (
+    insert into survey_leases (respondent_id, coder_id, leased_until)
+    select respondent_id, :coder_id, now() + :ttl * interval '1 second'
+    from candidates
+    on conflict (respondent_id) do update
+    set coder_id = excluded.coder_id,
+        leased_until = excluded.leased_until
+    where survey_leases.leased_until <= now()
+    or survey_leases.coder_id = excluded.coder_id
+    returning respondent_id
+)
+select candidates.respondent_id
+from candidates
+inner join leased
+on (candidates.respondent_id = leased.respondent_id)
+order by candidates.mine desc nulls last, candidates.month desc,
+    candidates.priority, candidates.respondent_id desc
+'''
+
+RELEASE = '''
+delete from survey_leases
+where coder_id = :coder_id
+and respondent_id = any(:respondent_ids)
+'''
+
+# Checking a lease and releasing it in one statement means that a lease
+# cannot expire, and be claimed by another coder, in between: the row is
+# either deleted here or already belongs to someone else.
+
+TAKE = '''
+delete from survey_leases
+where coder_id = :coder_id
+and respondent_id = any(:respondent_ids)
+and leased_until > now()
+returning respondent_id
+'''
+
+
+def claim_surveys(coder_id, count=1, ttl=None):
+    '''
+    Lease up to count surveys to a coder, highest priority first.
+
+    Surveys the coder has already classified, and surveys leased to other
+    coders, are never returned. The leases are committed straight away so
+    that they are visible to every other worker.
+
+    Returns a list of respondent_ids, which is empty when there is nothing
+    left for this coder.
+    '''
+
+    if ttl is None:
+        ttl = current_app.config['FLASKY_SURVEY_LEASE_TIME']
+
+    start = time.perf_counter()
+    with span('select'):
+        result = db.session.execute(
+            CLAIM, {'coder_id': coder_id, 'count': count, 'ttl': ttl})
+        respondent_ids = [row.respondent_id for row in result]
+        db.session.commit()
+    SELECTION_SECONDS.observe(time.perf_counter() - start)
+    return respondent_ids
+
+
+def new_survey(coder_id):
+    '''
+    Select the next survey for a coder: ensures that a coder doesn't see the
+    same survey more than once, and that two coders are not shown the same
+    survey at the same time.
+
+    Returns a respondent_id, or None when there is nothing left to code.
+    '''
+
+    # Try a second time in case every candidate was taken by concurrent
+    # claims, rather than telling the coder that they are all caught up.
+
+    for attempt in range(2):
+        respondent_ids = claim_surveys(coder_id)
+        if respondent_ids:
+            return respondent_ids[0]
+    return None
+
+
+def take_leases(coder_id, respondent_ids):
+    '''
+    Release a coder's unexpired leases on some surveys, and return the subset
+    of respondent_ids which were leased to them. The caller is responsible
+    for committing.
+    '''
+    result = db.session.execute(
+        TAKE, {'coder_id': coder_id, 'respondent_ids': list(respondent_ids)})
+    return set(row.respondent_id for row in result)
+
+
+def release_surveys(coder_id, respondent_ids):
+    '''
+    Give up a coder's leases on some surveys, e.g. once they have been
+    classified. The caller is responsible for committing.
+    '''
+    db.session.execute(
+        RELEASE,
+        {'coder_id': coder_id, 'respondent_ids': list(respondent_ids)})
+
+
+def classify_surveys(coder_id, classifications):
+    '''
+    Release the leases on the surveys leased to a coder, and save their
+    classifications of them, with a single bulk insert and commit.
+
+    classifications is a list of dicts with respondent_id, code_id,
+    project_code_id and pii keys. Classifications of surveys which are no
+    longer leased to the coder are not saved: their lease has expired and
+    they may already be in front of someone else.
+
+    Returns the list of respondent_ids which were saved.
+    '''
+
+    leased = take_leases(
+        coder_id, [i['respondent_id'] for i in classifications])
+    date_coded = '{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.now())
+
+    rows = []
+    for i in classifications:
+
+        # Each lease pays for one classification only
+
+        if i['respondent_id'] in leased:
+            leased.discard(i['respondent_id'])
+            rows.append(dict(
+                respondent_id=i['respondent_id'],
+                code_id=i['code_id'],
+                project_code_id=i['project_code_id'],
+                pii=i['pii'],
+                date_coded=date_coded,
+                coder_id=coder_id))
+
+    saved = [row['respondent_id'] for row in rows]
+
+    db.session.bulk_insert_mappings(Classified, rows)
+    db.session.commit()
+    CLASSIFICATIONS.inc(len(saved))
+
+    return saved
+
+
+def purge_expired_leases():
+    '''Delete expired leases. Returns the number of leases removed.'''
+    result = db.session.execute(
+        'delete from survey_leases where leased_until <= now()')
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,160 @@
+"""
+Pull new surveys from the survey provider's API into raw as they arrive.
+
+The provider lists responses a page at a time, oldest first:
+
+GET <SURVEY_PROVIDER_URL>/responses?since=<end_date>&page=<n>&per_page=<m>
+
+{"page": 1, "per_page": 100, "total": 1234,
+ "data": [{"respondent_id": ..., "end_date": "2017-05-01T10:05:00", ...}]}
+
+Responses are ordered by end_date then respondent_id, and since limits them
+to those which ended at or after end_date. Their fields are matched to raw
+columns in the same way as the columns of an export (see app/ingest.py).
+
+The end_date and respondent_id of the last survey loaded are kept in the
+checkpoints table, so each run only asks for surveys which ended since then.
+Pages are fetched concurrently, but loaded and checkpointed in order, so a
+run which fails part way through carries on from the last page it loaded.
+"""
+
+import math
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from . import db
+from .apiclient import ApiClient
+from .autocode import automated_ids, code_nones
+from .ingest import RowConverter, map_columns, merge_rows
+from .models import Checkpoint
+from .piiscreen import PiiScreen
+
+
+def provider_client(config):
+    '''Create an ApiClient for the survey provider from the app settings'''
+    headers = {}
+    if config['SURVEY_PROVIDER_TOKEN']:
+        headers['Authorization'] = 'Bearer %s' % (
+            config['SURVEY_PROVIDER_TOKEN'])
+    return ApiClient(
+        workers=config['FLASKY_SYNC_WORKERS'],
+        rate=config['FLASKY_SYNC_RATE'],
+        timeout=config['FLASKY_LOOKUP_TIMEOUT'],
+        retries=config['FLASKY_LOOKUP_RETRIES'],
+        headers=headers)
+
+
+def fetch_pages(client, url, params, pages, first):
+    '''
+    Yield the data of each page of responses in order, starting with first
+    (the already fetched first page). Up to twice as many pages as the
+    client has workers are fetched ahead of the one being loaded.
+    '''
+    yield first['data']
+    with ThreadPoolExecutor(max_workers=client.workers) as executor:
+        futures = deque()
+        page = 2
+        while futures or page <= pages:
+            while page <= pages and len(futures) < client.workers * 2:
+                futures.append(executor.submit(
+                    client.get_json, url, dict(params, page=page)))
+                page += 1
+            yield futures.popleft().result()['data']
+
+
+def response_rows(data, start_line):
+    '''
+    Convert a page of responses into a RowConverter and (line, row) pairs
+    for it, with columns in order of first appearance.
+    '''
+    fields = list(OrderedDict.fromkeys(key for i in data for key in i))
+    convert = RowConverter(map_columns(fields))
+    rows = [
+        (start_line + n, ['' if i.get(key) is None else str(i.get(key))
+                          for key in fields])
+        for n, i in enumerate(data)]
+    return convert, rows
+
+
+def sync_surveys(client=None, page_size=None, progress=None,
+                 checkpoint_name='survey_sync', base_url=None):
+    '''
+    Load the surveys which have ended since the last sync into raw.
+
+    Each page is merged into raw (see app.ingest.merge_rows), screened for
+    personal information (see app.piiscreen), has its empty surveys coded
+    (see app.autocode) and is committed along with the new watermark: the
+    end_date and respondent_id of its last survey. Surveys at or before the
+    watermark are skipped, so overlapping pages do no harm.
+
+    progress, if given, is called with the running totals after each page.
+    client, page_size and base_url default to the app settings.
+
+    Returns a dict counting the surveys fetched, inserted, updated,
+    unchanged, skipped, rejected, found to contain pii and coded
+    automatically.
+    '''
+
+    config = current_app.config
+    if client is None:
+        client = provider_client(config)
+    if page_size is None:
+        page_size = config['FLASKY_SYNC_PAGE_SIZE']
+    url = (base_url or config['SURVEY_PROVIDER_URL']).rstrip('/') + \
+        '/responses'
+
+    checkpoint = Checkpoint.load(checkpoint_name)
+    params = {'per_page': page_size}
+    if checkpoint.end_date is not None:
+        params['since'] = checkpoint.end_date.isoformat()
+
+    totals = dict(fetched=0, inserted=0, updated=0, unchanged=0, skipped=0,
+                  rejected=0, pii=0, automated=0, errors=[])
+    ids = automated_ids()
+
+    first = client.get_json(url, dict(params, page=1))
+    pages = int(math.ceil(
+        float(first['total']) / (first.get('per_page') or page_size)))
+
+    with PiiScreen.from_config(config) as screen:
+        for data in fetch_pages(client, url, params, pages, first):
+            if not data:
+                continue
+            convert, numbered_rows = response_rows(data, totals['fetched'] + 1)
+            totals['fetched'] += len(data)
+
+            end_date = convert.columns.index('end_date') \
+                if 'end_date' in convert.columns else None
+            respondent_id = convert.columns.index('respondent_id')
+
+            watermark = (checkpoint.end_date, checkpoint.respondent_id or 0)
+            rows = []
+            for row in convert.rows(numbered_rows, totals):
+                if end_date is None or row[end_date] is None:
+                    rows.append(row)
+                    continue
+                mark = (row[end_date], row[respondent_id])
+                if watermark[0] is not None and mark <= watermark:
+                    totals['skipped'] += 1
+                    continue
+                rows.append(row)
+                if checkpoint.end_date is None or mark > (
+                        checkpoint.end_date, checkpoint.respondent_id or 0):
+                    checkpoint.end_date, checkpoint.respondent_id = mark
+
+            if rows:
+                for key, value in merge_rows(convert.columns, rows).items():
+                    totals[key] += value
+                totals['pii'] += screen.save(convert.columns, rows)
+                totals['automated'] += code_nones(
+                    convert.respondent_ids(rows), ids)
+
+            checkpoint.updated = datetime.utcnow()
+            db.session.add(checkpoint)
+            db.session.commit()
+
+            if progress is not None:
+                progress(totals)
+
+    return totals
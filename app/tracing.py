@@ -0,0 +1,148 @@
+"""
+Time the phases of each request, and report them in a Server-Timing header
+(shown by browser developer tools) and, with FLASKY_TRACE_LOG set, as one
+line of JSON per request in a trace log.
+
+A phase is timed with
+
+    with span('select'):
+        ...
+
+and records its duration and the number of database statements run during
+it (counted by app/metrics.py). Spans of the same name in one request are
+added together. Rendering templates and committing the session are timed
+everywhere, as 'render' and 'commit'; the views time their own phases,
+such as selecting a survey or loading the codes. Spans can overlap: the
+commit which saves a survey's lease is part of 'select' as well.
+"""
+
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import _request_ctx_stack, before_render_template, \
+    current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger('classify.trace')
+
+
+def add_span(name, duration, queries):
+    spans = g.get('spans')
+    if spans is None:
+        spans = g.spans = OrderedDict()
+    total = spans.get(name, (0, 0))
+    spans[name] = (total[0] + duration, total[1] + queries)
+
+
+def begin():
+    return time.perf_counter(), g.get('query_count', 0)
+
+
+def end(name, started):
+    start, queries = started
+    add_span(name, time.perf_counter() - start,
+             g.get('query_count', 0) - queries)
+
+
+@contextmanager
+def span(name):
+    '''Time a phase of the current request, if there is one'''
+    if not has_request_context():
+        yield
+        return
+    started = begin()
+    try:
+        yield
+    finally:
+        end(name, started)
+
+
+def before_render(sender, template, context, **extra):
+    g.render_started = begin()
+
+
+def after_render(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        end('render', started)
+
+
+def before_commit(session):
+    if has_request_context():
+        g.commit_started = begin()
+
+
+def after_commit(session):
+    if has_request_context():
+        started = g.pop('commit_started', None)
+        if started is not None:
+            end('commit', started)
+
+
+def server_timing(spans, total=None):
+    '''The Server-Timing header for spans of (seconds, queries)'''
+    parts = ['%s;dur=%.1f;desc="%d queries"' % (
+        name, duration * 1000, queries)
+        for name, (duration, queries) in spans.items()]
+    if total is not None:
+        parts.append('total;dur=%.1f' % (total * 1000))
+    return ', '.join(parts)
+
+
+def after_request(response):
+    if current_app.config['FLASKY_SERVER_TIMING']:
+        start = g.get('request_start')
+        total = None if start is None else time.perf_counter() - start
+        response.headers['Server-Timing'] = server_timing(
+            g.get('spans') or {}, total)
+    g.response_status = response.status_code
+    return response
+
+
+def teardown_request(exception=None):
+    '''Write the trace of the request to the trace log'''
+    if not logger.handlers:
+        return
+    start = g.get('request_start')
+
+    # The user if they were loaded, without loading them just for this
+
+    user = getattr(_request_ctx_stack.top, 'user', None)
+    logger.info(json.dumps(OrderedDict([
+        ('method', request.method),
+        ('path', request.path),
+        ('endpoint', request.endpoint),
+        ('status', g.get('response_status', 500)),
+        ('user_id', user.get_id() if user is not None else None),
+        ('duration_ms', None if start is None
+         else round((time.perf_counter() - start) * 1000, 2)),
+        ('queries', g.get('query_count')),
+        ('spans', [OrderedDict([
+            ('name', name), ('duration_ms', round(duration * 1000, 2)),
+            ('queries', queries)])
+            for name, (duration, queries) in
+            (g.get('spans') or {}).items()])])))
+
+
+def init_app(app):
+    '''Time templates and commits, and report the spans of each request'''
+    before_render_template.connect(before_render, app)
+    template_rendered.connect(after_render, app)
+    if not event.contains(Session, 'before_commit', before_commit):
+        event.listen(Session, 'before_commit', before_commit)
+        event.listen(Session, 'after_commit', after_commit)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+
+    path = app.config['FLASKY_TRACE_LOG']
+    if path and not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr) if path == '-' \
+            else logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
@@ -1,10 +1,20 @@
 # coding: utf-8
 
 import re
+import sys
 import requests
 import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
 import forgery_py
 
+GOVUK_URL = 'https://www.gov.uk'
+
+# The fields requested from the search API for each page
+
+SEARCH_FIELDS = ['organisations', 'mainstream_browse_pages']
+
 
 def random_url(attempts=5):
 
@@ -30,106 +40,324 @@ def random_url(attempts=5):
     return(r)
 
 
-def clean_url(x, UrlModel, query='\/?browse'):
+# The rules for cleaning a url, in priority order, as a single compiled
+# regular expression. Each alternative is anchored at the start of the url,
+# and the name of the group which matched says which rule applies:
+#
+# world:   an FCO /government/world/country page
+# govt:    /guidance or /government pages, which are kept whole
+# browse:  /browse pages, cut back to /browse/section
+# sitenav: the home page, search and help
+# contact: contact pages
+#
+# Anything else is cut back to its top level.
+
+URL_RULES = re.compile(
+    r'(?:(?=.*/government/world)(?P<world>)'
+    r'|(?=.*/(?:guidance|government))(?P<govt>)'
+    r'|(?=.*/browse)(?P<browse>)'
+    r'|(?P<sitenav>/\Z|/search|/help)'
+    r'|(?P<contact>/contact))', re.DOTALL)
+
+BROWSE_SECTION = re.compile('browse/')
+
+
+@lru_cache(maxsize=2 ** 17)
+def clean_page(full_url):
 
     '''
-    Clean the incoming URL according to rules.
-    Note that this is applied after the lookup on the gov.uk content API
+    Clean a url according to the rules in URL_RULES.
+    Returns a (page, org0, section0, section1) tuple.
+
+    Results are memoised, so repeated urls are only cleaned once.
     '''
 
+    rule = URL_RULES.match(full_url)
+    rule = rule.lastgroup if rule else None
+
     # If FCO government/world/country page:
     # Strip back to /government/world and
     # set org to FCO
 
-    url = UrlModel()
-    url.full_url = x.full_url
-    url.page = x.full_url
-
-    if re.search('/government/world', x.full_url):
-
-        url.org0 = 'Foreign & Commonwealth Office'
-        url.page = '/government/world'
+    if rule == 'world':
+        return('/government/world', 'Foreign & Commonwealth Office',
+               None, None)
 
     # If full_url starts with /guidance or /government:
-    # and there is no org (i.e. not the above)
     # Set page to equal full_url
 
-    elif re.search('\/guidance|\/government', x.full_url):
-        if url.org0 is None:
-            url.page = x.full_url
+    if rule == 'govt':
+        return(full_url, None, None, None)
 
     # If page starts with browse:
-    # set page to equal /browse/xxx/
+    # set page to equal /browse/xxx and section to be /browse/--this-bit--/
+
+    if rule == 'browse':
+        if BROWSE_SECTION.search(full_url):
+            parts = full_url.split('/', 3)
+            return('/' + parts[1] + '/' + parts[2], None, parts[2], None)
+        return(full_url, None, full_url, None)
 
-    elif re.search('\/browse', x.full_url):
-        url.page = reg_match(query, x.full_url, 1)
+    if rule == 'sitenav':
+        return(full_url, None, 'site-nav', 'site-nav')
 
-        # Set section to be /browse/--this-bit--/
+    if rule == 'contact':
+        return(full_url, None, 'contact', 'contact')
 
-        url.section0 = reg_match(query, x.full_url, 2)
+    # Otherwise:
+    # Strip back to the top level
 
-        # Otherwise:
-        # Strip back to the top level
+    if '/' in full_url:
+        return('/' + full_url.split('/', 3)[1], None, None, None)
+    return('/' + full_url, None, None, None)
 
-    elif ((x.full_url == '/') or re.search(
-            '^/search.*', x.full_url) or re.search('^/help.*', x.full_url)):
-                url.section0 = 'site-nav'
-                url.section1 = 'site-nav'
 
-    elif re.search('^/contact.*', x.full_url):
-        url.section0 = 'contact'
-        url.section1 = 'contact'
+def clean_pages(full_urls):
 
-    else:
-        url.page = '/' + reg_match('.*', x.full_url, 0)
+    '''
+    Clean a list or iterator of urls, returning an iterator of
+    (page, org0, section0, section1) tuples in the same order.
+    '''
 
-    # If none of the above apply, then simply return the Urls
-    # object with the same page
+    return(map(clean_page, full_urls))
 
+
+def clean_url(x, UrlModel):
+
+    '''
+    Clean the incoming URL according to rules, returning a UrlModel (i.e.
+    Urls) object. x can be anything with a full_url, such as a Raw object.
+    Note that this is applied after the lookup on the gov.uk content API
+
+    Use clean_page() or clean_pages() where the strings are all that is
+    needed.
+    '''
+
+    url = UrlModel()
+    url.full_url = x.full_url
+    url.page, url.org0, url.section0, url.section1 = clean_page(x.full_url)
     return(url)
 
 
-def api_lookup(Raw, Urls):
+def normalise_url(url):
+
+    '''
+    Drop the query string, fragment and any trailing slash from a url, so
+    that variations of the same page are looked up once.
+    '''
+
+    url = url.split('#', 1)[0].split('?', 1)[0].rstrip('/')
+    return(url or '/')
+
+
+# Where the fields of a get_org() record go in the urls table. There is no
+# org4 column, so the fifth organisation is dropped.
+
+RECORD_COLUMNS = [
+    ('org0', 0), ('org1', 1), ('org2', 2), ('org3', 3),
+    ('section0', 5), ('section1', 6), ('section2', 7), ('section3', 8)]
+
+
+def stream_full_urls(after=None, chunk_size=5000):
 
     '''
-    Run a lookup of Raw.full_url against the gov.uk content API
-    and store in the Urls table.
+    Yield the respondent_id and full_url of the surveys in raw with a
+    respondent_id above after (or of every survey, if after is None), in
+    respondent_id order, as lists of at most chunk_size rows.
 
-    This is run on the 'cleaned' pages which are produced by clean_urls
+    Only these two columns are read, through a server side cursor on a
+    connection of its own, so memory use does not grow with the size of
+    raw and the caller is free to commit as it goes.
     '''
 
-    print('***** Running api_lookup() method *****')
-    print('*** This may take some time depending on the number of URLS to look up')
+    from sqlalchemy import select
+    from . import db
+    from .models import Raw
 
-    # self.org_sect = [get_org(i) for i in self.data.loc[((self.data.section == 'nan') &(self.data.org == 'nan')),['page']]]
-    raw_urls = Raw.query.all()
+    query = select([Raw.respondent_id, Raw.full_url]).where(
+        Raw.full_url.isnot(None)).order_by(Raw.respondent_id)
+    if after is not None:
+        query = query.where(Raw.respondent_id > after)
 
-    [get_org(i) for i in self.unique_pages['page']]
-    self.org_sect = pd.DataFrame(self.org_sect, columns=column_names)
-    self.org_sect = self.org_sect.set_index(self.unique_pages.index)
+    with db.engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
 
-    # Convert any NaNs to none, so they are not dropped when
-    # self.trainer/predictor is run
 
-    self.org_sect['organisation0'].replace(
-        np.nan, 'none', regex=True, inplace=True)
-    self.org_sect['section0'].replace(np.nan, 'none', regex=True, inplace=True)
+def lookup_full_urls(full_urls, cutoff, engine, failures=None):
 
-    # Retain the full lookup, but only add a subset of it to the
-    # clean dataframe
+    '''
+    Look up the pages behind a list of distinct full_urls, and replace their
+    rows in the Urls table. The caller is responsible for committing.
 
-    org_sect = self.org_sect[['organisation0', 'section0']]
-    org_sect.columns = ['org', 'section']
+    Each full_url is cleaned (by clean_page) into a page, and each page is
+    looked up at most once. Pages which were looked up since cutoff are not
+    looked up again, nor are pages which clean_page already gives an
+    organisation or section. Urls rows for pages which could not be looked
+    up are left as they are, and their full_urls are added to failures, if
+    given.
+
+    Returns a dict counting the full_urls and pages involved.
+    '''
+
+    from sqlalchemy import or_
+    from . import db
+    from .models import Urls
+
+    cleaned = dict(zip(full_urls, clean_pages(
+        normalise_url(i) for i in full_urls)))
+
+    # Anything looked up since the cutoff is up to date, and can be copied
+    # to any other full_url for the same page
+
+    columns = [name for name, index in RECORD_COLUMNS]
+    fresh = {}
+    fresh_pages = {}
+    for row in db.session.query(
+            Urls.full_url, Urls.page, Urls.status,
+            *[getattr(Urls, name) for name in columns]).filter(
+                Urls.lookup_date >= cutoff).filter(or_(
+                    Urls.full_url.in_(full_urls),
+                    Urls.page.in_(list(set(
+                        i[0] for i in cleaned.values()))))):
+        fresh[row.full_url] = row
+        if row.status == 200:
+            fresh_pages[row.page] = row
+
+    stale = [i for i in full_urls if i not in fresh]
+
+    pages = set(
+        cleaned[i][0] for i in stale
+        if cleaned[i][1] is None and cleaned[i][2] is None and
+        cleaned[i][0] not in fresh_pages)
+
+    # Only this chunk's failures count: a page which failed in an earlier
+    # chunk may be looked up successfully now
+
+    engine.failed_pages.clear()
+    records = engine.lookup_many(sorted(pages))
+    failed = set(engine.failed_pages)
+
+    now = datetime.now()
+    rows = []
+    for full_url in stale:
+        page, org0, section0, section1 = cleaned[full_url]
+        row = dict(
+            full_url=full_url, page=page, org0=org0, section0=section0,
+            section1=section1, lookup_date=now, status=None)
+
+        if page in fresh_pages:
+            row.update((name, getattr(fresh_pages[page], name))
+                       for name in columns)
+            row['status'] = 200
+        elif page in records:
+            if page in failed:
+                if failures is not None:
+                    failures.add(full_url)
+                continue
+            record = records[page]
+            row.update(
+                (name, None if record[index] == 'null' else record[index])
+                for name, index in RECORD_COLUMNS)
+            row['status'] = 200
+
+        rows.append(row)
+
+    # Replace the old rows for these full_urls
+
+    saved = [row['full_url'] for row in rows]
+    if saved:
+        Urls.query.filter(Urls.full_url.in_(saved)).delete(
+            synchronize_session=False)
+        db.session.bulk_insert_mappings(Urls, rows)
+
+    return {
+        'full_urls': len(full_urls),
+        'stale': len(stale),
+        'looked_up': len(pages),
+        'failed': len(failed),
+        'saved': len(rows)}
+
+
+def api_lookup(ttl=None, engine=None, chunk_size=None, restart=False,
+               progress=None):
+
+    '''
+    Look up the pages behind Raw.full_url on the gov.uk content API
+    and store the results in the Urls table.
+
+    Surveys are streamed from raw in chunks of chunk_size
+    (FLASKY_PIPELINE_CHUNK_SIZE by default). The distinct full_urls in each
+    chunk are looked up by lookup_full_urls(), skipping pages looked up
+    less than ttl days ago (FLASKY_URL_LOOKUP_TTL by default), and the
+    results are committed along with a checkpoint of the last respondent_id
+    in the chunk.
+
+    A later run carries on after the checkpoint, so it only looks at new
+    surveys, or picks up where a failed run stopped. The checkpoint never
+    moves past a survey whose page could not be looked up, so that the next
+    run tries it again; pages which were saved in the meantime are not
+    looked up again until they are older than ttl. Pass restart=True to go
+    through every survey again, e.g. to refresh pages older than ttl.
+
+    progress, if given, is called with the running totals after each chunk.
+
+    Returns a dict of totals counting the surveys, full_urls and pages
+    involved.
+    '''
 
-    self.unique_pages = pd.concat([self.unique_pages, org_sect], axis=1)
+    from flask import current_app
+    from . import db
+    from .lookupengine import LookupEngine
+    from .models import Checkpoint
 
-    print('*** Lookup complete, merging results back into survey.data')
+    if ttl is None:
+        ttl = current_app.config['FLASKY_URL_LOOKUP_TTL']
+    if chunk_size is None:
+        chunk_size = current_app.config['FLASKY_PIPELINE_CHUNK_SIZE']
+    if engine is None:
+        engine = LookupEngine.from_config(current_app.config)
+    cutoff = datetime.now() - timedelta(days=ttl)
 
-    self.data = pd.merge(
-        right=self.data.drop(['org', 'section'], axis=1),
-        left=self.unique_pages, on='page', how='outer')
+    checkpoint = Checkpoint.load('url_lookup')
+    if restart:
+        checkpoint.respondent_id = None
 
-    self.data.drop_duplicates(subset=['respondent_ID'], inplace=True)
+    totals = Counter(surveys=0, full_urls=0, stale=0, looked_up=0, failed=0,
+                     saved=0)
+
+    held = False
+    for rows in stream_full_urls(checkpoint.respondent_id, chunk_size):
+        full_urls = list(OrderedDict.fromkeys(row.full_url for row in rows))
+        failures = set()
+        totals.update(lookup_full_urls(full_urls, cutoff, engine, failures))
+        totals['surveys'] += len(rows)
+
+        # Stop the checkpoint just before the first survey which failed
+
+        for row in rows:
+            if held:
+                break
+            if row.full_url in failures:
+                held = True
+            else:
+                checkpoint.respondent_id = row.respondent_id
+        checkpoint.updated = datetime.utcnow()
+        db.session.add(checkpoint)
+        db.session.commit()
+
+        if progress is not None:
+            progress(dict(totals, respondent_id=checkpoint.respondent_id))
+
+    db.session.add(checkpoint)
+    db.session.commit()
+
+    return dict(totals)
 
 
 def lookup(r, page, index):
@@ -146,24 +374,38 @@ def lookup(r, page, index):
                 'page argument must be one of "organisations" or ',
                 '"mainstream_browse_pages"')
             sys.exit(1)
-    except (IndexError, KeyError) as e:
+    except (IndexError, KeyError, TypeError) as e:
         x = 'null'
     return(x)
 
 
-def get_org(x):
+def org_sect(r):
+
+    '''
+    Extract the first five organisations and first four mainstream browse
+    pages from a GOV.UK search API result, as a list of nine strings.
+    Missing values are returned as 'null'.
+    '''
+
+    return [lookup(r, 'organisations', i) for i in range(5)] + \
+        [lookup(r, 'mainstream_browse_pages', i) for i in range(4)]
+
+
+def get_org(x, base_url=GOVUK_URL):
 
     '''
     Simple function to lookup a url on the GOV.UK content API
     Returns a list.
-    '''
 
-    output = []
+    To look up more than a handful of urls, use
+    app.lookupengine.LookupEngine, which runs lookups concurrently and
+    retries failures.
+    '''
 
     # argument x should be pd.Series of full length urls
     # Loop through each entry in the series
 
-    url = "https://www.gov.uk/api/search.json?filter_link[]=%s&fields=organisations&fields=mainstream_browse_pages" % x
+    url = base_url + "/api/search.json?filter_link[]=%s&fields=organisations&fields=mainstream_browse_pages" % x
 
     # print('Looking up ' + url)
 
@@ -174,63 +416,10 @@ def get_org(x):
 
         # chose the fields you want to scrape. This scrapes the first 5
         # instances of organisation, error checking as it goes
-        # this exception syntax might not work in Python 3
-
-        org0 = lookup(r, 'organisations', 0)
-        org1 = lookup(r, 'organisations', 1)
-        org2 = lookup(r, 'organisations', 2)
-        org3 = lookup(r, 'organisations', 3)
-        org4 = lookup(r, 'organisations', 4)
-        section0 = lookup(r, 'mainstream_browse_pages', 0)
-        section1 = lookup(r, 'mainstream_browse_pages', 1)
-        section2 = lookup(r, 'mainstream_browse_pages', 2)
-        section3 = lookup(r, 'mainstream_browse_pages', 3)
-
-        output = [
-            org0,
-            org1,
-            org2,
-            org3,
-            org4,
-            section0,
-            section1,
-            section2,
-            section3
-            ]
-
-        return(output)
+
+        return(org_sect(r))
 
     except Exception as e:
         print('Error looking up ' + url)
         print('Returning "null"')
-        row = ['null'] * 9
-        return(output)
-
-
-def reg_match(r, x, i):
-
-    '''
-    Helper function for dealing with urls beginning /browse/...
-    or similar. Utilised in clean_url()
-    '''
-
-    r = r + '/'
-
-    # r = uncompiled regex query
-    # x = string to search
-    # i = index of captive group (0 = all)
-
-    p = re.compile(r)
-    s = p.search(x)
-
-    if s:
-        t = re.split('\/', x, maxsplit=3)
-        if i == 0:
-            found = t[1]
-        if i == 1:
-            found = '/' + t[1] + '/' + t[2]
-        elif i == 2:
-            found = t[2]
-    else:
-        found = x
-    return(found)
+        return(['null'] * 9)
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the classification app.
+
+These are run against a deployed (development) database via manage.py, e.g.
+python manage.py bench_selection. They insert their own rows and remove them
+again when they finish.
+"""
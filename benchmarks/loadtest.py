@@ -0,0 +1,294 @@
+"""
+Load test the classification loop over HTTP with many coders at once.
+
+A local gunicorn is started with the loadtest configuration (or the load
+test is pointed at a running instance with url), a block of benchmark
+surveys is inserted into raw, and each virtual coder logs in with its own
+session and repeats what a coder does in a browser: fetch the classification
+page, read the survey for a while, and submit a code. Every few surveys they
+also look at the leaderboards and the code list.
+
+For each endpoint the latency percentiles, requests per second, error rate
+and the number of database queries made per request (from the X-Query-Count
+header, see FLASKY_QUERY_COUNT_HEADER) are reported, and the benchmark
+surveys and their classifications are removed again afterwards. The
+benchmark surveys are offered before any others, but once they run out the
+coders go on to classify whatever else is in the database, so give them
+plenty.
+
+The coders are threads in one process, so with many coders and no think
+time the client itself may become the bottleneck: watch its CPU use.
+"""
+
+import os
+import random
+import re
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from flask import current_app
+from app import db
+from app.fakedata import password_hash
+from app.models import Role, User
+from benchmarks.selection import OFFSET, CLEAN_UP
+from benchmarks.simulate import SEED_RAW, summarise
+
+PASSWORD = 'loadtest'
+
+ENDPOINTS = ['login', 'GET /', 'POST /', 'GET /leaders', 'GET /codes']
+
+
+def hidden_field(name, html):
+    '''The value of a hidden form field, or None if it is not there'''
+    match = re.search(
+        r'name="%s" type="hidden" value="([^"]*)"' % name, html)
+    return match.group(1) if match else None
+
+
+def radio_values(name, html):
+    return re.findall(r'name="%s" type="radio" value="(\d+)"' % name, html)
+
+
+def create_coders(count):
+    '''
+    Return the emails of count confirmed users, who can classify and see
+    the leaderboards, adding them if they do not exist yet
+    '''
+    role = Role.query.filter_by(name='User-Gamify').first()
+    emails = ['loadtest%d@example.com' % i for i in range(count)]
+    existing = set(row.email for row in db.session.execute(
+        'select email from users where email = any(:emails)',
+        {'emails': emails}))
+    for i, email in enumerate(emails):
+        if email not in existing:
+            db.session.add(User(
+                email=email, username='loadtest%d' % i, confirmed=True,
+                password_hash=password_hash(PASSWORD), role=role))
+    db.session.commit()
+    return emails
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Gunicorn(object):
+    '''
+    Run the app under gunicorn on localhost, with the loadtest configuration
+    against the database given, for the duration of a with block
+    '''
+
+    def __init__(self, database_url, workers=4, timeout=30):
+        self.port = free_port()
+        self.url = 'http://127.0.0.1:%d' % self.port
+        self.workers = workers
+        self.timeout = timeout
+        self.env = dict(os.environ, FLASK_CONFIG='loadtest',
+                        LOADTEST_DATABASE_URL=database_url)
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            ['gunicorn', '--workers', str(self.workers),
+             '--bind', '127.0.0.1:%d' % self.port, 'manage:app'],
+            env=self.env)
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited with code %d'
+                                   % self.process.returncode)
+            try:
+                requests.get(self.url + '/auth/login', timeout=1)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError('gunicorn did not start within %ds'
+                           % self.timeout)
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        self.process.wait()
+
+
+class HttpCoder(threading.Thread):
+    '''A coder classifying surveys through the web pages'''
+
+    def __init__(self, url, email, deadline, think_time, browse_every, seed):
+        super(HttpCoder, self).__init__()
+        self.url = url
+        self.email = email
+        self.deadline = deadline
+        self.think_time = think_time
+        self.browse_every = browse_every
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.results = dict((endpoint, []) for endpoint in ENDPOINTS)
+        self.classified = 0
+        self.caught_up = False
+
+    def request(self, endpoint, method, path, expect, **kwargs):
+        '''
+        Make a request, recording its latency, whether it failed and the
+        number of queries it made. Returns the response, or None on error.
+        '''
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.url + path, allow_redirects=False,
+                timeout=60, **kwargs)
+        except requests.RequestException:
+            response = None
+        elapsed = time.perf_counter() - start
+
+        ok = response is not None and response.status_code == expect
+        queries = None
+        if response is not None:
+            queries = response.headers.get('X-Query-Count')
+        self.results[endpoint].append(
+            (elapsed, ok, int(queries) if queries else None))
+        return response if ok else None
+
+    def login(self):
+        page = self.request('login', 'GET', '/auth/login', 200)
+        return page is not None and self.request(
+            'login', 'POST', '/auth/login', 302, data={
+                'email': self.email, 'password': PASSWORD,
+                'csrf_token': hidden_field('csrf_token', page.text)
+            }) is not None
+
+    def think(self):
+        if self.think_time:
+            time.sleep(self.random.expovariate(1.0 / self.think_time))
+
+    def run(self):
+        if not self.login():
+            return
+        while time.perf_counter() < self.deadline:
+            page = self.request('GET /', 'GET', '/', 200)
+            if page is None:
+                continue
+            survey = hidden_field('survey', page.text)
+            codes = radio_values('code', page.text)
+            project_codes = radio_values('project_code', page.text)
+            if survey is None or not codes:
+                self.caught_up = True
+                return
+
+            self.think()
+            data = {'survey': survey, 'code': self.random.choice(codes),
+                    'csrf_token': hidden_field('csrf_token', page.text)}
+            if project_codes:
+                data['project_code'] = self.random.choice(project_codes)
+            if self.request('POST /', 'POST', '/', 302, data=data) is None:
+                continue
+            self.classified += 1
+
+            if self.browse_every and \
+                    self.classified % self.browse_every == 0:
+                self.request('GET /leaders', 'GET', '/leaders', 200)
+                self.request('GET /codes', 'GET', '/codes', 200)
+
+
+def endpoint_stats(results, elapsed):
+    '''Latency, throughput, errors and queries for one endpoint's results'''
+    timings = [t for t, ok, queries in results if ok]
+    queries = [q for t, ok, q in results if q is not None]
+    stats = summarise(timings)
+    stats.update({
+        'requests': len(results),
+        'per_second': len(results) / elapsed if elapsed else 0,
+        'error_rate': (1 - len(timings) / float(len(results))
+                       if results else 0),
+        'queries': (sum(queries) / float(len(queries))
+                    if queries else None)})
+    return stats
+
+
+def print_results(result):
+    print('%(coders)d coders classified %(classified)d surveys in '
+          '%(seconds).1fs' % result)
+    print('%14s %8s %8s %8s %9s %9s %9s %8s' % (
+        'endpoint', 'requests', 'per sec', 'errors', 'p50 ms', 'p95 ms',
+        'p99 ms', 'queries'))
+    for endpoint in ENDPOINTS:
+        stats = result['endpoints'][endpoint]
+        if not stats['requests']:
+            continue
+        latency = tuple(
+            '%.1f' % stats[p] if stats['count'] else '-'
+            for p in ('p50_ms', 'p95_ms', 'p99_ms'))
+        queries = '-'
+        if stats['queries'] is not None:
+            queries = '%.1f' % stats['queries']
+        print('%14s %8d %8.1f %7.1f%% %9s %9s %9s %8s' % ((
+            endpoint, stats['requests'], stats['per_second'],
+            stats['error_rate'] * 100) + latency + (queries,)))
+    if result['caught_up']:
+        print('%d coders ran out of surveys: add more with --surveys'
+              % result['caught_up'])
+
+
+@contextmanager
+def target(url, workers):
+    '''The url of the instance under test, starting one if url is None'''
+    if url:
+        yield url
+    else:
+        with Gunicorn(current_app.config['SQLALCHEMY_DATABASE_URI'],
+                      workers) as server:
+            yield server.url
+
+
+def run(coders=20, duration=60, think_time=2, browse_every=10, surveys=5000,
+        workers=4, url=None, seed=0):
+    '''
+    Run the load test and print the results. Unless url is given, the app
+    is started under gunicorn with workers workers.
+
+    Returns a dict with the number of surveys classified and, for each
+    endpoint, the number of requests, requests per second, error rate,
+    latency percentiles and mean number of queries per request.
+    '''
+
+    emails = create_coders(coders)
+    params = {'offset': OFFSET, 'surveys': surveys}
+    threads = []
+
+    try:
+        db.session.execute(SEED_RAW, params)
+        db.session.commit()
+
+        with target(url, workers) as base_url:
+            deadline = time.perf_counter() + duration
+            threads = [
+                HttpCoder(base_url, email, deadline, think_time,
+                          browse_every, seed + i)
+                for i, email in enumerate(emails)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    finally:
+        db.session.rollback()
+        db.session.execute(CLEAN_UP, params)
+        db.session.commit()
+
+    result = {
+        'coders': len(threads),
+        'classified': sum(thread.classified for thread in threads),
+        'caught_up': sum(thread.caught_up for thread in threads),
+        'seconds': elapsed,
+        'endpoints': dict(
+            (endpoint, endpoint_stats(
+                [r for thread in threads for r in thread.results[endpoint]],
+                elapsed))
+            for endpoint in ENDPOINTS)}
+    print_results(result)
+    return result
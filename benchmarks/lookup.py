@@ -0,0 +1,55 @@
+"""
+Benchmark looking up pages on the GOV.UK search API: get_org() one page at a
+time, against LookupEngine.
+
+Both are pointed at the local stub server in tests/stubserver.py, which
+answers each request after latency seconds, so no requests are made to
+GOV.UK. Pages are taken from govukurls.txt.
+"""
+
+import time
+from app.lookupengine import LookupEngine
+from app.urllookup import get_org
+from tests.stubserver import StubSearchServer
+
+
+def read_pages(count, file='govukurls.txt'):
+    '''Return count distinct pages, made from the urls in file'''
+    with open(file) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    return ['%s/%d' % (urls[i % len(urls)], i) for i in range(count)]
+
+
+def run(pages=1000, workers=8, rate=0, latency=0.02):
+    '''
+    Run the benchmark and print a table of results.
+
+    Returns a dict of pages looked up per second for get_org() and for the
+    engine.
+    '''
+
+    page_list = read_pages(pages)
+    results = {}
+
+    with StubSearchServer(latency=latency) as stub:
+
+        # get_org() is slow, so time it on a sample of the pages
+
+        sample = page_list[:max(1, min(pages, 200))]
+        start = time.perf_counter()
+        for page in sample:
+            get_org(page, base_url=stub.url)
+        results['get_org'] = len(sample) / (time.perf_counter() - start)
+
+        engine = LookupEngine(base_url=stub.url, workers=workers, rate=rate)
+        start = time.perf_counter()
+        engine.lookup_many(page_list)
+        results['engine'] = len(page_list) / (time.perf_counter() - start)
+        engine.close()
+
+    print('%12s %14s' % ('', 'pages/second'))
+    for name in ('get_org', 'engine'):
+        print('%12s %14.1f' % (name, results[name]))
+    print('engine stats: %s' % engine.stats())
+
+    return results
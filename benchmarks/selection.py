@@ -0,0 +1,122 @@
+"""
+Benchmark the next survey lookup (new_survey()) as the classified table
+grows.
+
+A block of benchmark surveys is inserted into raw, then classified rows are
+added in steps. After each step new_survey() is timed for a single coder, so
+the per-request latency can be compared across table sizes.
+"""
+
+import time
+from app import db
+from app.surveyqueue import new_survey
+
+# Benchmark surveys are given respondent_ids well above anything that
+# Raw.generate_fake() or the survey software will produce, so that they can
+# be removed again afterwards.
+
+OFFSET = 9000000000
+
+SEED_RAW = '''
+insert into raw (respondent_id, collector_id, start_date, end_date, full_url,
+                 comment_why_you_came)
+select :offset + g, 'benchmark', now() - g * interval '1 minute', now(),
+       '/benchmark', 'benchmark survey'
+from generate_series(1, :surveys) g
+'''
+
+SEED_CLASSIFIED = '''
+with coders as (select array_agg(id) as ids from users),
+codes as (select array_agg(code_id) as ids from codes)
+insert into classified (respondent_id, coder_id, code_id, pii, date_coded)
+select :offset + 1 + floor(random() * :surveys)::bigint,
+       coders.ids[1 + floor(random() * array_length(coders.ids, 1))::int],
+       codes.ids[1 + floor(random() * array_length(codes.ids, 1))::int],
+       false,
+       now()
+from generate_series(1, :count) g, coders, codes
+'''
+
+CLEAN_UP = '''
+delete from survey_leases where respondent_id > :offset;
+delete from survey_codes where respondent_id > :offset;
+delete from survey_priority where respondent_id > :offset;
+delete from classified where respondent_id > :offset;
+delete from raw where respondent_id > :offset;
+'''
+
+
+def percentile(timings, p):
+    '''Nearest rank percentile of a list of timings'''
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1)
+    return ordered[max(index, 0)]
+
+
+def time_new_survey(coder_id, repeats):
+    '''Time repeated calls to new_survey(), returning seconds per call'''
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        new_survey(coder_id)
+        timings.append(time.perf_counter() - start)
+
+        # Drop the lease so that every call has to select a survey afresh
+
+        db.session.execute(
+            'delete from survey_leases where coder_id = :coder_id',
+            {'coder_id': coder_id})
+        db.session.commit()
+    return timings
+
+
+def run(surveys=5000, steps=5, step_size=20000, repeats=20):
+    '''
+    Run the benchmark and print a table of results.
+
+    Returns a list of dicts, one per step, containing the number of rows in
+    classified and the median and 95th percentile latency in milliseconds.
+    '''
+
+    coder_id = db.session.execute('select min(id) from users').scalar()
+    code_count = db.session.execute('select count(*) from codes').scalar()
+
+    if coder_id is None or not code_count:
+        print('The database needs users and codes before running this '
+              'benchmark. Try python manage.py populate first.')
+        return []
+
+    params = {'offset': OFFSET, 'surveys': surveys, 'count': step_size}
+    results = []
+
+    try:
+        db.session.execute(SEED_RAW, params)
+        db.session.commit()
+
+        print('%12s %12s %12s' % ('classified', 'median ms', 'p95 ms'))
+
+        for step in range(steps + 1):
+            if step > 0:
+                db.session.execute(SEED_CLASSIFIED, params)
+                db.session.commit()
+                db.session.execute('analyze classified')
+                db.session.commit()
+
+            rows = db.session.execute(
+                'select count(*) from classified').scalar()
+            timings = time_new_survey(coder_id, repeats)
+            result = {
+                'classified': rows,
+                'median_ms': percentile(timings, 50) * 1000,
+                'p95_ms': percentile(timings, 95) * 1000
+                }
+            results.append(result)
+
+            print('%12d %12.2f %12.2f' % (
+                rows, result['median_ms'], result['p95_ms']))
+    finally:
+        db.session.rollback()
+        db.session.execute(CLEAN_UP, params)
+        db.session.commit()
+
+    return results
@@ -0,0 +1,239 @@
+"""
+Simulate many coders classifying surveys at once.
+
+A block of benchmark surveys is inserted into raw, and each virtual coder
+runs in its own thread, with its own database session, through the same
+calls the classification page makes: new_survey() to lease the next survey,
+then classify_surveys() to save the classification and release the lease.
+
+Each survey is given a hidden 'true' code. A coder applies it with the
+agreement rate for that code, and otherwise picks one of the other codes at
+random, so the rates control how quickly surveys reach a consensus.
+
+The time taken by each step, the overall throughput and the number of
+benchmark surveys at each priority level are reported, and the benchmark
+surveys and their classifications are removed again afterwards.
+"""
+
+import random
+import threading
+import time
+from flask import current_app
+from app import db
+from app.fakedata import fake_users
+from app.surveyqueue import new_survey, classify_surveys, release_surveys
+from benchmarks.selection import OFFSET, CLEAN_UP, percentile
+
+# The benchmark surveys are dated next month, so that they are offered
+# before any other surveys in the database
+
+SEED_RAW = '''
+insert into raw (respondent_id, collector_id, start_date, end_date, full_url,
+                 comment_why_you_came)
+select :offset + g, 'benchmark',
+       date_trunc('month', now()) + interval '1 month'
+           + g * interval '1 second',
+       now(), '/benchmark', 'benchmark survey'
+from generate_series(1, :surveys) g
+'''
+
+PRIORITIES = '''
+select priority, count(*) as n
+from survey_priority
+where respondent_id > :offset
+group by priority
+order by priority
+'''
+
+
+def parse_agreement(text):
+    '''Parse 'code=rate,code=rate' into a dict of code names and rates'''
+    rates = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            code, rate = item.split('=')
+            rates[code.strip()] = float(rate)
+    return rates
+
+
+def choose_coders(count):
+    '''
+    Return the ids of count users to act as coders, adding fake users if
+    there are not enough. The automated user is never chosen.
+    '''
+    query = '''
+    select id from users
+    where username is distinct from 'automated'
+    order by id
+    limit :count
+    '''
+    coders = [row.id for row in db.session.execute(query, {'count': count})]
+    if len(coders) < count:
+        fake_users(count - len(coders))
+        coders = [row.id for row in
+                  db.session.execute(query, {'count': count})]
+    return coders
+
+
+class VirtualCoder(threading.Thread):
+    '''A coder classifying surveys until they run out of surveys or time'''
+
+    def __init__(self, app, coder_id, agreement, per_coder, deadline,
+                 think_time, pii, seed):
+        super(VirtualCoder, self).__init__()
+        self.app = app
+        self.coder_id = coder_id
+        self.agreement = agreement
+        self.per_coder = per_coder
+        self.deadline = deadline
+        self.think_time = think_time
+        self.pii = pii
+        self.random = random.Random(seed)
+        self.timings = {'new_survey': [], 'classify': []}
+        self.classified = 0
+        self.lost = 0
+        self.error = None
+
+    def choose_code(self, respondent_id):
+        '''The true code of the survey, or a wrong one'''
+        code_ids = sorted(self.agreement)
+        true_code = random.Random(respondent_id).choice(code_ids)
+        if self.random.random() < self.agreement[true_code]:
+            return true_code
+        return self.random.choice(
+            [i for i in code_ids if i != true_code] or code_ids)
+
+    def run(self):
+        with self.app.app_context():
+            try:
+                self.classify()
+            except Exception as e:
+                self.error = e
+            finally:
+                db.session.remove()
+
+    def classify(self):
+        while self.classified < self.per_coder and \
+                time.perf_counter() < self.deadline:
+            start = time.perf_counter()
+            respondent_id = new_survey(self.coder_id)
+            self.timings['new_survey'].append(time.perf_counter() - start)
+            if respondent_id is None:
+                return
+
+            # Leave surveys other than the benchmark surveys alone
+
+            if respondent_id <= OFFSET:
+                release_surveys(self.coder_id, [respondent_id])
+                db.session.commit()
+                return
+
+            if self.think_time:
+                time.sleep(self.random.expovariate(1.0 / self.think_time))
+
+            start = time.perf_counter()
+            saved = classify_surveys(self.coder_id, [dict(
+                respondent_id=respondent_id,
+                code_id=self.choose_code(respondent_id),
+                project_code_id=None,
+                pii=self.random.random() < self.pii)])
+            self.timings['classify'].append(time.perf_counter() - start)
+            if saved:
+                self.classified += 1
+            else:
+                self.lost += 1
+
+
+def summarise(timings):
+    '''Median, 95th and 99th percentile in milliseconds'''
+    if not timings:
+        return {'count': 0}
+    return {'count': len(timings),
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p95_ms': percentile(timings, 95) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000}
+
+
+def run(coders=10, surveys=2000, per_coder=100, duration=60,
+        think_time=0, agreement=0.7, code_agreement=None, pii=0.001,
+        seed=0):
+    '''
+    Run the simulation and print the results. code_agreement is a dict of
+    code names and agreement rates, overriding agreement for those codes.
+
+    Returns a dict with the number of classifications saved (and lost to
+    expired leases), classifications per second, latency percentiles for
+    each step and the number of benchmark surveys at each priority level.
+    '''
+
+    code_agreement = code_agreement or {}
+    rates = dict(
+        (row.code_id, code_agreement.get(row.code, agreement))
+        for row in db.session.execute(
+            'select code_id, code from codes where end_date is null'))
+    if not rates:
+        print('The database needs codes before running the simulation. '
+              'Try python manage.py populate first.')
+        return {}
+
+    coder_ids = choose_coders(coders)
+    app = current_app._get_current_object()
+    params = {'offset': OFFSET, 'surveys': surveys}
+    threads = []
+
+    try:
+        db.session.execute(SEED_RAW, params)
+        db.session.commit()
+
+        deadline = time.perf_counter() + duration
+        threads = [
+            VirtualCoder(app, coder_id, rates, per_coder, deadline,
+                         think_time, pii, seed + i)
+            for i, coder_id in enumerate(coder_ids)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        priorities = dict(
+            (row.priority, row.n)
+            for row in db.session.execute(PRIORITIES, params))
+    finally:
+        db.session.rollback()
+        db.session.execute(CLEAN_UP, params)
+        db.session.commit()
+
+    errors = [thread.error for thread in threads if thread.error]
+    classified = sum(thread.classified for thread in threads)
+    result = {
+        'coders': len(threads),
+        'classified': classified,
+        'lost': sum(thread.lost for thread in threads),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'per_second': classified / elapsed if elapsed else 0,
+        'steps': dict(
+            (step, summarise(
+                [t for thread in threads for t in thread.timings[step]]))
+            for step in ('new_survey', 'classify')),
+        'priorities': priorities}
+
+    print('%(coders)d coders classified %(classified)d surveys in '
+          '%(seconds).1fs (%(per_second).1f/s), %(lost)d lost to expired '
+          'leases, %(errors)d errors' % result)
+    print('%12s %8s %10s %10s %10s' % (
+        'step', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for step, stats in sorted(result['steps'].items()):
+        if stats['count']:
+            print('%12s %8d %10.2f %10.2f %10.2f' % (
+                step, stats['count'], stats['p50_ms'], stats['p95_ms'],
+                stats['p99_ms']))
+    print('%12s %8s' % ('priority', 'surveys'))
+    for priority, count in sorted(priorities.items()):
+        print('%12s %8d' % (priority, count))
+    for error in errors[:5]:
+        print('Error: %r' % error)
+
+    return result
@@ -0,0 +1,266 @@
+"""
+Benchmark the priority and leaderboard views, survey selection and the
+classification page as the database grows.
+
+For each scale a deterministic dataset is generated (see app/fakedata.py):
+that many surveys, with votes spread over them as in VOTES and a 70% chance
+of each coder agreeing with a survey's hidden 'true' code. Then:
+
+* each view is read in full, and its plan is captured with
+  EXPLAIN (ANALYZE, BUFFERS)
+* new_survey() is timed for one coder, and the plan of its claim query
+  captured (in a transaction which is rolled back)
+* the classification page is fetched and submitted through the Flask test
+  client, as a logged in coder
+
+The results, along with the commit and Postgres version, are written as
+JSON, so runs on different commits can be compared with --compare.
+
+Each dataset is saved as a snapshot the first time it is generated, and
+loaded from there afterwards (see app/snapshot.py). Loading a dataset
+replaces the users, surveys, classifications and codes in the database, so
+only run this against a database set aside for benchmarking.
+"""
+
+import json
+import re
+import subprocess
+import time
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.snapshot import load_snapshot
+from app.models import Role, User
+from app.surveyqueue import CLAIM
+from benchmarks.selection import percentile, time_new_survey
+
+SCALES = [10000, 100000, 1000000]
+
+VIEWS = ['priority', 'leaders', 'daily_leaders', 'weekly_leaders']
+
+BENCH_USER = 'bench@example.com'
+BENCH_PASSWORD = 'bench'
+
+# The test client talks https, so that secure session cookies are sent
+
+BASE_URL = 'https://localhost'
+
+SURVEY_FIELD = re.compile(b'name="survey" type="hidden" value="([^"]+)"')
+
+
+def git_commit():
+    '''The commit being benchmarked, or None outside a git checkout'''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarise(timings):
+    '''Median and 95th percentile of a list of timings, in milliseconds'''
+    if not timings:
+        return {'count': 0}
+    return {'count': len(timings),
+            'median_ms': percentile(timings, 50) * 1000,
+            'p95_ms': percentile(timings, 95) * 1000}
+
+
+def bench_user():
+    '''Return the id of the coder the classification page is timed as'''
+    user = User.query.filter_by(email=BENCH_USER).first()
+    if user is None:
+        user = User(email=BENCH_USER, username='bench', confirmed=True,
+                    password=BENCH_PASSWORD,
+                    role=Role.query.filter_by(name='User').first())
+        db.session.add(user)
+        db.session.commit()
+    return user.id
+
+
+def generate(scale, seed):
+    '''
+    Replace the surveys and votes with a dataset of scale surveys, from a
+    snapshot if one has been saved (see app/snapshot.py)
+    '''
+    load_snapshot(scale, seed)
+    return bench_user()
+
+
+def explain(query, params=None):
+    '''
+    Run EXPLAIN (ANALYZE, BUFFERS) on a query, rolling back anything it
+    changes, and return the plan as JSON
+    '''
+    plan = db.session.execute(
+        'explain (analyze, buffers, format json) ' + query,
+        params or {}).scalar()
+    db.session.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def time_query(query, repeats):
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        rows = db.session.execute(query).fetchall()
+        timings.append(time.perf_counter() - start)
+    db.session.rollback()
+    result = summarise(timings)
+    result['rows'] = len(rows)
+    return result
+
+
+def existing_views():
+    return [view for view in VIEWS if db.session.execute(
+        'select to_regclass(:view)', {'view': view}).scalar()]
+
+
+def time_index(coder_id, repeats):
+    '''
+    Time fetching and submitting the classification page as a coder, through
+    the Flask test client. Returns timings for the GET and the POST.
+    '''
+
+    app = current_app._get_current_object()
+    code_id = db.session.execute(
+        'select min(code_id) from codes where end_date is null').scalar()
+    project_code_id = db.session.execute(
+        'select min(project_code_id) from project_codes '
+        'where end_date is null').scalar()
+    get_timings, post_timings = [], []
+
+    # The benchmark does not send CSRF tokens
+
+    csrf = app.config.get('WTF_CSRF_ENABLED', True)
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        client = app.test_client(use_cookies=True)
+        client.post('/auth/login', base_url=BASE_URL, data={
+            'email': BENCH_USER, 'password': BENCH_PASSWORD})
+
+        for i in range(repeats):
+            start = time.perf_counter()
+            response = client.get('/', base_url=BASE_URL)
+            get_timings.append(time.perf_counter() - start)
+            survey = SURVEY_FIELD.search(response.data)
+            if survey is None:
+                break
+
+            start = time.perf_counter()
+            response = client.post('/', base_url=BASE_URL, data={
+                'survey': survey.group(1).decode('ascii'),
+                'code': code_id, 'project_code': project_code_id})
+            elapsed = time.perf_counter() - start
+
+            # Anything but a redirect means the form did not validate, and
+            # nothing was saved
+
+            if response.status_code != 302:
+                raise RuntimeError(
+                    'Classifying a survey returned %d, not a redirect'
+                    % response.status_code)
+            post_timings.append(elapsed)
+    finally:
+        app.config['WTF_CSRF_ENABLED'] = csrf
+
+    return {'get': summarise(get_timings), 'post': summarise(post_timings)}
+
+
+def bench_scale(scale, repeats, seed):
+    '''Generate a dataset of scale surveys and time everything against it'''
+
+    start = time.perf_counter()
+    coder_id = generate(scale, seed)
+    result = {
+        'scale': scale,
+        'generate_seconds': time.perf_counter() - start,
+        'classified': db.session.execute(
+            'select count(*) from classified').scalar(),
+        'views': {}}
+
+    for view in existing_views():
+        query = 'select * from %s' % view
+        result['views'][view] = time_query(query, repeats)
+        result['views'][view]['plan'] = explain(query)
+
+    params = {'coder_id': coder_id, 'count': 1, 'ttl': 600}
+    result['new_survey'] = summarise(time_new_survey(coder_id, repeats))
+    result['new_survey']['plan'] = explain(CLAIM, params)
+
+    result['index'] = time_index(coder_id, repeats)
+    return result
+
+
+def metrics(results):
+    '''Flatten results into {(scale, name): median_ms}'''
+    flat = {}
+    for scale in results['scales']:
+        for view, stats in scale['views'].items():
+            flat[(scale['scale'], view)] = stats.get('median_ms')
+        flat[(scale['scale'], 'new_survey')] = \
+            scale['new_survey'].get('median_ms')
+        for method, stats in scale['index'].items():
+            flat[(scale['scale'], 'index %s' % method.upper())] = \
+                stats.get('median_ms')
+    return flat
+
+
+def print_results(results, baseline=None):
+    old = metrics(baseline) if baseline else {}
+    print('%10s %-16s %12s %12s %8s' % (
+        'surveys', 'timing', 'median ms', 'before ms', 'ratio'))
+    for (scale, name), median in sorted(metrics(results).items()):
+        before = old.get((scale, name))
+        print('%10d %-16s %12s %12s %8s' % (
+            scale, name,
+            '%.2f' % median if median is not None else '-',
+            '%.2f' % before if before is not None else '-',
+            '%.2f' % (median / before)
+            if median is not None and before else '-'))
+
+
+def run(scales=None, repeats=20, seed=0, output='bench.json', compare=None,
+        reset=False):
+    '''
+    Run the benchmarks at each scale, print a summary (compared with the
+    results in the file compare, if given) and write the results to output
+    as JSON. Returns the results.
+
+    Unless reset is set, nothing is run if there are already surveys or
+    users in the database, as they would be deleted.
+    '''
+
+    if not reset and db.session.execute(
+            'select exists (select 1 from raw) '
+            'or exists (select 1 from users)').scalar():
+        print('The database already has surveys or user accounts, which the '
+              'benchmark would delete, every user account included. Use '
+              '--reset to run it anyway.')
+        return {}
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'postgres': db.session.execute('show server_version').scalar(),
+        'seed': seed,
+        'repeats': repeats,
+        'scales': []}
+
+    for scale in scales or SCALES:
+        print('Benchmarking %d surveys...' % scale)
+        results['scales'].append(bench_scale(scale, repeats, seed))
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print('Results written to %s' % output)
+    return results
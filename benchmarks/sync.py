@@ -0,0 +1,64 @@
+"""
+Benchmark syncing surveys from the survey provider into raw.
+
+A stub provider (tests/stubprovider.py) serves generated responses, with
+latency seconds added to each request, and they are synced into raw with
+sync_surveys(). The benchmark surveys use the same respondent_id offset as
+the selection benchmark, and are removed again afterwards.
+"""
+
+import time
+from datetime import datetime, timedelta
+from app import db
+from app.apiclient import ApiClient
+from app.surveysync import sync_surveys
+from benchmarks.selection import OFFSET, CLEAN_UP
+from tests.stubprovider import StubProviderServer
+
+CHECKPOINT = 'benchmark_sync'
+
+
+def responses(count):
+    start = datetime(2017, 5, 1)
+    return [{
+        'respondent_id': OFFSET + i,
+        'collector_id': 'benchmark',
+        'start_date': (start + timedelta(minutes=i)).isoformat(),
+        'end_date': (start + timedelta(minutes=i, seconds=90)).isoformat(),
+        'full_url': '/benchmark',
+        'comment_why_you_came': 'benchmark survey %d' % i}
+        for i in range(1, count + 1)]
+
+
+def run(surveys=20000, page_size=100, workers=4, rate=0, latency=0.05):
+    '''
+    Run the benchmark and print the results.
+
+    Returns a dict with the number of surveys loaded and surveys per second.
+    '''
+
+    db.session.execute(
+        'delete from checkpoints where name = :name', {'name': CHECKPOINT})
+    db.session.commit()
+
+    try:
+        with StubProviderServer(responses(surveys), latency=latency) as stub:
+            client = ApiClient(workers=workers, rate=rate)
+            start = time.perf_counter()
+            totals = sync_surveys(client, page_size, base_url=stub.url,
+                                  checkpoint_name=CHECKPOINT)
+            elapsed = time.perf_counter() - start
+    finally:
+        db.session.rollback()
+        db.session.execute(CLEAN_UP, {'offset': OFFSET})
+        db.session.execute(
+            'delete from checkpoints where name = :name',
+            {'name': CHECKPOINT})
+        db.session.commit()
+
+    result = {'surveys': totals['inserted'],
+              'per_second': totals['inserted'] / elapsed}
+    print('Synced %(surveys)d surveys at %(per_second).0f surveys/second'
+          % result)
+    print('client stats: %s' % client.stats())
+    return result
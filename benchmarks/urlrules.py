@@ -0,0 +1,115 @@
+"""
+Benchmark cleaning urls with clean_pages() against the original clean_url()
+and reg_match(), which are kept here as legacy_clean_url() for comparison.
+
+The urls in govukurls.txt are replicated (with a varying suffix on some, so
+that not every url is a repeat) up to the requested number of rows.
+"""
+
+import re
+import time
+from app.urllookup import clean_page, clean_pages
+
+
+class LegacyUrl(object):
+    full_url = page = org0 = section0 = section1 = None
+
+
+def legacy_reg_match(r, x, i):
+    '''reg_match() as it was before the rules were compiled'''
+
+    r = r + '/'
+    p = re.compile(r)
+    s = p.search(x)
+
+    if s:
+        t = re.split('\/', x, maxsplit=3)
+        if i == 0:
+            found = t[1]
+        if i == 1:
+            found = '/' + t[1] + '/' + t[2]
+        elif i == 2:
+            found = t[2]
+    else:
+        found = x
+    return(found)
+
+
+def legacy_clean_url(x, UrlModel=LegacyUrl, query='\/?browse'):
+    '''clean_url() as it was before the rules were compiled'''
+
+    url = UrlModel()
+    url.full_url = x.full_url
+    url.page = x.full_url
+
+    if re.search('/government/world', x.full_url):
+        url.org0 = 'Foreign & Commonwealth Office'
+        url.page = '/government/world'
+    elif re.search('\/guidance|\/government', x.full_url):
+        if url.org0 is None:
+            url.page = x.full_url
+    elif re.search('\/browse', x.full_url):
+        url.page = legacy_reg_match(query, x.full_url, 1)
+        url.section0 = legacy_reg_match(query, x.full_url, 2)
+    elif ((x.full_url == '/') or re.search(
+            '^/search.*', x.full_url) or re.search('^/help.*', x.full_url)):
+        url.section0 = 'site-nav'
+        url.section1 = 'site-nav'
+    elif re.search('^/contact.*', x.full_url):
+        url.section0 = 'contact'
+        url.section1 = 'contact'
+    else:
+        url.page = '/' + legacy_reg_match('.*', x.full_url, 0)
+
+    return(url)
+
+
+def read_urls(rows, unique=10000, file='govukurls.txt'):
+    '''Return rows urls with at most unique distinct values'''
+    with open(file) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    urls += ['/', '/search?q=tax', '/help/cookies', '/contact/hmrc',
+             '/browse/benefits/universal-credit', '/government/world/turkey']
+    distinct = [urls[i % len(urls)] + ('' if i < len(urls) else '?%d' % i)
+                for i in range(max(unique, len(urls)))]
+    return [distinct[i % len(distinct)] for i in range(rows)]
+
+
+def run(rows=1000000, unique=10000, legacy_rows=100000):
+    '''
+    Run the benchmark and print a table of results. The legacy
+    implementation is slow, so it is timed on the first legacy_rows urls.
+
+    Returns a dict of urls cleaned per second for each implementation.
+    '''
+
+    urls = read_urls(rows, unique)
+    results = {}
+
+    sample = urls[:legacy_rows]
+    start = time.perf_counter()
+    legacy = []
+    for url in sample:
+        x = LegacyUrl()
+        x.full_url = url
+        legacy.append(legacy_clean_url(x))
+    results['legacy'] = len(sample) / (time.perf_counter() - start)
+
+    # Memoisation is part of what is being measured, so start cold
+
+    clean_page.cache_clear()
+    start = time.perf_counter()
+    cleaned = list(clean_pages(urls))
+    results['compiled'] = len(urls) / (time.perf_counter() - start)
+
+    mismatches = sum(
+        1 for old, new in zip(legacy, cleaned)
+        if (old.page, old.org0, old.section0, old.section1) != new)
+
+    print('%12s %16s' % ('', 'urls/second'))
+    for name in ('legacy', 'compiled'):
+        print('%12s %16.0f' % (name, results[name]))
+    print('%d urls cleaned (%d distinct), %d differ from legacy' % (
+        len(urls), len(set(urls)), mismatches))
+
+    return results
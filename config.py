@@ -1,4 +1,5 @@
 import os
+import tempfile
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -7,7 +8,8 @@ class Config:
     SSL_DISABLE = False
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = True
+    # Queries are counted and timed by app/metrics.py instead
+    SQLALCHEMY_RECORD_QUERIES = False
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
@@ -20,6 +22,89 @@ class Config:
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 30
     FLASKY_SLOW_DB_QUERY_TIME = 0.5
+    # Share of the statements slower than that which are logged and
+    # explained (every one is counted)
+    FLASKY_SLOW_QUERY_SAMPLE_RATE = float(
+        os.environ.get('FLASKY_SLOW_QUERY_SAMPLE_RATE') or 0.1)
+    # Plans captured for each slow statement, hours before another is
+    # captured after that, most seconds spent explaining a statement, and
+    # the number of recent durations kept for percentiles
+    FLASKY_SLOW_QUERY_PLANS = 3
+    FLASKY_SLOW_QUERY_REPLAN_HOURS = 24
+    FLASKY_SLOW_QUERY_EXPLAIN_TIMEOUT = 30
+    FLASKY_SLOW_QUERY_KEEP = 100
+    # Directory shared by the workers for the sampling profiler's settings
+    # and profiles (see app/sampler.py)
+    FLASKY_PROFILE_DIR = os.environ.get('FLASKY_PROFILE_DIR') or \
+        os.path.join(tempfile.gettempdir(), 'classify-profiles')
+    # Directory shared by the gunicorn workers for their metrics, how often
+    # each worker writes its metrics there (in seconds), and the bearer
+    # token needed to read /metrics
+    FLASKY_METRICS_DIR = os.environ.get('FLASKY_METRICS_DIR')
+    FLASKY_METRICS_FLUSH_INTERVAL = 1
+    FLASKY_METRICS_TOKEN = os.environ.get('FLASKY_METRICS_TOKEN')
+    # Report the number of database queries made for each request in an
+    # X-Query-Count header, for the load test
+    FLASKY_QUERY_COUNT_HEADER = False
+    # Send a Server-Timing header with the time spent in each phase of a
+    # request, and write the phases of every request as JSON lines to this
+    # file ('-' for stderr) if set (see app/tracing.py)
+    FLASKY_SERVER_TIMING = True
+    FLASKY_TRACE_LOG = os.environ.get('FLASKY_TRACE_LOG')
+    # Seconds a coder has to classify a survey before it is offered to
+    # someone else
+    FLASKY_SURVEY_LEASE_TIME = int(
+        os.environ.get('FLASKY_SURVEY_LEASE_TIME') or 600)
+    # Number of surveys shown on each page of the batch classification mode
+    FLASKY_BATCH_SIZE = int(os.environ.get('FLASKY_BATCH_SIZE') or 10)
+    # Most surveys a client can lease with one API request, and how long API
+    # tokens last (in seconds)
+    FLASKY_API_MAX_SURVEYS = 20
+    FLASKY_API_TOKEN_EXPIRATION = 3600
+    # Seconds the active codes are cached for in each worker. Changes made
+    # through the app are picked up straight away in the worker that made them
+    FLASKY_CODE_CACHE_TTL = int(
+        os.environ.get('FLASKY_CODE_CACHE_TTL') or 300)
+    # Where pages are looked up, and how hard to hit it: concurrent lookups,
+    # most requests per second, seconds before a request times out and the
+    # number of retries after an error
+    GOVUK_URL = os.environ.get('GOVUK_URL') or 'https://www.gov.uk'
+    FLASKY_LOOKUP_WORKERS = int(os.environ.get('FLASKY_LOOKUP_WORKERS') or 8)
+    FLASKY_LOOKUP_RATE = float(os.environ.get('FLASKY_LOOKUP_RATE') or 10)
+    FLASKY_LOOKUP_TIMEOUT = 5
+    FLASKY_LOOKUP_RETRIES = 4
+    # Days before a page is looked up again, to pick up Machinery of
+    # Government changes
+    FLASKY_URL_LOOKUP_TTL = int(os.environ.get('FLASKY_URL_LOOKUP_TTL') or 30)
+    # Number of surveys read from raw at a time by the url lookup
+    FLASKY_PIPELINE_CHUNK_SIZE = 5000
+    # The survey provider's API, which new surveys are pulled from by
+    # python manage.py sync_surveys: responses per page, pages fetched at
+    # once and most requests per second
+    SURVEY_PROVIDER_URL = os.environ.get('SURVEY_PROVIDER_URL')
+    SURVEY_PROVIDER_TOKEN = os.environ.get('SURVEY_PROVIDER_TOKEN')
+    FLASKY_SYNC_PAGE_SIZE = 100
+    FLASKY_SYNC_WORKERS = 4
+    FLASKY_SYNC_RATE = float(os.environ.get('FLASKY_SYNC_RATE') or 2)
+    # Number of rows of a survey export loaded into raw at a time
+    FLASKY_INGEST_BATCH_SIZE = 10000
+    # Processes used to screen survey comments for personal information as
+    # they are loaded, distinct comments remembered between batches, and the
+    # scrubadub detectors left out. Names and urls are left out by default:
+    # the name detector flags most surveys (any capitalised word will do),
+    # and urls are almost always links to GOV.UK
+    FLASKY_PII_WORKERS = int(
+        os.environ.get('FLASKY_PII_WORKERS') or os.cpu_count() or 1)
+    FLASKY_PII_CACHE_SIZE = 100000
+    FLASKY_PII_SKIP_DETECTORS = [
+        i for i in (os.environ.get('FLASKY_PII_SKIP_DETECTORS') or
+                    'name,url').split(',') if i]
+    # Where generated datasets are saved by python manage.py snapshot, to be
+    # loaded again by tests and benchmarks
+    FLASKY_SNAPSHOT_DIR = os.environ.get('FLASKY_SNAPSHOT_DIR') or \
+        os.path.join(basedir, 'snapshots')
+    # Keep API responses compact
+    JSONIFY_PRETTYPRINT_REGULAR = False
     NOTIFY_API_KEY = os.environ.get('NOTIFY_API_KEY')
     SESSION_COOKIE_SECURE = True
     REMEMBER_COOKIE_SECURE = True
@@ -38,6 +123,17 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL')
     WTF_CSRF_ENABLED = False
+    FLASKY_PII_WORKERS = 0
+
+
+class LoadTestConfig(Config):
+    # Run by python manage.py loadtest under gunicorn, over plain http on
+    # localhost, against the database the load test was started with
+    SQLALCHEMY_DATABASE_URI = os.environ.get('LOADTEST_DATABASE_URL')
+    SSL_DISABLE = True
+    SESSION_COOKIE_SECURE = False
+    REMEMBER_COOKIE_SECURE = False
+    FLASKY_QUERY_COUNT_HEADER = True
 
 
 class ProductionConfig(Config):
@@ -103,6 +199,7 @@ class UnixConfig(ProductionConfig):
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'loadtest': LoadTestConfig,
     'production': ProductionConfig,
     'heroku': HerokuConfig,
     'unix': UnixConfig,
@@ -5,9 +5,14 @@ import sys
 import unittest
 from flask_migrate import upgrade, Migrate, MigrateCommand
 from app.queryloader import query_loader
+from app.priority import (
+    create_priority_triggers, rebuild_priority as rebuild_priority_table,
+    check_priority as check_priority_table)
 from app import create_app, db
 from app.models import (User, Role, Permission, Codes, Raw, ProjectCodes,
-        Classified, Priority, Urls)
+        Classified, Priority, SurveyPriority, Urls)
+from app.codecache import code_cache
+from app.codercounts import create_coder_count_triggers, rebuild_coder_counts
 from flask_script import Manager, Shell
 from werkzeug.contrib.profiler import ProfilerMiddleware
 
@@ -41,12 +46,74 @@ def make_shell_context():
         Raw=Raw,
         Classified=Classified,
         Priority=Priority,
-        Urls=Urls
+        SurveyPriority=SurveyPriority,
+        Urls=Urls,
+        code_cache=code_cache
         )
 
 manager.add_command("shell", Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
+snapshot = Manager(usage='Save and load generated datasets')
+manager.add_command('snapshot', snapshot)
+
+
+def has_surveys():
+    if db.session.execute('select exists (select 1 from raw)').scalar():
+        print('The database already has surveys, which this would replace. '
+              'Use --reset to go ahead anyway.')
+        return True
+    return False
+
+
+def has_surveys_or_users():
+    if db.session.execute(
+            'select exists (select 1 from raw) '
+            'or exists (select 1 from users)').scalar():
+        print('The database already has surveys or user accounts. Loading a '
+              'snapshot deletes them all, including every user account, and '
+              'replaces them with the snapshot\'s. Use --reset to go ahead '
+              'anyway.')
+        return True
+    return False
+
+
+@snapshot.option('--scale', dest='scale', type=int, default=100000,
+                 help='Number of surveys')
+@snapshot.option('--seed', dest='seed', type=int, default=0,
+                 help='Seed for the generated data')
+@snapshot.option('--reset', dest='reset', action='store_true', default=False,
+                 help='Replace any surveys already in the database')
+def save(scale, seed, reset):
+    """Generate a dataset and save it as a snapshot."""
+    from app.snapshot import save_snapshot, snapshot_path
+    if reset or not has_surveys():
+        manifest = save_snapshot(scale, seed)
+        print('Saved %d classifications of %d surveys to %s' % (
+            manifest['tables']['classified']['rows'],
+            manifest['tables']['raw']['rows'], snapshot_path(scale, seed)))
+
+
+@snapshot.option('--scale', dest='scale', type=int, default=100000,
+                 help='Number of surveys')
+@snapshot.option('--seed', dest='seed', type=int, default=0,
+                 help='Seed for the generated data')
+@snapshot.option('--reset', dest='reset', action='store_true', default=False,
+                 help='Delete the surveys and user accounts already in the '
+                      'database')
+def load(scale, seed, reset):
+    """
+    Load a saved dataset, generating it first if need be. This deletes every
+    user account, along with the surveys, and replaces them with the
+    snapshot's.
+    """
+    from app.snapshot import load_snapshot
+    if reset or not has_surveys_or_users():
+        manifest = load_snapshot(scale, seed)
+        print('Loaded %d classifications of %d surveys in %.1fs' % (
+            manifest['tables']['classified']['rows'],
+            manifest['tables']['raw']['rows'], manifest['seconds']))
+
 
 @manager.command
 def test(coverage=False):
@@ -77,10 +144,204 @@ def profile(length=25, profile_dir=None):
     app.run()
 
 
+@manager.option('--surveys', dest='surveys', type=int, default=5000,
+                help='Number of benchmark surveys to insert into raw')
+@manager.option('--steps', dest='steps', type=int, default=5,
+                help='Number of times to grow the classified table')
+@manager.option('--step-size', dest='step_size', type=int, default=20000,
+                help='Rows added to classified at each step')
+@manager.option('--repeats', dest='repeats', type=int, default=20,
+                help='Number of timed calls to new_survey() at each step')
+def bench_selection(surveys, steps, step_size, repeats):
+    """Benchmark the next survey lookup as classified grows."""
+    from benchmarks.selection import run
+    run(surveys, steps, step_size, repeats)
+
+
+@manager.option('--pages', dest='pages', type=int, default=1000,
+                help='Number of distinct pages to look up')
+@manager.option('--workers', dest='workers', type=int, default=8,
+                help='Concurrent lookups')
+@manager.option('--rate', dest='rate', type=float, default=0,
+                help='Most requests per second (0 for no limit)')
+@manager.option('--latency', dest='latency', type=float, default=0.02,
+                help='Seconds the stub API takes to answer each request')
+def bench_lookup(pages, workers, rate, latency):
+    """Benchmark GOV.UK search API lookups against a local stub."""
+    from benchmarks.lookup import run
+    run(pages, workers, rate, latency)
+
+
+@manager.option('--rows', dest='rows', type=int, default=1000000,
+                help='Number of urls to clean')
+@manager.option('--unique', dest='unique', type=int, default=10000,
+                help='Number of distinct urls among them')
+@manager.option('--legacy-rows', dest='legacy_rows', type=int, default=100000,
+                help='Number of urls to clean with the legacy clean_url()')
+def bench_urls(rows, unique, legacy_rows):
+    """Benchmark cleaning urls against the legacy clean_url()."""
+    from benchmarks.urlrules import run
+    run(rows, unique, legacy_rows)
+
+
+@manager.option('--ttl', dest='ttl', type=int, default=None,
+                help='Look up pages last looked up more than this many days ago')
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=None,
+                help='Number of surveys to read from raw at a time')
+@manager.option('--restart', dest='restart', action='store_true',
+                default=False,
+                help='Go through every survey, not just those since the last run')
+def lookup_urls(ttl, chunk_size, restart):
+    """Look up the pages surveys were filled in on, on GOV.UK."""
+    from app.urllookup import api_lookup
+
+    def progress(totals):
+        print('%(surveys)d surveys (up to %(respondent_id)d): looked up '
+              '%(looked_up)d pages (%(failed)d failed), saved %(saved)d urls'
+              % totals)
+
+    api_lookup(ttl, chunk_size=chunk_size, restart=restart, progress=progress)
+
+
+@manager.option('path', help='CSV (or gzipped CSV) export from the survey software')
+@manager.option('--batch-size', dest='batch_size', type=int, default=None,
+                help='Number of rows to load at a time')
+def ingest(path, batch_size):
+    """Load a survey export into raw."""
+    import time
+    from app.ingest import ingest as ingest_export
+
+    start = time.time()
+
+    def progress(totals):
+        print('%(rows)d rows: %(inserted)d inserted, %(updated)d updated, '
+              '%(unchanged)d unchanged, %(rejected)d rejected, %(pii)d with '
+              'pii, %(automated)d coded automatically' % totals)
+
+    totals = ingest_export(path, batch_size, progress)
+    print('Loaded %d rows in %.1fs' % (totals['rows'], time.time() - start))
+    for error in totals['errors']:
+        print('Rejected %s' % error)
+
+
+@manager.command
+def sync_surveys():
+    """Pull surveys which have ended since the last sync from the provider."""
+    from app.surveysync import sync_surveys as sync
+
+    def progress(totals):
+        print('%(fetched)d fetched: %(inserted)d inserted, %(updated)d '
+              'updated, %(skipped)d already loaded, %(rejected)d rejected, '
+              '%(pii)d with pii, %(automated)d coded automatically' % totals)
+
+    totals = sync(progress=progress)
+    for error in totals['errors']:
+        print('Rejected %s' % error)
+
+
+@manager.option('--surveys', dest='surveys', type=int, default=20000,
+                help='Number of surveys served by the stub provider')
+@manager.option('--page-size', dest='page_size', type=int, default=100,
+                help='Surveys per page')
+@manager.option('--workers', dest='workers', type=int, default=4,
+                help='Pages fetched at once')
+@manager.option('--latency', dest='latency', type=float, default=0.05,
+                help='Seconds the stub provider takes to answer each request')
+def bench_sync(surveys, page_size, workers, latency):
+    """Benchmark syncing surveys from a local stub provider."""
+    from benchmarks.sync import run
+    run(surveys, page_size, workers, 0, latency)
+
+
+@manager.option('--scales', dest='scales', default='10000,100000,1000000',
+                help='Comma separated numbers of surveys to benchmark at')
+@manager.option('--repeats', dest='repeats', type=int, default=20,
+                help='Times each query or request is timed')
+@manager.option('--seed', dest='seed', type=int, default=0,
+                help='Seed for the generated data')
+@manager.option('--output', dest='output', default='bench.json',
+                help='File to write the results to')
+@manager.option('--compare', dest='compare', default=None,
+                help='Results of an earlier run to compare with')
+@manager.option('--reset', dest='reset', action='store_true', default=False,
+                help='Delete the surveys and user accounts already in the '
+                     'database')
+def bench(scales, repeats, seed, output, compare, reset):
+    """Benchmark the views, selection and classify page at several scales."""
+    from benchmarks.suite import run
+    run([int(i) for i in scales.split(',')], repeats, seed, output, compare,
+        reset)
+
+
+@manager.option('--coders', dest='coders', type=int, default=10,
+                help='Number of coders classifying at once')
+@manager.option('--surveys', dest='surveys', type=int, default=2000,
+                help='Number of benchmark surveys to insert into raw')
+@manager.option('--per-coder', dest='per_coder', type=int, default=100,
+                help='Most surveys each coder classifies')
+@manager.option('--duration', dest='duration', type=float, default=60,
+                help='Most seconds to run for')
+@manager.option('--think-time', dest='think_time', type=float, default=0,
+                help='Mean seconds a coder spends reading each survey')
+@manager.option('--agreement', dest='agreement', type=float, default=0.7,
+                help='Chance that a coder applies the true code')
+@manager.option('--code-agreement', dest='code_agreement', default=None,
+                help='Agreement for particular codes, e.g. ok=0.9,none=0.5')
+@manager.option('--seed', dest='seed', type=int, default=0,
+                help='Seed for the coders\' choices')
+def simulate(coders, surveys, per_coder, duration, think_time, agreement,
+             code_agreement, seed):
+    """Simulate many coders classifying surveys at once."""
+    from benchmarks.simulate import run, parse_agreement
+    run(coders, surveys, per_coder, duration, think_time, agreement,
+        parse_agreement(code_agreement), seed=seed)
+
+
+@manager.option('--coders', dest='coders', type=int, default=20,
+                help='Number of coders logged in at once')
+@manager.option('--duration', dest='duration', type=float, default=60,
+                help='Seconds to run for')
+@manager.option('--think-time', dest='think_time', type=float, default=2,
+                help='Mean seconds a coder spends reading each survey')
+@manager.option('--browse-every', dest='browse_every', type=int, default=10,
+                help='Surveys between visits to the leaderboards and codes')
+@manager.option('--surveys', dest='surveys', type=int, default=5000,
+                help='Number of benchmark surveys to insert into raw')
+@manager.option('--workers', dest='workers', type=int, default=4,
+                help='Number of gunicorn workers to start')
+@manager.option('--url', dest='url', default=None,
+                help='Test an instance which is already running here, '
+                     'using the same database, instead of starting one')
+@manager.option('--seed', dest='seed', type=int, default=0,
+                help='Seed for the coders\' choices')
+def loadtest(coders, duration, think_time, browse_every, surveys, workers,
+             url, seed):
+    """Load test the classification pages with many coders over HTTP."""
+    from benchmarks.loadtest import run
+    run(coders, duration, think_time, browse_every, surveys, workers, url,
+        seed)
+
+
+@manager.command
+def code_nones():
+    """Code every survey with no free text as 'none'."""
+    from app.autocode import code_nones as code
+    count = code()
+    db.session.commit()
+    print('Coded %d empty surveys' % count)
+
+
+@manager.command
+def purge_leases():
+    """Delete expired survey leases."""
+    from app.surveyqueue import purge_expired_leases
+    print('Removed %d expired leases' % purge_expired_leases())
+
+
 @manager.command
 def deploy_local():
     deploy()
-    populate()
+    populate(1000, 10, 500, None)
 
 
 @manager.command
@@ -100,16 +361,68 @@ def deploy():
     query = query_loader('sql/views/leaders.sql')
     db.session.execute(query)
 
+    # Create the triggers which maintain the survey_priority table, and
+    # bring it up to date with any existing surveys
+    create_priority_triggers()
+    rebuild_priority_table()
+
+    # Likewise for the per coder daily counts behind the leaderboards
+    create_coder_count_triggers()
+    rebuild_coder_counts()
+
 
 @manager.command
-def populate():
+def rebuild_priority():
+    """Rebuild the survey_priority table from raw and classified."""
+    count = rebuild_priority_table()
+    print('Rebuilt priority for %d surveys' % count)
+
+
+@manager.command
+def rebuild_counts():
+    """Rebuild the coder_daily_counts table from classified."""
+    count = rebuild_coder_counts()
+    print('Rebuilt %d daily counts' % count)
+
+
+@manager.command
+def check_priority():
+    """Check that survey_priority matches the priority view."""
+    mismatches = check_priority_table()
+    if not mismatches:
+        print('survey_priority matches the priority view')
+        return
+    print('%d rows differ between survey_priority and the priority view:'
+          % len(mismatches))
+    for row in mismatches:
+        print(dict(row.items()))
+    print('Note that surveys on the edge of the limit in the priority view '
+          'may be reported here too.')
+    sys.exit(1)
+
+
+@manager.option('--surveys', dest='surveys', type=int, default=1000,
+                help='Number of fake surveys')
+@manager.option('--users', dest='users', type=int, default=10,
+                help='Number of fake users')
+@manager.option('--classified', dest='classified', type=int, default=500,
+                help='Number of fake classifications')
+@manager.option('--seed', dest='seed', type=int, default=None,
+                help='Seed for the random numbers, to repeat a dataset')
+def populate(surveys, users, classified, seed):
     """Populate database with fake data."""
+    import time
+    from app.autocode import code_nones
 
-    Raw.generate_fake(1000)
-    Codes.generate_fake()
-    ProjectCodes.generate_fake()
-    User.generate_fake(10)
-    Classified.generate_fake(500, 10)
+    start = time.time()
+    Codes.generate_fake(seed=seed)
+    ProjectCodes.generate_fake(seed=seed)
+    User.generate_fake(users, seed)
+    Raw.generate_fake(surveys, seed)
+    code_nones()
+    db.session.commit()
+    Classified.generate_fake(classified, users, seed)
+    print('Populated the database in %.1fs' % (time.time() - start))
 
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,41 @@
+"""add screened_surveys table
+
+Revision ID: 3e6b9d17c4a2
+Revises: 8b1f4c62d7e3
+Create Date: 2026-10-18 18:12:44.207351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e6b9d17c4a2'
+down_revision = '8b1f4c62d7e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('screened_surveys',
+    sa.Column('respondent_id', sa.BigInteger(), nullable=False),
+    sa.Column('comment_what_work', sa.String(), nullable=True),
+    sa.Column('comment_why_you_came', sa.String(), nullable=True),
+    sa.Column('comment_other_found_what', sa.String(), nullable=True),
+    sa.Column('comment_other_where_for_help', sa.String(), nullable=True),
+    sa.Column('comment_other_else_help', sa.String(), nullable=True),
+    sa.Column('comment_where_for_help', sa.String(), nullable=True),
+    sa.Column('comment_further_comments', sa.String(), nullable=True),
+    sa.Column('pii', sa.Boolean(), nullable=False),
+    sa.Column('pii_types', sa.ARRAY(sa.String()), nullable=True),
+    sa.Column('screened', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['respondent_id'], ['raw.respondent_id'], ),
+    sa.PrimaryKeyConstraint('respondent_id')
+    )
+
+
+def downgrade():
+    # The priority view reads from screened_surveys, and is recreated by
+    # python manage.py deploy
+    op.execute('drop view if exists priority')
+    op.drop_table('screened_surveys')
@@ -0,0 +1,55 @@
+"""add survey_codes and survey_priority tables
+
+Revision ID: 4d8e2f7a9b10
+Revises: c3f1a2b4d5e6
+Create Date: 2026-10-18 10:02:17.530114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8e2f7a9b10'
+down_revision = 'c3f1a2b4d5e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('survey_codes',
+    sa.Column('respondent_id', sa.BigInteger(), nullable=False),
+    sa.Column('code_id', sa.Integer(), nullable=False),
+    sa.Column('n', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['code_id'], ['codes.code_id'], ),
+    sa.ForeignKeyConstraint(['respondent_id'], ['raw.respondent_id'], ),
+    sa.PrimaryKeyConstraint('respondent_id', 'code_id')
+    )
+    op.create_table('survey_priority',
+    sa.Column('respondent_id', sa.BigInteger(), nullable=False),
+    sa.Column('month', sa.DateTime(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('max', sa.Integer(), nullable=True),
+    sa.Column('ratio', sa.Float(), nullable=True),
+    sa.Column('vote', sa.Integer(), nullable=True),
+    sa.Column('coders', postgresql.ARRAY(sa.Integer()), nullable=True),
+    sa.Column('pii', sa.Integer(), nullable=True),
+    sa.Column('automated', sa.Integer(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['respondent_id'], ['raw.respondent_id'], ),
+    sa.PrimaryKeyConstraint('respondent_id')
+    )
+    op.create_index(op.f('ix_survey_priority_priority'), 'survey_priority', ['priority'], unique=False)
+    op.create_index('ix_survey_priority_queue', 'survey_priority',
+                    [sa.text('month DESC'), 'priority'], unique=False,
+                    postgresql_where=sa.text('priority < 6'))
+
+
+def downgrade():
+    op.execute('drop trigger if exists survey_priority_new_code on classified')
+    op.execute('drop trigger if exists survey_priority_new_survey on raw')
+    op.drop_index('ix_survey_priority_queue', table_name='survey_priority')
+    op.drop_index(op.f('ix_survey_priority_priority'), table_name='survey_priority')
+    op.drop_table('survey_priority')
+    op.drop_table('survey_codes')
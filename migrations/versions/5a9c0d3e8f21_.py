@@ -0,0 +1,34 @@
+"""add coder_daily_counts table
+
+Revision ID: 5a9c0d3e8f21
+Revises: e7a3c91f0d24
+Create Date: 2026-10-18 14:02:37.418270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9c0d3e8f21'
+down_revision = 'e7a3c91f0d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('coder_daily_counts',
+    sa.Column('coder_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('n', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['coder_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('coder_id', 'day')
+    )
+
+
+def downgrade():
+    op.execute('drop trigger if exists coder_daily_counts_change on classified')
+    # The leaders views read from coder_daily_counts, and need to be
+    # recreated from sql/views/leaders.sql after downgrading
+    op.execute('drop view if exists leaders, daily_leaders, weekly_leaders')
+    op.drop_table('coder_daily_counts')
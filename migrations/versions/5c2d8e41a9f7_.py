@@ -0,0 +1,52 @@
+"""add slow_queries and slow_query_plans tables
+
+Revision ID: 5c2d8e41a9f7
+Revises: 3e6b9d17c4a2
+Create Date: 2026-10-18 21:40:12.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e41a9f7'
+down_revision = '3e6b9d17c4a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('slow_queries',
+    sa.Column('fingerprint', sa.String(length=40), nullable=False),
+    sa.Column('statement', sa.Text(), nullable=False),
+    sa.Column('example', sa.Text(), nullable=True),
+    sa.Column('endpoint', sa.String(length=64), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total_seconds', sa.Float(), nullable=False),
+    sa.Column('max_seconds', sa.Float(), nullable=True),
+    sa.Column('durations', sa.ARRAY(sa.Float()), nullable=True),
+    sa.Column('first_seen', sa.DateTime(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('fingerprint')
+    )
+    op.create_table('slow_query_plans',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fingerprint', sa.String(length=40), nullable=False),
+    sa.Column('captured', sa.DateTime(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('execution_ms', sa.Float(), nullable=True),
+    sa.Column('total_cost', sa.Float(), nullable=True),
+    sa.Column('plan', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['fingerprint'], ['slow_queries.fingerprint'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_slow_query_plans_fingerprint'),
+                    'slow_query_plans', ['fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_slow_query_plans_fingerprint'),
+                  table_name='slow_query_plans')
+    op.drop_table('slow_query_plans')
+    op.drop_table('slow_queries')
@@ -0,0 +1,30 @@
+"""add checkpoints table
+
+Revision ID: 8b1f4c62d7e3
+Revises: 5a9c0d3e8f21
+Create Date: 2026-10-18 16:41:09.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f4c62d7e3'
+down_revision = '5a9c0d3e8f21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('checkpoints',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('respondent_id', sa.BigInteger(), nullable=True),
+    sa.Column('end_date', sa.DateTime(), nullable=True),
+    sa.Column('updated', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('checkpoints')
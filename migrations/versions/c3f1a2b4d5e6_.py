@@ -0,0 +1,25 @@
+"""add composite classified index for next survey lookup
+
+Revision ID: c3f1a2b4d5e6
+Revises: 95a1e260d7ba
+Create Date: 2026-10-18 09:12:41.118302
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a2b4d5e6'
+down_revision = '95a1e260d7ba'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_classified_coder_id_respondent_id', 'classified',
+                    ['coder_id', 'respondent_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_classified_coder_id_respondent_id',
+                  table_name='classified')
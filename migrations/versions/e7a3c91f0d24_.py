@@ -0,0 +1,35 @@
+"""add survey_leases table
+
+Revision ID: e7a3c91f0d24
+Revises: 4d8e2f7a9b10
+Create Date: 2026-10-18 11:20:05.228931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c91f0d24'
+down_revision = '4d8e2f7a9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('survey_leases',
+    sa.Column('respondent_id', sa.BigInteger(), nullable=False),
+    sa.Column('coder_id', sa.Integer(), nullable=False),
+    sa.Column('leased_until', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['coder_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['respondent_id'], ['raw.respondent_id'], ),
+    sa.PrimaryKeyConstraint('respondent_id')
+    )
+    op.create_index(op.f('ix_survey_leases_coder_id'), 'survey_leases', ['coder_id'], unique=False)
+    op.create_index(op.f('ix_survey_leases_leased_until'), 'survey_leases', ['leased_until'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_survey_leases_leased_until'), table_name='survey_leases')
+    op.drop_index(op.f('ix_survey_leases_coder_id'), table_name='survey_leases')
+    op.drop_table('survey_leases')
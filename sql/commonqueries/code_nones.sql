@@ -1,15 +1,22 @@
-with cte as (select respondent_id 
-from raw 
-where comment_why_you_came is Null
-and comment_where_for_help is Null
-and comment_further_comments is Null
+-- Code surveys with no free text as 'none', by the 'automated' user.
+-- This now runs after every ingest and sync (see app/autocode.py), or
+-- for the whole of raw with: python manage.py code_nones
+-- Surveys already coded by the automated user are left alone.
+with ids as (
+select (select id from users where username = 'automated') as coder_id,
+    (select code_id from codes where code = 'none') as code_id,
+    (select project_code_id from project_codes
+     where project_code = 'none') as project_code_id
 )
-insert into classified (respondent_id, coder_id, code_id, project_code_id,pii,date_coded)
-select respondent_id,
-        (select id from users where username='automated') as coder_id,
-        (select code_id from codes where code='none')  as code_id,
-        (select project_code_id from project_codes where project_code='none') as project_code_id,
-        'f' as pii,
-        (select * from now()) as date_coded
- from cte;
-
+insert into classified (respondent_id, coder_id, code_id, project_code_id,
+    pii, date_coded)
+select raw.respondent_id, ids.coder_id, ids.code_id, ids.project_code_id,
+    false, now()
+from raw, ids
+where raw.comment_why_you_came is null
+and raw.comment_where_for_help is null
+and raw.comment_further_comments is null
+and not exists (
+    select 1 from classified c
+    where c.coder_id = ids.coder_id
+    and c.respondent_id = raw.respondent_id);
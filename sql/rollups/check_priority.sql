@@ -0,0 +1,35 @@
+-- Use only in-line comments in this file, as they will be
+-- identified and removed by query_loader().
+-- List the surveys where the survey_priority table disagrees with the
+-- priority view. Returns no rows when the two match.
+-- The view can return duplicate rows for tied votes, hence the distinct.
+-- Only surveys inside the view's 'limit 5000' window can be compared.
+with view_rows as (
+select distinct respondent_id,
+    cast(total as integer) as total,
+    cast(max as integer) as max,
+    vote,
+    round(cast(ratio as numeric), 4) as ratio,
+    coders,
+    cast(pii as integer) as pii,
+    priority
+from priority
+),
+table_rows as (
+select respondent_id,
+    total,
+    max,
+    vote,
+    round(cast(ratio as numeric), 4) as ratio,
+    coders,
+    pii,
+    priority
+from survey_priority
+where respondent_id in (select respondent_id from view_rows)
+)
+select 'view' as source, only_view.*
+from (select * from view_rows except select * from table_rows) only_view
+union all
+select 'table' as source, only_table.*
+from (select * from table_rows except select * from view_rows) only_table
+order by respondent_id, source;
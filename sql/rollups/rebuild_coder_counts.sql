@@ -0,0 +1,12 @@
+-- Use only in-line comments in this file, as they will be
+-- identified and removed by query_loader().
+-- Rebuild coder_daily_counts from scratch, e.g. after a bulk load with the
+-- triggers disabled, or after classified rows have been edited by hand.
+truncate coder_daily_counts;
+insert into coder_daily_counts (coder_id, day, n)
+select coder_id, cast(date_coded as date), count(*)
+from classified
+where coder_id is not null
+and date_coded is not null
+group by coder_id, cast(date_coded as date);
+analyze coder_daily_counts;
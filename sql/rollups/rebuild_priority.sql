@@ -0,0 +1,67 @@
+-- Use only in-line comments in this file, as they will be
+-- identified and removed by query_loader().
+-- Rebuild survey_codes and survey_priority from scratch, e.g. after a
+-- bulk load with the triggers disabled, or after classified rows have
+-- been deleted or edited by hand.
+truncate survey_codes, survey_priority;
+insert into survey_codes (respondent_id, code_id, n)
+select respondent_id, code_id, count(*)
+from classified
+where respondent_id is not null
+group by respondent_id, code_id;
+insert into survey_priority (respondent_id, month, total, max, ratio,
+    vote, coders, pii, automated, priority)
+with totals as (
+select respondent_id,
+    cast(sum(n) as integer) as total,
+    max(n) as max
+from survey_codes
+group by respondent_id
+),
+-- The most frequently applied code for each survey
+top_code as (
+select distinct on (respondent_id) respondent_id, code_id
+from survey_codes
+order by respondent_id, n desc, code_id
+),
+who_coded_what as (
+select respondent_id,
+    array_agg(distinct classified.coder_id) as coders,
+    cast(count(pii or null) as integer) as pii,
+    max(case when users.username = 'automated' then 1 else 0 end) as automated
+from classified
+left join users
+on (classified.coder_id = users.id)
+group by respondent_id
+),
+survey_level as (
+select raw.respondent_id,
+    date_trunc('month', raw.start_date) as month,
+    coalesce(t.total, 1) as total,
+    coalesce(t.max, 1) as max,
+    coalesce(cast(t.max as real) / cast(t.total as real), 1) as ratio,
+    case when t.total > 2
+            and cast(t.max as real) / cast(t.total as real) > 0.5
+            then tc.code_id
+         when t.total = 1 then tc.code_id
+         else null
+    end as vote,
+    wcw.coders,
+    case when ss.pii then coalesce(wcw.pii, 0) + 1 else wcw.pii end as pii,
+    coalesce(wcw.automated, 0) as automated
+from raw
+left join totals t
+on (raw.respondent_id = t.respondent_id)
+left join top_code tc
+on (raw.respondent_id = tc.respondent_id)
+left join who_coded_what wcw
+on (raw.respondent_id = wcw.respondent_id)
+left join screened_surveys ss
+on (raw.respondent_id = ss.respondent_id)
+)
+select respondent_id, month, total, max, ratio, vote, coders, pii,
+    automated,
+    survey_priority_level(total, ratio, vote, pii, automated) as priority
+from survey_level;
+analyze survey_codes;
+analyze survey_priority;
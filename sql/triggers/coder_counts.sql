@@ -0,0 +1,28 @@
+-- Use only in-line comments in this file, as they will be
+-- identified and removed by query_loader().
+-- Keeps coder_daily_counts up to date as surveys are classified, so that
+-- the number of surveys a coder has classified on a given day (and the
+-- leaderboards) can be read without counting rows in classified.
+create or replace function coder_daily_counts_change()
+returns trigger as $$
+begin
+    if tg_op = 'INSERT' then
+        if new.coder_id is not null and new.date_coded is not null then
+            insert into coder_daily_counts (coder_id, day, n)
+            values (new.coder_id, cast(new.date_coded as date), 1)
+            on conflict (coder_id, day)
+            do update set n = coder_daily_counts.n + 1;
+        end if;
+        return new;
+    end if;
+    update coder_daily_counts
+    set n = n - 1
+    where coder_id = old.coder_id
+    and day = cast(old.date_coded as date);
+    return old;
+end;
+$$ language plpgsql;
+drop trigger if exists coder_daily_counts_change on classified;
+create trigger coder_daily_counts_change
+after insert or delete on classified
+for each row execute procedure coder_daily_counts_change();
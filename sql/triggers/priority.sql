@@ -0,0 +1,126 @@
+-- Use only in-line comments in this file, as they will be
+-- identified and removed by query_loader().
+-- Keeps survey_codes and survey_priority up to date as surveys arrive
+-- and are classified. Each insert touches only the rows for one survey,
+-- so the cost does not grow with the size of classified.
+-- The rules are the same as those in sql/views/priority.sql.
+-- The lower the number, the higher the priority.
+create or replace function survey_priority_level(
+    total integer, ratio real, vote integer, pii integer, automated integer)
+returns integer as $$
+select case
+    when pii > 0 then 8
+    when automated = 1 and total = 1 then 6
+    when (ratio > 0.5 and total > 1 and total < 5)
+    or (ratio = 1 and total = 2) then 3
+    when ratio <= 0.5 and total <= 4 then 1
+    when total = 1 and ratio = 1 and vote is null then 2
+    when total = 1 and ratio = 1 then 1
+    when total > 4 and ratio < 0.5 then 7
+    else 9
+end
+$$ language sql immutable;
+-- A new survey has not been coded, which the priority view reports as
+-- total = 1, ratio = 1 and no vote (priority 2).
+create or replace function survey_priority_new_survey()
+returns trigger as $$
+begin
+    insert into survey_priority (respondent_id, month, total, max, ratio,
+        vote, coders, pii, automated, priority)
+    values (new.respondent_id, date_trunc('month', new.start_date),
+        1, 1, 1, null, null, null, 0, 2)
+    on conflict (respondent_id)
+    do update set month = excluded.month;
+    return new;
+end;
+$$ language plpgsql;
+drop trigger if exists survey_priority_new_survey on raw;
+create trigger survey_priority_new_survey
+after insert or update of start_date on raw
+for each row execute procedure survey_priority_new_survey();
+-- Count the new code against the survey, then recalculate the vote and
+-- priority from that survey's handful of survey_codes rows.
+create or replace function survey_priority_new_code()
+returns trigger as $$
+declare
+    survey_total integer;
+    survey_max integer;
+    survey_code integer;
+    survey_ratio real;
+    survey_vote integer;
+    survey_coders integer[];
+    survey_pii integer;
+    survey_automated integer;
+    coder_automated integer;
+begin
+    if new.respondent_id is null then
+        return new;
+    end if;
+    -- Lock the survey's row before counting its codes, so that two codes
+    -- for the same survey arriving together are counted one after the
+    -- other, the second seeing the first's survey_codes.
+    select coders, pii, automated
+    into survey_coders, survey_pii, survey_automated
+    from survey_priority
+    where respondent_id = new.respondent_id
+    for update;
+    insert into survey_codes (respondent_id, code_id, n)
+    values (new.respondent_id, new.code_id, 1)
+    on conflict (respondent_id, code_id)
+    do update set n = survey_codes.n + 1;
+    select cast(sum(n) as integer), max(n)
+    into survey_total, survey_max
+    from survey_codes
+    where respondent_id = new.respondent_id;
+    select code_id into survey_code
+    from survey_codes
+    where respondent_id = new.respondent_id
+    order by n desc, code_id
+    limit 1;
+    survey_ratio := cast(survey_max as real) / cast(survey_total as real);
+    survey_vote := case
+        when survey_total > 2 and survey_ratio > 0.5 then survey_code
+        when survey_total = 1 then survey_code
+        else null
+    end;
+    if survey_coders is null then
+        survey_coders := array[new.coder_id];
+    elsif not new.coder_id = any(survey_coders) then
+        survey_coders := array(
+            select c from unnest(array_append(survey_coders, new.coder_id)) c
+            order by c);
+    end if;
+    -- pii already includes any found when the survey was loaded
+    survey_pii := coalesce(survey_pii, 0)
+        + case when new.pii then 1 else 0 end;
+    select case when username = 'automated' then 1 else 0 end
+    into coder_automated
+    from users
+    where id = new.coder_id;
+    survey_automated := greatest(
+        coalesce(survey_automated, 0), coalesce(coder_automated, 0));
+    insert into survey_priority (respondent_id, month, total, max, ratio,
+        vote, coders, pii, automated, priority)
+    select new.respondent_id, date_trunc('month', raw.start_date),
+        survey_total, survey_max, survey_ratio, survey_vote, survey_coders,
+        survey_pii, survey_automated,
+        survey_priority_level(survey_total, survey_ratio, survey_vote,
+            survey_pii, survey_automated)
+    from raw
+    where raw.respondent_id = new.respondent_id
+    on conflict (respondent_id)
+    do update set total = excluded.total,
+        max = excluded.max,
+        ratio = excluded.ratio,
+        vote = excluded.vote,
+        coders = excluded.coders,
+        pii = excluded.pii,
+        automated = excluded.automated,
+        priority = excluded.priority;
+    return new;
+end;
+$$ language plpgsql;
+drop trigger if exists survey_priority_new_code on classified;
+create trigger survey_priority_new_code
+after insert on classified
+for each row execute procedure survey_priority_new_code();
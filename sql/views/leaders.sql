@@ -2,12 +2,15 @@
 -- identified and removed by query_loader().
 -- Remove pre-existing table and view which may have been 
 -- created by db.create_all()
-create view leaders as (
+-- The counts come from coder_daily_counts (one row per coder per day) which
+-- is kept up to date by sql/triggers/coder_counts.sql, rather than from
+-- counting every row in classified.
+create or replace view leaders as (
     with cte as (
-        select coder_id, count(*) as n 
-        from Classified 
+        select coder_id, sum(n) as n 
+        from coder_daily_counts 
         left join users
-        on users.id=classified.coder_id
+        on users.id=coder_daily_counts.coder_id
         where users.role_id not in (select id from roles where roles.name in ('User','Retired'))
         group by coder_id
     )
@@ -17,14 +20,14 @@ create view leaders as (
     on users.id=cte.coder_id limit 5
     );
 
-create view daily_leaders as (
+create or replace view daily_leaders as (
     with cte as (
-    select coder_id, count(*) as n
-    from classified 
+    select coder_id, sum(n) as n
+    from coder_daily_counts 
     left join users
-    on users.id=classified.coder_id
+    on users.id=coder_daily_counts.coder_id
     where users.role_id not in (select id from roles where roles.name in ('User','Retired'))
-    and date_coded > (select date_trunc('day', now()))
+    and day >= cast(date_trunc('day', now()) as date)
     group by coder_id
     )
     select row_number() over (order by cte.n desc) as rank, users.username, cte.n 
@@ -33,14 +36,14 @@ create view daily_leaders as (
     on users.id=cte.coder_id limit 5
     );
 
-create view weekly_leaders as (
+create or replace view weekly_leaders as (
     with cte as (
-    select coder_id, count(*) as n
-    from classified 
+    select coder_id, sum(n) as n
+    from coder_daily_counts 
     left join users
-    on users.id=classified.coder_id
+    on users.id=coder_daily_counts.coder_id
     where users.role_id not in (select id from roles where roles.name in ('User','Retired'))
-    and date_coded > (select date_trunc('week', now()) -INTERVAL '1 day')
+    and day >= cast(date_trunc('week', now()) - interval '1 day' as date)
     group by coder_id
     )
     select row_number() over (order by cte.n desc) as rank, users.username, cte.n 
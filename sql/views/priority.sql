@@ -1,7 +1,7 @@
 -- Use only in-line comments in this file, as they will be
 -- identified and removed by query_loader().
 -- Start with the join of raw to classified
-create view priority as (
+create or replace view priority as (
 with codes_join 
 as (select raw.respondent_id, code_id, count(*) as max
 from classified a
@@ -78,6 +78,13 @@ select  respondent_id,
 from classified
 group by respondent_id
 ),
+-- Surveys found to contain pii when they were loaded (see app/piiscreen.py)
+-- count as one more pii tick.
+screened as (
+select respondent_id, 1 as pii
+from screened_surveys
+where pii
+),
 final_priority as (
 -- Bind it all together,
 -- Priority is controlled with the case when statement here
@@ -89,10 +96,12 @@ select  slr.respondent_id,
         slr.ratio,
         slr.total,
         wcw.coders,
-        wcw.pii,
+        case when screened.pii = 1 then coalesce(wcw.pii, 0) + 1
+             else wcw.pii
+        end as pii,
         case 
             -- When there is pii
-            when wcw.pii > 0 then 8
+            when coalesce(wcw.pii, 0) + coalesce(screened.pii, 0) > 0 then 8
             -- When the survey was coded automatically
             when automated.automated = 1 and slr.total = 1 then 6
             -- When there is a majority, but only two people agreed so far
@@ -116,6 +125,8 @@ left join who_coded_what wcw
 on (slr.respondent_id=wcw.respondent_id)
 left join automated 
 on (slr.respondent_id=automated.respondent_id)
+left join screened
+on (slr.respondent_id=screened.respondent_id)
 order by month desc, priority
 )
 select * from final_priority);
@@ -0,0 +1,69 @@
+"""
+A local stand in for the survey provider's API (see app/surveysync.py), so
+that survey syncing can be tested and benchmarked offline.
+
+The server holds a list of responses, and serves them a page at a time from
+/responses, filtered by since and ordered by end_date then respondent_id.
+Pages listed in fail_pages are answered with a 503 the first time they are
+asked for, and pages listed in throttle_pages with a 429.
+"""
+
+import time
+from urllib.parse import urlparse, parse_qs
+from tests.stubserver import StubServer, StubSearchHandler
+
+
+class StubProviderHandler(StubSearchHandler):
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        if url.path != '/responses':
+            return self.send_json(404, {'error': 'not found'})
+        if stub.token and self.headers.get('Authorization') != \
+                'Bearer %s' % stub.token:
+            return self.send_json(401, {'error': 'unauthorized'})
+
+        query = parse_qs(url.query)
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['100'])[0])
+        since = query.get('since', [''])[0]
+        count = stub.count((since, page))
+
+        if stub.latency:
+            time.sleep(stub.latency)
+        if page in stub.fail_pages and count == 1:
+            return self.send_json(503, {'error': 'unavailable'})
+        if page in stub.throttle_pages and count == 1:
+            return self.send_json(
+                429, {'error': 'too many requests'}, {'Retry-After': '0'})
+
+        responses = [i for i in stub.responses if i['end_date'] >= since]
+        start = (page - 1) * per_page
+        self.send_json(200, {
+            'page': page, 'per_page': per_page, 'total': len(responses),
+            'data': responses[start:start + per_page]})
+
+
+class StubProviderServer(StubServer):
+    '''
+    The stub survey provider. responses are dicts with at least
+    respondent_id and end_date (an ISO format string).
+    '''
+
+    handler = StubProviderHandler
+
+    def __init__(self, responses=(), token=None, latency=0, fail_pages=(),
+                 throttle_pages=()):
+        super(StubProviderServer, self).__init__(latency)
+        self.responses = []
+        self.add(responses)
+        self.token = token
+        self.fail_pages = set(fail_pages)
+        self.throttle_pages = set(throttle_pages)
+
+    def add(self, responses):
+        '''Add responses, keeping them in the order the provider lists them'''
+        self.responses = sorted(
+            self.responses + list(responses),
+            key=lambda i: (i['end_date'], i['respondent_id']))
@@ -0,0 +1,134 @@
+"""
+A local stand in for the GOV.UK search API (/api/search.json), so that the
+lookup engine can be tested and benchmarked without going near GOV.UK.
+
+Pages are answered according to their first path segment:
+
+/flaky/...      503 on the first request for the page, then a result
+/throttled/...  429 with Retry-After: 0 on the first request, then a result
+/broken/...     always 500
+/slow/...       a result, after sleeping for slow seconds
+/missing/...    no results
+anything else   a result
+
+A result has the organisation 'Organisation for <page>' and the mainstream
+browse page 'browse<page>'.
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+
+    # Keep connections alive, as the GOV.UK API does
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except ConnectionError:
+
+            # The client gave up waiting, e.g. for a /slow/ page
+
+            pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        if url.path != '/api/search.json':
+            return self.send_json(404, {'error': 'not found'})
+
+        page = parse_qs(url.query).get('filter_link[]', [''])[0]
+        count = stub.count(page)
+        section = page.split('/')[1] if '/' in page else ''
+
+        if stub.latency:
+            time.sleep(stub.latency)
+        if section == 'flaky' and count == 1:
+            return self.send_json(503, {'error': 'unavailable'})
+        if section == 'throttled' and count == 1:
+            return self.send_json(
+                429, {'error': 'too many requests'}, {'Retry-After': '0'})
+        if section == 'broken':
+            return self.send_json(500, {'error': 'broken'})
+        if section == 'slow':
+            time.sleep(stub.slow)
+        if section == 'missing':
+            return self.send_json(200, {'results': []})
+
+        self.send_json(200, {'results': [{
+            'organisations': [{'title': 'Organisation for %s' % page}],
+            'mainstream_browse_pages': ['browse%s' % page]}]})
+
+
+class StubServer(object):
+    '''
+    Run a stub API (answered by handler) on a free local port in a
+    background thread. Handlers find the StubServer as self.server.stub.
+    '''
+
+    handler = StubSearchHandler
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), self.handler)
+        self.server.stub = self
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def count(self, request):
+        '''Record a request, returning how many there have been like it'''
+        with self._lock:
+            self.requests[request] += 1
+            return self.requests[request]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubSearchServer(StubServer):
+    '''
+    The stub search API.
+
+    with StubSearchServer() as stub:
+        LookupEngine(base_url=stub.url).lookup('/some/page')
+    '''
+
+    def __init__(self, latency=0, slow=2):
+        super(StubSearchServer, self).__init__(latency)
+        self.slow = slow
@@ -0,0 +1,105 @@
+import unittest
+import json
+from base64 import b64encode
+from datetime import datetime
+from flask import url_for
+from app import create_app, db
+from app.models import Role, User, Raw, Classified, Codes, ProjectCodes
+from app.priority import create_priority_triggers
+
+
+class APITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        user_role = Role.query.filter_by(name='User').first()
+        self.user = User(email='user@example.com', username='user',
+                         password='cat', role=user_role, confirmed=True)
+        self.code = Codes(code='ok', description='ok')
+        self.project_code = ProjectCodes(project_code='none')
+        db.session.add_all([self.user, self.code, self.project_code])
+        db.session.add_all([
+            Raw(respondent_id=i, start_date=datetime(2017, 5, 1),
+                comment_why_you_came='survey %d' % i)
+            for i in range(1, 6)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def test_no_auth(self):
+        response = self.client.get(url_for('api.get_codes'),
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_auth(self):
+        response = self.client.post(
+            url_for('api.get_token'),
+            headers=self.get_api_headers('user@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        token = json.loads(response.data.decode('utf-8'))['token']
+
+        response = self.client.get(
+            url_for('api.get_codes'),
+            headers=self.get_api_headers(token, ''))
+        self.assertEqual(response.status_code, 200)
+        codes = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(codes['codes'][0]['code'], 'ok')
+        self.assertEqual(codes['project_codes'][0]['project_code'], 'none')
+
+    def test_fetch_and_classify_surveys(self):
+        headers = self.get_api_headers('user@example.com', 'cat')
+        response = self.client.get(
+            url_for('api.next_surveys', count=3), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        surveys = json.loads(response.data.decode('utf-8'))['surveys']
+        self.assertEqual(len(surveys), 3)
+        self.assertTrue('comment_why_you_came' in surveys[0])
+        self.assertFalse('comment_further_comments' in surveys[0])
+
+        classifications = [{
+            'respondent_id': i['respondent_id'],
+            'code_id': self.code.code_id,
+            'project_code_id': self.project_code.project_code_id,
+            'pii': False} for i in surveys]
+
+        # A survey which was never leased to this coder is rejected
+
+        unleased = [i for i in range(1, 6)
+                    if i not in [j['respondent_id'] for j in surveys]][0]
+        classifications.append({
+            'respondent_id': unleased, 'code_id': self.code.code_id})
+
+        response = self.client.post(
+            url_for('api.new_classifications'), headers=headers,
+            data=json.dumps({'classifications': classifications}))
+        self.assertEqual(response.status_code, 201)
+        result = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(sorted(result['saved']),
+                         sorted(i['respondent_id'] for i in surveys))
+        self.assertEqual(result['rejected'], [unleased])
+        self.assertEqual(Classified.query.count(), 3)
+
+    def test_bad_classification(self):
+        response = self.client.post(
+            url_for('api.new_classifications'),
+            headers=self.get_api_headers('user@example.com', 'cat'),
+            data=json.dumps({'classifications': [{'respondent_id': 1}]}))
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,133 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.lookupengine import LookupEngine
+from app.models import Raw, Urls, Checkpoint
+from app.urllookup import api_lookup, lookup_full_urls, normalise_url
+from tests.stubserver import StubSearchServer
+
+PAGE = '/government/publications/a-page'
+
+
+class ApiLookupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        full_urls = [
+            PAGE, PAGE + '/', PAGE + '?query=1', PAGE + '#section', PAGE,
+            '/browse/benefits', '/broken/page']
+        db.session.add_all([
+            Raw(respondent_id=i, full_url=full_url)
+            for i, full_url in enumerate(full_urls)])
+        db.session.commit()
+
+        self.stub = StubSearchServer().start()
+
+    def tearDown(self):
+        self.stub.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def engine(self):
+        return LookupEngine(
+            base_url=self.stub.url, rate=0, retries=0, backoff=0)
+
+    def test_normalise_url(self):
+        self.assertEqual(normalise_url(PAGE + '/?a=1#b'), PAGE)
+        self.assertEqual(normalise_url('/'), '/')
+
+    def test_each_page_is_looked_up_once(self):
+        result = api_lookup(ttl=30, engine=self.engine())
+        self.assertEqual(dict(self.stub.requests), {PAGE: 1, '/broken': 1})
+        self.assertEqual(result['looked_up'], 2)
+        self.assertEqual(result['failed'], 1)
+
+        urls = Urls.query.filter_by(page=PAGE).all()
+        self.assertEqual(len(urls), 4)
+        for url in urls:
+            self.assertEqual(url.org0, 'Organisation for %s' % PAGE)
+            self.assertEqual(url.section0, 'browse%s' % PAGE)
+            self.assertIsNone(url.org1)
+
+        browse = Urls.query.filter_by(full_url='/browse/benefits').one()
+        self.assertEqual(browse.section0, 'benefits')
+
+        # Pages which could not be looked up are not saved
+
+        self.assertEqual(Urls.query.filter_by(page='/broken').count(), 0)
+
+    def test_fresh_pages_are_not_looked_up_again(self):
+        api_lookup(ttl=30, engine=self.engine())
+        db.session.add(Raw(respondent_id=100, full_url=PAGE + '?new=1'))
+        db.session.commit()
+
+        # Only the broken page, which failed last time, is looked up again
+
+        result = api_lookup(ttl=30, engine=self.engine())
+        self.assertEqual(self.stub.requests[PAGE], 1)
+        self.assertEqual(result['surveys'], 2)
+        self.assertEqual(result['looked_up'], 1)
+        self.assertEqual(self.stub.requests['/broken'], 2)
+        self.assertEqual(
+            Urls.query.filter_by(full_url=PAGE + '?new=1').one().org0,
+            'Organisation for %s' % PAGE)
+
+    def test_stale_pages_are_looked_up_again(self):
+        api_lookup(ttl=30, engine=self.engine())
+        api_lookup(ttl=0, engine=self.engine(), restart=True)
+        self.assertEqual(self.stub.requests[PAGE], 2)
+        self.assertEqual(Urls.query.filter_by(page=PAGE).count(), 4)
+
+    def test_lookup_resumes_from_checkpoint(self):
+
+        def fail_after_first_chunk(totals):
+            raise RuntimeError('stopped')
+
+        with self.assertRaises(RuntimeError):
+            api_lookup(ttl=30, engine=self.engine(), chunk_size=2,
+                       progress=fail_after_first_chunk)
+        self.assertEqual(Checkpoint.query.get('url_lookup').respondent_id, 1)
+
+        # The last survey's page is broken, so it is left for the next run
+
+        result = api_lookup(ttl=30, engine=self.engine(), chunk_size=2)
+        self.assertEqual(result['surveys'], 5)
+        self.assertEqual(Checkpoint.query.get('url_lookup').respondent_id, 5)
+        self.assertEqual(self.stub.requests[PAGE], 1)
+
+    def test_failed_pages_are_tried_again(self):
+        Raw.query.filter_by(respondent_id=6).delete()
+        db.session.add_all([
+            Raw(respondent_id=7, full_url='/flaky/page'),
+            Raw(respondent_id=8, full_url='/browse/benefits')])
+        db.session.commit()
+
+        result = api_lookup(ttl=30, engine=self.engine(), chunk_size=2)
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(Checkpoint.query.get('url_lookup').respondent_id, 5)
+
+        result = api_lookup(ttl=30, engine=self.engine(), chunk_size=2)
+        self.assertEqual(result['surveys'], 2)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(Checkpoint.query.get('url_lookup').respondent_id, 8)
+        self.assertEqual(
+            Urls.query.filter_by(full_url='/flaky/page').one().org0,
+            'Organisation for /flaky')
+
+    def test_failures_only_count_for_their_chunk(self):
+        engine = self.engine()
+        for i in range(2):
+            result = lookup_full_urls(['/broken/page'], datetime.now(), engine)
+            self.assertEqual(result['failed'], 1)
+
+        # A page which failed in an earlier chunk is saved once it succeeds
+
+        engine.failed_pages.add(PAGE)
+        result = lookup_full_urls([PAGE], datetime.now(), engine)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(Urls.query.filter_by(full_url=PAGE).count(), 1)
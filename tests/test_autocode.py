@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.autocode import code_nones
+from app.models import (
+    Role, User, Raw, Classified, Codes, ProjectCodes, SurveyPriority)
+from app.priority import create_priority_triggers
+from app.surveyqueue import new_survey
+
+
+class TestCodeNones(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        self.automated = User(email='automated@example.com',
+                              username='automated', password='cat')
+        self.coder = User(email='coder@example.com', password='cat')
+        db.session.add_all([
+            self.automated, self.coder,
+            Codes(code='none', description='none'),
+            ProjectCodes(project_code='none', description='none'),
+            Raw(respondent_id=1, start_date=datetime(2017, 5, 2)),
+            Raw(respondent_id=2, start_date=datetime(2017, 5, 1),
+                comment_why_you_came='to renew my passport')])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_empty_surveys_are_coded_once(self):
+        self.assertEqual(code_nones(), 1)
+        db.session.commit()
+        self.assertEqual(code_nones(), 0)
+        db.session.commit()
+
+        classified = Classified.query.one()
+        self.assertEqual(
+            (classified.respondent_id, classified.coder_id),
+            (1, self.automated.id))
+
+    def test_empty_surveys_leave_the_queue(self):
+        code_nones()
+        db.session.commit()
+        self.assertEqual(SurveyPriority.query.get(1).priority, 6)
+        self.assertEqual(new_survey(self.coder.id), 2)
+
+    def test_only_given_surveys_are_coded(self):
+        db.session.add(Raw(respondent_id=3, start_date=datetime(2017, 5, 3)))
+        db.session.commit()
+        self.assertEqual(code_nones([3]), 1)
+        db.session.commit()
+        self.assertEqual(
+            [i.respondent_id for i in Classified.query.all()], [3])
+
+    def test_nothing_is_coded_without_automated_user(self):
+        db.session.delete(self.automated)
+        db.session.commit()
+        self.assertEqual(code_nones(), 0)
@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime
+from flask import url_for
+from app import create_app, db
+from app.models import (
+    Role, User, Raw, Classified, Codes, ProjectCodes, SurveyLease)
+from app.priority import create_priority_triggers
+
+
+class BatchClassifyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_BATCH_SIZE'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        user_role = Role.query.filter_by(name='User').first()
+        self.user = User(email='user@example.com', username='user',
+                         password='cat', role=user_role, confirmed=True)
+        self.code = Codes(code='ok', description='ok')
+        self.project_code = ProjectCodes(project_code='none')
+        db.session.add_all([self.user, self.code, self.project_code])
+        db.session.add_all([
+            Raw(respondent_id=i, start_date=datetime(2017, 5, 1),
+                comment_why_you_came='survey %d' % i)
+            for i in range(1, 6)])
+        db.session.commit()
+
+        self.client = self.app.test_client(use_cookies=True)
+        self.client.post(url_for('auth.login'), data={
+            'email': 'user@example.com', 'password': 'cat'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_batch_page_shows_a_page_of_surveys(self):
+        response = self.client.get(url_for('main.batch'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.count(b'name="surveys-'), 3 * 4)
+        self.assertEqual(SurveyLease.query.count(), 3)
+
+    def test_batch_submit_saves_all_surveys(self):
+        self.client.get(url_for('main.batch'))
+        respondent_ids = [lease.respondent_id for lease in
+                          SurveyLease.query.all()]
+        data = {}
+        for i, respondent_id in enumerate(respondent_ids):
+            data['surveys-%d-respondent_id' % i] = respondent_id
+            data['surveys-%d-code' % i] = self.code.code_id
+            data['surveys-%d-project_code' % i] = \
+                self.project_code.project_code_id
+        response = self.client.post(url_for('main.batch'), data=data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(i.respondent_id for i in Classified.query.all()),
+            sorted(respondent_ids))
+        self.assertEqual(SurveyLease.query.count(), 0)
+
+    def test_batch_submit_ignores_surveys_not_leased(self):
+        data = {
+            'surveys-0-respondent_id': 1,
+            'surveys-0-code': self.code.code_id,
+            'surveys-0-project_code': self.project_code.project_code_id}
+        self.client.post(url_for('main.batch'), data=data)
+        self.assertEqual(Classified.query.count(), 0)
+
+    def test_batch_submit_with_bad_respondent_id_shows_the_form(self):
+        data = {
+            'surveys-0-respondent_id': 'not a number',
+            'surveys-0-code': self.code.code_id,
+            'surveys-0-project_code': self.project_code.project_code_id}
+        response = self.client.post(url_for('main.batch'), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'not a number', response.data)
+        self.assertEqual(Classified.query.count(), 0)
@@ -0,0 +1,81 @@
+import re
+import unittest
+from datetime import datetime
+from flask import url_for
+from app import create_app, db
+from app.models import (
+    Role, User, Raw, Classified, Codes, ProjectCodes, SurveyLease)
+from app.priority import create_priority_triggers
+
+
+class ClassifyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        user_role = Role.query.filter_by(name='User').first()
+        self.user = User(email='user@example.com', username='user',
+                         password='cat', role=user_role, confirmed=True)
+        self.code = Codes(code='ok', description='ok')
+        self.project_code = ProjectCodes(project_code='none')
+        db.session.add_all([self.user, self.code, self.project_code])
+        db.session.add_all([
+            Raw(respondent_id=i, start_date=datetime(2017, 5, i),
+                comment_why_you_came='survey %d' % i)
+            for i in range(1, 3)])
+        db.session.commit()
+
+        self.client = self.app.test_client(use_cookies=True)
+        self.client.post(url_for('auth.login'), data={
+            'email': 'user@example.com', 'password': 'cat'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def signed_survey(self):
+        response = self.client.get(url_for('main.index'))
+        return re.search(
+            b'name="survey" type="hidden" value="([^"]+)"',
+            response.data).group(1).decode('ascii')
+
+    def submit(self, survey):
+        return self.client.post(url_for('main.index'), data={
+            'survey': survey,
+            'code': self.code.code_id,
+            'project_code': self.project_code.project_code_id})
+
+    def test_classification_is_saved_against_the_survey_shown(self):
+        survey = self.signed_survey()
+
+        # A newer survey arriving before the submit must not take the code
+
+        db.session.add(Raw(respondent_id=3, start_date=datetime(2017, 6, 1)))
+        db.session.commit()
+
+        response = self.submit(survey)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [i.respondent_id for i in Classified.query.all()], [2])
+
+        # No survey is selected, or leased, when the form is submitted
+
+        self.assertEqual(SurveyLease.query.count(), 0)
+
+    def test_tampered_survey_is_not_saved(self):
+        survey = self.signed_survey()
+        response = self.submit(survey[:-2] + 'xx')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Classified.query.count(), 0)
+
+    def test_survey_is_not_saved_twice(self):
+        survey = self.signed_survey()
+        self.submit(survey)
+        self.submit(survey)
+        self.assertEqual(Classified.query.count(), 1)
@@ -1,6 +1,6 @@
 import unittest
 from app import db, create_app
-from app.urllookup import clean_url
+from app.urllookup import clean_url, clean_page, clean_pages
 from app.models import Raw, Urls
 
 
@@ -101,3 +101,40 @@ class TestCleanUrls(unittest.TestCase):
         self.assertTrue(cleaned_url.section0 == 'contact')
         self.assertTrue(cleaned_url.section1 == 'contact')
         self.assertTrue(cleaned_url.org0 is None)
+
+
+class TestCleanPage(unittest.TestCase):
+
+    def test_clean_page_rules(self):
+        self.assertEqual(
+            clean_page('/government/world/turkey'),
+            ('/government/world', 'Foreign & Commonwealth Office', None, None))
+        self.assertEqual(
+            clean_page('/guidance/a-guide'),
+            ('/guidance/a-guide', None, None, None))
+        self.assertEqual(
+            clean_page('/browse/benefits/universal-credit'),
+            ('/browse/benefits', None, 'benefits', None))
+        self.assertEqual(clean_page('/'), ('/', None, 'site-nav', 'site-nav'))
+        self.assertEqual(
+            clean_page('/help/cookies'),
+            ('/help/cookies', None, 'site-nav', 'site-nav'))
+        self.assertEqual(
+            clean_page('/contact/hmrc'),
+            ('/contact/hmrc', None, 'contact', 'contact'))
+        self.assertEqual(
+            clean_page('/vehicle-tax/rates'), ('/vehicle-tax', None, None, None))
+
+    def test_earlier_rules_win(self):
+        self.assertEqual(
+            clean_page('/browse/government/world'),
+            ('/government/world', 'Foreign & Commonwealth Office', None, None))
+        self.assertEqual(
+            clean_page('/search/government'),
+            ('/search/government', None, None, None))
+
+    def test_clean_pages_keeps_order(self):
+        urls = ['/', '/contact/x', '/'] * 3
+        self.assertEqual(
+            [page for page, org0, section0, section1 in clean_pages(urls)],
+            urls)
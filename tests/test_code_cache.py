@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.codecache import code_cache
+from app.models import Codes, ProjectCodes
+
+
+class TestCodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Codes(code='ok', description='ok'),
+            Codes(code='old', description='old', end_date=datetime(2017, 1, 1)),
+            ProjectCodes(project_code='none', description='none')])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_only_active_codes_are_cached(self):
+        active = code_cache.get()
+        self.assertEqual([i['code'] for i in active.codes], ['ok'])
+        self.assertEqual(
+            [name for id, name in active.project_code_choices], ['none'])
+
+    def test_repeat_lookups_are_hits(self):
+        code_cache.get()
+        hits, misses = code_cache.hits, code_cache.misses
+        code_cache.get()
+        code_cache.get()
+        self.assertEqual(code_cache.hits, hits + 2)
+        self.assertEqual(code_cache.misses, misses)
+
+    def test_changing_a_code_invalidates_the_cache(self):
+        code_cache.get()
+        code = Codes.query.filter_by(code='ok').first()
+        code.end_date = datetime(2017, 6, 1)
+        db.session.add(Codes(code='new', description='new'))
+        db.session.commit()
+        self.assertEqual([i['code'] for i in code_cache.get().codes], ['new'])
+
+    def test_cache_expires(self):
+        code_cache.get()
+        self.app.config['FLASKY_CODE_CACHE_TTL'] = 0
+        misses = code_cache.misses
+        code_cache.get()
+        self.assertEqual(code_cache.misses, misses + 1)
@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, date, timedelta
+from app import create_app, db
+from app.models import (
+    Role, User, Raw, Classified, Codes, CoderDailyCounts, DailyLeaders)
+from app.codercounts import (
+    create_coder_count_triggers, rebuild_coder_counts, coded_on)
+from app.queryloader import query_loader
+
+
+class TestCoderDailyCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_coder_count_triggers()
+
+        # Replace the leaders tables created by db.create_all() with the views
+
+        db.session.execute(
+            'drop table leaders, weekly_leaders, daily_leaders;')
+        db.session.execute(query_loader('sql/views/leaders.sql'))
+
+        self.coder = User(email='coder@example.com', username='coder',
+                          password='cat',
+                          role=Role.query.filter_by(name='User-Gamify').first())
+        self.code = Codes(code='ok', description='ok')
+        db.session.add_all([self.coder, self.code] + [
+            Raw(respondent_id=i, start_date=datetime(2017, 5, 1))
+            for i in range(1, 13)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.execute(
+            'drop view leaders, weekly_leaders, daily_leaders;')
+        db.session.commit()
+        db.drop_all()
+        self.app_context.pop()
+
+    def classify(self, respondent_ids, date_coded):
+        db.session.add_all([
+            Classified(respondent_id=i, coder_id=self.coder.id,
+                       code_id=self.code.code_id, pii=False,
+                       date_coded=date_coded)
+            for i in respondent_ids])
+        db.session.commit()
+
+    def test_trigger_counts_each_day(self):
+        self.classify(range(1, 11), datetime.now())
+        self.classify([11, 12], datetime.now() - timedelta(days=1))
+        self.assertEqual(coded_on(self.coder.id), 10)
+        self.assertEqual(
+            coded_on(self.coder.id, date.today() - timedelta(days=1)), 2)
+
+    def test_deleting_a_classification_is_counted(self):
+        self.classify([1, 2], datetime.now())
+        Classified.query.filter_by(respondent_id=1).delete()
+        db.session.commit()
+        self.assertEqual(coded_on(self.coder.id), 1)
+
+    def test_rebuild_matches_trigger(self):
+        self.classify(range(1, 6), datetime.now())
+        self.classify(range(6, 9), datetime.now() - timedelta(days=3))
+        counts = sorted(
+            (i.day, i.n) for i in CoderDailyCounts.query.all())
+        self.assertEqual(rebuild_coder_counts(), 2)
+        self.assertEqual(sorted(
+            (i.day, i.n) for i in CoderDailyCounts.query.all()), counts)
+
+    def test_daily_leaders_read_counts(self):
+        self.classify(range(1, 4), datetime.now())
+        leaders = DailyLeaders.query.all()
+        self.assertEqual([(i.username, i.n) for i in leaders], [('coder', 3)])
@@ -0,0 +1,113 @@
+import unittest
+from app import create_app, db
+from app.codercounts import create_coder_count_triggers
+from app.fakedata import fake_votes
+from app.models import (
+    Role, User, Raw, Classified, Codes, ProjectCodes, SurveyPriority,
+    CoderDailyCounts)
+from app.priority import create_priority_triggers
+
+
+class TestFakeData(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+        create_coder_count_triggers()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_surveys_do_not_collide(self):
+        db.session.add(Raw(respondent_id=20000000))
+        db.session.commit()
+        self.assertEqual(Raw.generate_fake(500, seed=1), 500)
+        self.assertEqual(Raw.generate_fake(500, seed=1), 500)
+        self.assertEqual(Raw.query.count(), 1001)
+        self.assertEqual(
+            db.session.query(db.func.min(Raw.respondent_id)).scalar(),
+            20000000)
+
+    def test_seed_repeats_data(self):
+        Raw.generate_fake(50, seed=2)
+        first = [i.comment_why_you_came for i in
+                 Raw.query.order_by(Raw.respondent_id)]
+        db.session.execute('truncate raw cascade')
+        db.session.commit()
+        Raw.generate_fake(50, seed=2)
+        second = [i.comment_why_you_came for i in
+                  Raw.query.order_by(Raw.respondent_id)]
+        self.assertEqual(first, second)
+
+    def test_users_share_a_password(self):
+        self.assertEqual(User.generate_fake(5), 5)
+        self.assertEqual(User.generate_fake(5), 5)
+        users = User.query.all()
+        self.assertEqual(len(users), 10)
+        self.assertEqual(len(set(i.password_hash for i in users)), 1)
+        self.assertTrue(users[0].verify_password('password'))
+
+    def test_users_do_not_collide(self):
+        # The next user would be coder2, after the highest id
+
+        db.session.add(User(email='someone@example.com', username='coder2',
+                            password='cat'))
+        db.session.commit()
+        self.assertEqual(User.generate_fake(3), 3)
+        self.assertEqual(User.query.filter_by(username='coder2').count(), 1)
+        self.assertEqual(User.query.count(), 4)
+
+    def test_codes_have_one_none(self):
+        Codes.generate_fake(5)
+        Codes.generate_fake(5)
+        ProjectCodes.generate_fake(3)
+        self.assertEqual(Codes.query.filter_by(code='none').count(), 1)
+        self.assertEqual(Codes.query.count(), 11)
+        self.assertEqual(ProjectCodes.query.count(), 4)
+
+    def test_derived_tables_are_rebuilt(self):
+        Codes.generate_fake(5, seed=3)
+        ProjectCodes.generate_fake(seed=3)
+        User.generate_fake(5, seed=3)
+        Raw.generate_fake(200, seed=3)
+        self.assertEqual(SurveyPriority.query.count(), 200)
+
+        added = Classified.generate_fake(300, 5, seed=3)
+        self.assertEqual(Classified.query.count(), added)
+        self.assertEqual(
+            db.session.query(db.func.sum(SurveyPriority.total)).filter(
+                SurveyPriority.coders.isnot(None)).scalar(),
+            added)
+        self.assertEqual(
+            db.session.query(db.func.sum(CoderDailyCounts.n)).scalar(),
+            added)
+
+        # No coder codes a survey twice
+
+        self.assertEqual(db.session.execute(
+            'select count(distinct (respondent_id, coder_id)) '
+            'from classified').scalar(), added)
+
+    def test_votes_follow_distribution(self):
+        Codes.generate_fake(5, seed=4)
+        ProjectCodes.generate_fake(seed=4)
+        User.generate_fake(5, seed=4)
+        Raw.generate_fake(1000, seed=4)
+        added = fake_votes(votes=[0, 0.5, 0.5], seed=4)
+        self.assertEqual(Classified.query.count(), added)
+        self.assertGreater(added, 1000)
+        self.assertLess(added, 2000)
+
+        # Every survey has one or two votes, from different coders
+
+        counts = [row.n for row in db.session.execute(
+            'select count(distinct coder_id) as n from classified '
+            'group by respondent_id')]
+        self.assertEqual(len(counts), 1000)
+        self.assertEqual(set(counts), {1, 2})
@@ -0,0 +1,95 @@
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.ingest import ingest, map_columns
+from app.models import Raw
+
+HEADER = [
+    'RespondentID', 'CollectorID', 'StartDate', 'EndDate', 'Full URL',
+    'Describe why you came to GOV.UK today. Please do not include personal '
+    'or financial information, eg your National Insurance number.',
+    'Overall, how did you feel about your visit to GOV.UK today?',
+    'Something we do not load']
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def export(self, rows, name='export.csv', compress=False):
+        path = os.path.join(self.dir, name)
+        f = gzip.open(path, 'wt', newline='') if compress else \
+            open(path, 'w', newline='')
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+        return path
+
+    def row(self, respondent_id, why='why', satisfaction='Satisfied'):
+        return [respondent_id, 'c1', '2017-05-01 10:00:00',
+                '01/05/2017 10:05:00', '/vehicle-tax', why, satisfaction, 'x']
+
+    def test_map_columns(self):
+        self.assertEqual(
+            [column for index, column in map_columns(HEADER)],
+            ['respondent_id', 'collector_id', 'start_date', 'end_date',
+             'full_url', 'comment_why_you_came', 'cat_satisfaction'])
+        with self.assertRaises(ValueError):
+            map_columns(['CollectorID'])
+
+    def test_ingest_inserts_surveys(self):
+        totals = ingest(self.export([self.row(1), self.row(2)]))
+        self.assertEqual(totals['inserted'], 2)
+        survey = Raw.query.get(1)
+        self.assertEqual(survey.comment_why_you_came, 'why')
+        self.assertEqual(survey.end_date, datetime(2017, 5, 1, 10, 5))
+
+    def test_ingest_gzip_in_batches(self):
+        path = self.export([self.row(i) for i in range(1, 8)],
+                           'export.csv.gz', compress=True)
+        totals = ingest(path, batch_size=3)
+        self.assertEqual(totals['inserted'], 7)
+        self.assertEqual(Raw.query.count(), 7)
+
+    def test_ingest_merges_on_respondent_id(self):
+        ingest(self.export([self.row(1), self.row(2)]))
+        totals = ingest(self.export([
+            self.row(1), self.row(2, why='changed'), self.row(3)]))
+        self.assertEqual(
+            (totals['inserted'], totals['updated'], totals['unchanged']),
+            (1, 1, 1))
+        self.assertEqual(Raw.query.get(2).comment_why_you_came, 'changed')
+
+    def test_last_row_for_a_survey_wins(self):
+        ingest(self.export([self.row(1, why='first'),
+                            self.row(1, why='second')]))
+        self.assertEqual(Raw.query.get(1).comment_why_you_came, 'second')
+
+    def test_bad_rows_are_rejected(self):
+        bad_date = self.row(3)
+        bad_date[2] = 'yesterday'
+        totals = ingest(self.export([
+            self.row(1), self.row('abc'), bad_date,
+            self.row(4, satisfaction='x' * 51), self.row(5, why='')]))
+        self.assertEqual(totals['rejected'], 3)
+        self.assertEqual(len(totals['errors']), 3)
+        self.assertEqual(
+            sorted(i.respondent_id for i in Raw.query.all()), [1, 5])
+        self.assertIsNone(Raw.query.get(5).comment_why_you_came)
@@ -0,0 +1,55 @@
+import time
+import unittest
+from app.apiclient import RateLimiter
+from app.lookupengine import LookupEngine
+from tests.stubserver import StubSearchServer
+
+
+class LookupEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubSearchServer(slow=1).start()
+        self.engine = LookupEngine(
+            base_url=self.stub.url, workers=4, rate=0, timeout=0.5,
+            retries=2, backoff=0.01)
+
+    def tearDown(self):
+        self.engine.close()
+        self.stub.stop()
+
+    def test_lookup_returns_nine_fields(self):
+        record = self.engine.lookup('/government/publications/a-page')
+        self.assertEqual(len(record), 9)
+        self.assertEqual(
+            record[0], 'Organisation for /government/publications/a-page')
+        self.assertEqual(record[1], 'null')
+        self.assertEqual(record[5], 'browse/government/publications/a-page')
+
+    def test_lookup_retries_errors_and_throttling(self):
+        self.assertNotEqual(self.engine.lookup('/flaky/page')[0], 'null')
+        self.assertNotEqual(self.engine.lookup('/throttled/page')[0], 'null')
+        self.assertEqual(self.engine.retried, 2)
+
+    def test_lookup_gives_up(self):
+        self.assertEqual(self.engine.lookup('/broken/page'), ['null'] * 9)
+        self.assertEqual(self.stub.requests['/broken/page'], 3)
+        self.assertEqual(self.engine.lookup('/missing/page'), ['null'] * 9)
+        self.assertEqual(self.engine.failed, 1)
+
+    def test_lookup_times_out(self):
+        self.engine.retries = 0
+        self.assertEqual(self.engine.lookup('/slow/page'), ['null'] * 9)
+
+    def test_lookup_many_looks_up_each_page_once(self):
+        pages = ['/page/%d' % (i % 10) for i in range(50)]
+        records = self.engine.lookup_many(pages)
+        self.assertEqual(len(records), 10)
+        self.assertEqual(sum(self.stub.requests.values()), 10)
+        self.assertEqual(records['/page/3'][0], 'Organisation for /page/3')
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for i in range(11):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
@@ -0,0 +1,77 @@
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.metrics import Counter, Histogram, Metrics
+from app.models import Role
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Metrics()
+        histogram = registry.add(Histogram(
+            'example_seconds', 'Example', ['endpoint'], (0.1, 1)))
+        histogram.observe(0.05, endpoint='a')
+        histogram.observe(0.1, endpoint='a')
+        histogram.observe(5, endpoint='a')
+        text = registry.render()
+        self.assertIn('example_seconds_bucket{endpoint="a",le="0.1"} 2',
+                      text)
+        self.assertIn('example_seconds_bucket{endpoint="a",le="1"} 2', text)
+        self.assertIn('example_seconds_bucket{endpoint="a",le="+Inf"} 3',
+                      text)
+        self.assertIn('example_seconds_count{endpoint="a"} 3', text)
+
+    def test_workers_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        try:
+            registry = Metrics()
+            registry.directory = directory
+            counter = registry.add(Counter('example_total', 'Example'))
+            counter.inc(2)
+            registry.flush(force=True)
+
+            # Another worker, which has written its values too
+
+            with open('%s/1.json' % directory, 'w') as f:
+                f.write('{"example_total": [[[], 3]]}')
+            self.assertIn('example_total 5', registry.render())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_requests_are_counted(self):
+        self.app.config['FLASKY_QUERY_COUNT_HEADER'] = True
+        response = self.client.get('/auth/login', base_url='https://localhost')
+        self.assertTrue(response.headers['X-Query-Count'].isdigit())
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'http_request_duration_seconds_count{endpoint="auth.login",'
+            b'method="GET",status="200"}', response.data)
+
+    def test_metrics_need_token(self):
+        self.app.config['FLASKY_METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_need_token_when_debugging(self):
+        self.app.config['TESTING'] = False
+        self.app.debug = True
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
@@ -0,0 +1,96 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import Raw, ScreenedSurvey, SurveyPriority
+from app.piiscreen import PiiScreen
+from app.priority import create_priority_triggers, rebuild_priority
+
+EMAIL = 'Please email me at someone@example.com'
+NINO = 'My national insurance number is AB121314C, thanks'
+
+# As in the app, leave out the slow and noisy detectors
+
+SKIP = ('name', 'url')
+
+
+class TestScreen(unittest.TestCase):
+
+    def test_screen_finds_pii(self):
+        with PiiScreen(workers=0, skip_detectors=SKIP) as screen:
+            results = screen.screen([EMAIL, 'no pii here', None, ''])
+        self.assertEqual(results[0], (
+            'Please email me at {{EMAIL}}', ('email',)))
+        self.assertEqual(results[1], ('no pii here', ()))
+        self.assertEqual(results[2], (None, ()))
+        self.assertEqual(results[3], ('', ()))
+
+    def test_results_are_memoised(self):
+        with PiiScreen(workers=0, cache_size=2,
+                       skip_detectors=SKIP) as screen:
+            screen.screen([EMAIL, EMAIL, NINO])
+            screen.screen([EMAIL, 'no'])
+            self.assertEqual((screen.hits, screen.misses), (1, 3))
+            self.assertEqual(screen.stats()['cached'], 2)
+
+    def test_pool_matches_in_process(self):
+        texts = [EMAIL, NINO, 'nothing'] * 10
+        with PiiScreen(workers=0, skip_detectors=SKIP) as screen:
+            expected = screen.screen(texts)
+        with PiiScreen(workers=2, min_pool_size=1,
+                       skip_detectors=SKIP) as screen:
+            self.assertEqual(screen.screen(texts), expected)
+
+
+class TestScreenOnDB(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        create_priority_triggers()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def load(self, rows):
+        columns = ['respondent_id', 'start_date', 'comment_why_you_came',
+                   'comment_further_comments']
+        rows = [(i, datetime(2017, 5, 1), why, further, line)
+                for line, (i, why, further) in enumerate(rows)]
+        db.session.bulk_insert_mappings(
+            Raw, [dict(zip(columns, row)) for row in rows])
+        with PiiScreen(workers=0, skip_detectors=SKIP) as screen:
+            found = screen.save(columns, rows)
+        db.session.commit()
+        return found
+
+    def test_pii_goes_to_priority_8(self):
+        found = self.load([(1, 'why', NINO), (2, 'why', 'nothing')])
+        self.assertEqual(found, 1)
+
+        screened = ScreenedSurvey.query.get(1)
+        self.assertTrue(screened.pii)
+        self.assertEqual(screened.pii_types, ['nino'])
+        self.assertIn('{{NINO}}', screened.comment_further_comments)
+        self.assertFalse(ScreenedSurvey.query.get(2).pii)
+
+        self.assertEqual(SurveyPriority.query.get(1).priority, 8)
+        self.assertEqual(SurveyPriority.query.get(2).priority, 2)
+
+    def test_rebuild_keeps_screened_pii(self):
+        self.load([(1, 'why', NINO)])
+
+        # Screening the same survey again must not count its pii twice
+
+        with PiiScreen(workers=0, skip_detectors=SKIP) as screen:
+            screen.save(['respondent_id', 'comment_further_comments'],
+                        [(1, NINO, 0)])
+        db.session.commit()
+        self.assertEqual(SurveyPriority.query.get(1).pii, 1)
+
+        rebuild_priority()
+        survey = SurveyPriority.query.get(1)
+        self.assertEqual((survey.pii, survey.priority), (1, 8))
@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import (
+    Role, User, Raw, Classified, Codes, ProjectCodes, SurveyPriority)
+from app.priority import (
+    create_priority_triggers, rebuild_priority, check_priority)
+from app.queryloader import query_loader
+
+
+class TestSurveyPriority(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+        # Replace the priority table created by db.create_all() with the view
+
+        db.session.execute('drop table priority;')
+        db.session.execute(query_loader('sql/views/priority.sql'))
+        create_priority_triggers()
+
+        self.coders = [
+            User(email='coder%d@example.com' % i, password='cat')
+            for i in range(5)]
+        self.automated = User(email='automated@example.com',
+                              username='automated', password='cat')
+        self.codes = [
+            Codes(code='code%d' % i, description='code') for i in range(3)]
+        db.session.add_all(self.coders + self.codes + [
+            self.automated, ProjectCodes(project_code='none')])
+        db.session.add_all([
+            Raw(respondent_id=i, start_date=datetime(2017, 5, i))
+            for i in range(1, 9)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.execute('drop view priority;')
+        db.session.commit()
+        db.drop_all()
+        self.app_context.pop()
+
+    def code(self, respondent_id, votes, coder=None, pii=False):
+        '''Classify a survey once for each code index in votes'''
+        for i, code in enumerate(votes):
+            db.session.add(Classified(
+                respondent_id=respondent_id,
+                coder_id=(coder or self.coders[i]).id,
+                code_id=self.codes[code].code_id,
+                pii=pii,
+                date_coded=datetime.now()))
+        db.session.commit()
+
+    def add_votes(self):
+        self.code(2, [0])
+        self.code(3, [0, 0])
+        self.code(4, [0, 1])
+        self.code(5, [0, 0, 1])
+        self.code(6, [0, 1, 2, 0, 1])
+        self.code(7, [0], pii=True)
+        self.code(8, [0], coder=self.automated)
+
+    def priorities(self):
+        return dict(db.session.query(
+            SurveyPriority.respondent_id, SurveyPriority.priority).all())
+
+    def test_triggers_set_priority(self):
+        self.add_votes()
+        self.assertEqual(self.priorities(), {
+            1: 2, 2: 1, 3: 3, 4: 1, 5: 3, 6: 7, 7: 8, 8: 6})
+
+    def test_triggers_match_view(self):
+        self.add_votes()
+        self.assertEqual(check_priority(), [])
+
+    def test_rebuild_matches_view(self):
+        self.add_votes()
+        db.session.execute('truncate survey_codes, survey_priority')
+        db.session.commit()
+        self.assertEqual(rebuild_priority(), 8)
+        self.assertEqual(check_priority(), [])
+
+    def test_coders_are_recorded(self):
+        self.code(3, [0, 0])
+        survey = SurveyPriority.query.get(3)
+        self.assertEqual(
+            survey.coders, sorted([self.coders[0].id, self.coders[1].id]))
+        self.assertEqual(survey.vote, None)
+        self.assertEqual(survey.total, 2)
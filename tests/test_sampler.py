@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import Role
+from app.sampler import Sampler, collapse
+
+
+class TestSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.sampler = Sampler()
+        self.sampler.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.sampler.directory)
+
+    def test_stack_is_collapsed_outermost_first(self):
+        stack = collapse(sys._getframe()).split(';')
+        self.assertTrue(stack[-1].startswith(
+            'test_stack_is_collapsed_outermost_first (tests/test_sampler.py'))
+
+    def test_requests_are_chosen_by_endpoint(self):
+        with self.app.test_request_context('/auth/login'):
+            self.app.preprocess_request()
+            self.assertFalse(self.sampler.wanted())
+            self.sampler.save_settings(enabled=True, endpoint='main.index')
+            self.assertFalse(self.sampler.wanted())
+            self.sampler.save_settings(endpoint='auth.login')
+            self.assertTrue(self.sampler.wanted())
+            self.sampler.save_settings(percent=0)
+            self.assertFalse(self.sampler.wanted())
+
+    def test_quick_saves_reach_other_workers(self):
+        other = Sampler()
+        other.directory = self.sampler.directory
+        self.sampler.save_settings(enabled=True, endpoint='main.index')
+        other.load_settings()
+        self.sampler.save_settings(endpoint='auth.login')
+        other.settings_checked = 0
+        self.assertEqual(other.load_settings()['endpoint'], 'auth.login')
+
+    def test_workers_are_merged(self):
+        for pid, count in ((1, 2), (2, 3)):
+            path = os.path.join(self.sampler.directory,
+                                'main.index.%d.collapsed' % pid)
+            with open(path, 'w') as f:
+                f.write('a;b %d\na;c 1\n' % count)
+        self.assertEqual(self.sampler.profiles(), [('main.index', 7)])
+        self.assertEqual(self.sampler.collapsed('main.index'),
+                         'a;b 5\na;c 2\n')
+        self.sampler.clear()
+        self.assertEqual(self.sampler.profiles(), [])
@@ -0,0 +1,85 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import Role, SlowQuery, SlowQueryPlan
+from app.slowqueries import SlowQueryStore, fingerprint, normalise, \
+    read_only
+
+
+class TestSlowQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.store = SlowQueryStore()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_literals_are_normalised(self):
+        self.assertEqual(
+            normalise("select *  from raw\nwhere respondent_id in (1, 2, 3) "
+                      "and full_url = '/it''s' -- comment"),
+            'select * from raw where respondent_id in (...) '
+            'and full_url = ?')
+        self.assertEqual(
+            fingerprint('select * from raw where respondent_id = 1'),
+            fingerprint('SELECT * FROM raw WHERE respondent_id = %(id)s'))
+        self.assertNotEqual(
+            fingerprint('select * from raw'),
+            fingerprint('select * from classified'))
+
+    def test_first_runs_are_explained(self):
+        self.app.config['FLASKY_SLOW_QUERY_PLANS'] = 2
+        statement = 'select * from raw where respondent_id > %(id)s'
+        for i in range(3):
+            key = self.store.save(statement, {'id': i}, 0.5 + i, 'main.index')
+
+        query = SlowQuery.query.get(key)
+        self.assertEqual(query.count, 3)
+        self.assertEqual(query.max_seconds, 2.5)
+        self.assertEqual(query.durations, [0.5, 1.5, 2.5])
+
+        plans = SlowQueryPlan.query.filter_by(fingerprint=key).all()
+        self.assertEqual(len(plans), 2)
+        self.assertIn('Plan', json.loads(plans[0].plan)[0])
+        self.assertIsNotNone(plans[0].execution_ms)
+
+    def test_unsampled_runs_are_counted_but_not_explained(self):
+        statement = 'select * from raw where respondent_id > %(id)s'
+        for i in range(3):
+            key = self.store.save(statement, {'id': i}, 1, sampled=False)
+        self.assertEqual(SlowQuery.query.get(key).count, 3)
+        self.assertEqual(SlowQueryPlan.query.count(), 0)
+
+    def test_writes_are_planned_without_running(self):
+        before = db.session.execute("select nextval('roles_id_seq')").scalar()
+        self.store.save(
+            "insert into roles (name) values ('Explained')", {}, 1)
+        after = db.session.execute("select nextval('roles_id_seq')").scalar()
+        self.assertEqual(after, before + 1)
+        self.assertIsNone(Role.query.filter_by(name='Explained').first())
+
+        plan = SlowQueryPlan.query.one()
+        self.assertIsNone(plan.execution_ms)
+        self.assertNotIn('Actual Rows', json.loads(plan.plan)[0]['Plan'])
+
+    def test_only_plain_selects_are_analysed(self):
+        self.assertTrue(read_only('select * from raw where code_id = 1'))
+        self.assertFalse(read_only('select * from raw for update skip locked'))
+        self.assertFalse(read_only(
+            'with claimed as (insert into survey_leases select 1) '
+            'select * from claimed'))
+        self.assertFalse(read_only('update raw set pii = false'))
+
+    def test_durations_are_capped(self):
+        self.app.config['FLASKY_SLOW_QUERY_KEEP'] = 3
+        for i in range(5):
+            key = self.store.save('set search_path = public', {}, i)
+        self.assertEqual(SlowQuery.query.get(key).durations, [2, 3, 4])
+        self.assertEqual(SlowQueryPlan.query.count(), 0)
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.codercounts import create_coder_count_triggers
+from app.models import Role, User, Raw, Classified, SurveyPriority
+from app.priority import create_priority_triggers
+from app.snapshot import load_snapshot, save_snapshot, snapshot_path
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.snapshots = tempfile.mkdtemp()
+        self.app.config['FLASKY_SNAPSHOT_DIR'] = self.snapshots
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+        create_coder_count_triggers()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.snapshots)
+
+    def test_load_restores_saved_data(self):
+        manifest = save_snapshot(300, 1)
+        self.assertTrue(os.path.isdir(snapshot_path(300, 1)))
+        self.assertEqual(manifest['tables']['raw']['rows'], 300)
+        classified = Classified.query.count()
+        priority = [row.priority for row in
+                    SurveyPriority.query.order_by(
+                        SurveyPriority.respondent_id)]
+
+        db.session.execute('truncate raw, users cascade')
+        db.session.commit()
+        load_snapshot(300, 1, views=False)
+        self.assertEqual(Raw.query.count(), 300)
+        self.assertEqual(Classified.query.count(), classified)
+        self.assertEqual(
+            [row.priority for row in SurveyPriority.query.order_by(
+                SurveyPriority.respondent_id)], priority)
+
+        # New rows get ids after the loaded ones
+
+        User.generate_fake(1)
+        self.assertEqual(User.query.count(),
+                         manifest['tables']['users']['rows'] + 1)
+
+    def test_load_saves_missing_snapshot(self):
+        load_snapshot(100, 2, views=False)
+        self.assertTrue(os.path.isdir(snapshot_path(100, 2)))
+        self.assertEqual(Raw.query.count(), 100)
@@ -0,0 +1,88 @@
+import threading
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import Role, User, Raw, SurveyLease, Classified, Codes
+from app.priority import create_priority_triggers
+from app.surveyqueue import claim_surveys, classify_surveys, \
+    release_surveys
+
+
+class TestSurveyQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        self.coders = [
+            User(email='coder%d@example.com' % i, password='cat')
+            for i in range(40)]
+        db.session.add_all(self.coders)
+        db.session.add_all([
+            Raw(respondent_id=i, start_date=datetime(2017, 5, 1))
+            for i in range(1, 101)])
+        db.session.commit()
+        self.coder_ids = [coder.id for coder in self.coders]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_concurrent_coders_get_distinct_surveys(self):
+        barrier = threading.Barrier(len(self.coder_ids))
+        claimed = {}
+
+        def coder(coder_id):
+            with self.app.app_context():
+                barrier.wait()
+                claimed[coder_id] = claim_surveys(coder_id, count=2)
+                db.session.remove()
+
+        threads = [
+            threading.Thread(target=coder, args=(i,))
+            for i in self.coder_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        surveys = [i for ids in claimed.values() for i in ids]
+        self.assertEqual(len(surveys), len(set(surveys)))
+        self.assertEqual(len(surveys), SurveyLease.query.count())
+
+    def test_coder_is_offered_their_own_lease_again(self):
+        first = claim_surveys(self.coder_ids[0])
+        self.assertEqual(claim_surveys(self.coder_ids[0]), first)
+        self.assertNotEqual(claim_surveys(self.coder_ids[1]), first)
+
+    def test_expired_lease_returns_to_pool(self):
+        claim_surveys(self.coder_ids[0], count=100, ttl=-1)
+        self.assertEqual(len(claim_surveys(self.coder_ids[1], count=100)), 100)
+
+    def test_released_lease_returns_to_pool(self):
+        claim_surveys(self.coder_ids[0], count=100)
+        self.assertEqual(claim_surveys(self.coder_ids[1]), [])
+        release_surveys(self.coder_ids[0], [1])
+        db.session.commit()
+        self.assertEqual(claim_surveys(self.coder_ids[1]), [1])
+
+    def test_expired_lease_taken_by_another_coder_is_not_saved(self):
+        code = Codes(code='ok')
+        db.session.add(code)
+        db.session.commit()
+        claim_surveys(self.coder_ids[0], count=100, ttl=-1)
+        self.assertEqual(len(claim_surveys(self.coder_ids[1], count=100)), 100)
+
+        classification = {'respondent_id': 1, 'code_id': code.code_id,
+                          'project_code_id': None, 'pii': False}
+        self.assertEqual(
+            classify_surveys(self.coder_ids[0], [classification]), [])
+        self.assertEqual(
+            classify_surveys(self.coder_ids[1], [classification]), [1])
+        self.assertEqual(Classified.query.count(), 1)
+        self.assertEqual(SurveyLease.query.count(), 99)
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.surveyqueue import new_survey
+from app.models import Role, User, Raw, Classified, Codes, ProjectCodes
+from app.priority import create_priority_triggers
+
+
+class TestNewSurvey(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        create_priority_triggers()
+
+        self.coder = User(email='coder@example.com', password='cat')
+        self.other = User(email='other@example.com', password='dog')
+        code = Codes(code='ok', description='ok')
+        project_code = ProjectCodes(project_code='none', description='none')
+        surveys = [
+            Raw(respondent_id=1, start_date=datetime(2017, 5, 1),
+                comment_why_you_came='first'),
+            Raw(respondent_id=2, start_date=datetime(2017, 4, 1),
+                comment_why_you_came='second')]
+        db.session.add_all(
+            [self.coder, self.other, code, project_code] + surveys)
+        db.session.commit()
+        self.code_id = code.code_id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def classify(self, respondent_id, coder):
+        db.session.add(Classified(
+            respondent_id=respondent_id, coder_id=coder.id,
+            code_id=self.code_id, pii=False, date_coded=datetime.now()))
+        db.session.commit()
+
+    def test_new_survey_returns_most_recent_survey(self):
+        self.assertEqual(new_survey(self.coder.id), 1)
+
+    def test_new_survey_skips_surveys_already_coded_by_user(self):
+        self.classify(1, self.coder)
+        self.assertEqual(new_survey(self.coder.id), 2)
+        self.assertEqual(new_survey(self.other.id), 1)
+
+    def test_new_survey_returns_none_when_all_coded(self):
+        self.classify(1, self.coder)
+        self.classify(2, self.coder)
+        self.assertIsNone(new_survey(self.coder.id))
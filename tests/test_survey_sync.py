@@ -0,0 +1,70 @@
+import unittest
+from app import create_app, db
+from app.apiclient import ApiClient, ApiError
+from app.models import Raw, Checkpoint
+from app.surveysync import sync_surveys
+from tests.stubprovider import StubProviderServer
+
+
+def response(respondent_id, day, why='why'):
+    return {'respondent_id': respondent_id,
+            'end_date': '2017-05-%02dT10:00:00' % day,
+            'Full URL': '/vehicle-tax',
+            'comment_why_you_came': why}
+
+
+class SurveySyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.stub = StubProviderServer(
+            [response(i, 1 + i % 10) for i in range(1, 26)],
+            token='secret', throttle_pages=[2]).start()
+        self.app.config['SURVEY_PROVIDER_URL'] = self.stub.url
+
+    def tearDown(self):
+        self.stub.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def client(self, **kwargs):
+        settings = dict(workers=3, rate=0, retries=2, backoff=0.01,
+                        headers={'Authorization': 'Bearer secret'})
+        settings.update(kwargs)
+        return ApiClient(**settings)
+
+    def test_sync_loads_every_page(self):
+        totals = sync_surveys(self.client(), page_size=4)
+        self.assertEqual(totals['fetched'], 25)
+        self.assertEqual(totals['inserted'], 25)
+        self.assertEqual(Raw.query.count(), 25)
+        self.assertEqual(Raw.query.get(7).full_url, '/vehicle-tax')
+
+        checkpoint = Checkpoint.query.get('survey_sync')
+        self.assertEqual(checkpoint.end_date.day, 10)
+        self.assertEqual(checkpoint.respondent_id, 19)
+
+    def test_sync_only_fetches_new_surveys(self):
+        sync_surveys(self.client(), page_size=4)
+        self.stub.add([response(100, 20), response(101, 21, why='new')])
+        self.stub.requests.clear()
+
+        totals = sync_surveys(self.client(), page_size=4)
+        self.assertEqual(totals['inserted'], 2)
+        self.assertLess(totals['fetched'], 10)
+        self.assertEqual(Raw.query.get(101).comment_why_you_came, 'new')
+
+    def test_failed_sync_resumes(self):
+        self.stub.fail_pages = set([3])
+        self.stub.throttle_pages = set()
+        with self.assertRaises(ApiError):
+            sync_surveys(self.client(retries=0), page_size=4)
+        self.assertEqual(Raw.query.count(), 8)
+
+        totals = sync_surveys(self.client(), page_size=4)
+        self.assertEqual(Raw.query.count(), 25)
+        self.assertEqual(totals['inserted'], 17)
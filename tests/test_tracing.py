@@ -0,0 +1,61 @@
+import json
+import logging
+import unittest
+from collections import OrderedDict
+from app import create_app, db
+from app.models import Role
+from app.tracing import logger, server_timing
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_header_lists_spans(self):
+        spans = OrderedDict([('select', (0.0123, 2)), ('render', (0.004, 0))])
+        self.assertEqual(
+            server_timing(spans, 0.02),
+            'select;dur=12.3;desc="2 queries", '
+            'render;dur=4.0;desc="0 queries", total;dur=20.0')
+
+    def test_responses_carry_server_timing(self):
+        response = self.client.get('/auth/login', base_url='https://localhost')
+        timing = response.headers['Server-Timing']
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_requests_are_logged(self):
+        handler = ListHandler()
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            self.client.get('/auth/login', base_url='https://localhost')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        trace = json.loads(handler.records[-1])
+        self.assertEqual(trace['endpoint'], 'auth.login')
+        self.assertEqual(trace['status'], 200)
+        self.assertIn('render', [i['name'] for i in trace['spans']])